@@ -0,0 +1,271 @@
+"""Benchmark the public entry points of HAPI on synthetic databases.
+
+Every case runs in a fresh, spawned process, so that the reported peak RSS and wall
+time are not polluted by earlier cases (or by warm caches). Run from the root of the
+repository with:
+
+.. code-block:: bash
+
+    python benchmarks/run.py --scales small medium --output bench.csv
+
+The results are compared to the baseline stored in ``benchmarks/baseline.csv``, and
+the script exits with status 1 if a case got slower or uses more memory than its
+baseline by more than the tolerance. Timings depend on the machine, so record a
+baseline on the machine the benchmarks run on with ``--save-baseline`` (e.g. on the
+main branch, before comparing a change).
+"""
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Callable, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+
+# keyword arguments to `hapi.synthetic.generate` at each scale
+SCALES = {
+    "small": dict(n_datasets=1, n_apis=2, n_dates=2, n_examples=1_000),
+    "medium": dict(n_datasets=2, n_apis=3, n_dates=4, n_examples=10_000),
+    "large": dict(n_datasets=3, n_apis=4, n_dates=6, n_examples=50_000),
+}
+
+TASKS = ["sa", "mic"]
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.csv")
+
+# the measurements compared to the baseline, where higher is worse
+COMPARED = ["wall_s", "peak_rss_mb"]
+
+# differences in wall time below this many seconds are noise, whatever the tolerance
+MIN_WALL_DIFF_S = 0.05
+
+
+def bench_get_predictions(data_dir: str) -> int:
+    import hapi
+
+    return sum(len(preds) for preds in hapi.get_predictions().values())
+
+
+def bench_get_prediction_tables(data_dir: str) -> int:
+    import hapi
+
+    return sum(len(table) for table in hapi.get_predictions(format="table").values())
+
+
+def bench_iter_predictions(data_dir: str) -> int:
+    import hapi
+
+    return sum(1 for _ in hapi.iter_predictions())
+
+
+def bench_get_labels(data_dir: str) -> int:
+    import hapi
+
+    return sum(len(labels) for labels in hapi.get_labels().values())
+
+
+def bench_summary(data_dir: str) -> int:
+    import hapi
+
+    return len(hapi.summary())
+
+
+def bench_evaluate(data_dir: str) -> int:
+    import hapi
+
+    return int(hapi.evaluate(task="sa")["count"].sum())
+
+
+def bench_evaluate_structured(data_dir: str) -> int:
+    import hapi
+
+    return int(hapi.evaluate_structured()["count"].sum())
+
+
+def bench_convert(data_dir: str) -> int:
+    from hapi.convert import build
+
+    legacy_dir = os.path.join(data_dir, "legacy")
+    with tempfile.TemporaryDirectory() as dst_dir:
+        build(legacy_dir, dst_dir, workers=os.cpu_count(), incremental=False)
+
+    # every line of an image name file is one converted prediction
+    records = 0
+    for root, _, files in os.walk(legacy_dir):
+        for file in files:
+            if file.endswith("_ImageName.txt"):
+                with open(os.path.join(root, file)) as f:
+                    records += sum(1 for _ in f)
+    return records
+
+
+CASES: Dict[str, Callable[[str], int]] = {
+    "get_predictions": bench_get_predictions,
+    "get_prediction_tables": bench_get_prediction_tables,
+    "iter_predictions": bench_iter_predictions,
+    "get_labels": bench_get_labels,
+    "summary": bench_summary,
+    "evaluate": bench_evaluate,
+    "evaluate_structured": bench_evaluate_structured,
+    "convert": bench_convert,
+}
+
+
+def run_case(case: str, data_dir: str) -> Dict:
+    """Run one case in the current process and measure it."""
+    import hapi
+
+    hapi.config.data_dir = data_dir
+    start = time.perf_counter()
+    records = CASES[case](data_dir)
+    wall = time.perf_counter() - start
+
+    # `ru_maxrss` is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        peak_rss *= 1024
+    return {
+        "wall_s": wall,
+        "peak_rss_mb": peak_rss / 2**20,
+        "records": records,
+        "records_per_s": records / wall if wall > 0 else float("nan"),
+    }
+
+
+def compare(df: pd.DataFrame, baseline: pd.DataFrame, tolerance: float) -> pd.DataFrame:
+    """Compare results to a baseline, returning one row per measurement that exceeds
+    its baseline value by more than `tolerance` (a fraction of the baseline value).
+    Cases without a baseline are not compared.
+    """
+    merged = df.merge(baseline, on=["scale", "case"], suffixes=("", "_baseline"))
+    regressions = []
+    for row in merged.to_dict("records"):
+        for column in COMPARED:
+            value, base = row[column], row[f"{column}_baseline"]
+            limit = base * (1 + tolerance)
+            if column == "wall_s":
+                limit = max(limit, base + MIN_WALL_DIFF_S)
+            if value > limit:
+                regressions.append(
+                    {
+                        "scale": row["scale"],
+                        "case": row["case"],
+                        "measurement": column,
+                        "baseline": base,
+                        "value": value,
+                        "change": value / base - 1,
+                    }
+                )
+    return pd.DataFrame(
+        regressions,
+        columns=["scale", "case", "measurement", "baseline", "value", "change"],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--scales", nargs="+", default=["small", "medium"], choices=list(SCALES)
+    )
+    parser.add_argument("--cases", nargs="+", default=list(CASES), choices=list(CASES))
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Report the fastest of n runs."
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=None,
+        help="Where to generate the synthetic databases. Defaults to a temporary "
+        "directory.",
+    )
+    parser.add_argument("--output", default=None, help="Write the results to a csv.")
+    parser.add_argument(
+        "--baseline",
+        default=BASELINE_PATH,
+        help="The csv of baseline results to compare to. Defaults to "
+        "benchmarks/baseline.csv.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="The fraction by which a measurement may exceed its baseline before it "
+        "counts as a regression. Defaults to 0.25.",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store the results as the new baseline instead of comparing to it.",
+    )
+    args = parser.parse_args()
+
+    from hapi.synthetic import generate
+
+    # keep the progress bars of the cases out of the report
+    os.environ.setdefault("TQDM_DISABLE", "1")
+    os.environ.setdefault("HAPI_NO_PROGRESS", "1")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = tmp_dir if args.data_dir is None else args.data_dir
+        results = []
+        for scale in args.scales:
+            data_dir = os.path.join(root, scale)
+            if not os.path.exists(os.path.join(data_dir, "tasks", "meta.csv")):
+                generate(data_dir, tasks=TASKS, **SCALES[scale])
+                generate(data_dir, tasks=TASKS, legacy=True, **SCALES[scale])
+
+            for case in args.cases:
+                runs = []
+                for _ in range(args.repeat):
+                    with ProcessPoolExecutor(
+                        1, mp_context=get_context("spawn")
+                    ) as pool:
+                        runs.append(pool.submit(run_case, case, data_dir).result())
+                best = min(runs, key=lambda run: run["wall_s"])
+                results.append({"scale": scale, "case": case, **best})
+                print(
+                    f"{scale:>8} {case:>20} {best['wall_s']:9.3f}s "
+                    f"{best['peak_rss_mb']:8.1f}MB {best['records_per_s']:12.0f} rec/s",
+                    file=sys.stderr,
+                )
+
+    df = pd.DataFrame(results)
+    print(df.to_string(index=False))
+    if args.output is not None:
+        df.to_csv(args.output, index=False)
+
+    if args.save_baseline:
+        if os.path.exists(args.baseline):
+            # keep the baselines of the scales and cases that weren't run
+            old = pd.read_csv(args.baseline)
+            keys = set(zip(df["scale"], df["case"]))
+            old = old[[key not in keys for key in zip(old["scale"], old["case"])]]
+            df = pd.concat([old, df], ignore_index=True)
+        df.to_csv(args.baseline, index=False)
+        print(f"Saved the baseline to {args.baseline}.", file=sys.stderr)
+        return
+    if not os.path.exists(args.baseline):
+        print(
+            f"No baseline at {args.baseline}, run with --save-baseline to record one.",
+            file=sys.stderr,
+        )
+        return
+
+    regressions = compare(df, pd.read_csv(args.baseline), args.tolerance)
+    if len(regressions):
+        print(
+            f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%} of the "
+            f"baseline:\n{regressions.to_string(index=False)}",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
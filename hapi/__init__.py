@@ -2,32 +2,163 @@ from dataclasses import dataclass
 from pathlib import Path
 
 from dataclasses import dataclass
+import importlib
 import json
 import os
-from typing import Dict, List, Union
-from urllib.request import urlretrieve
-
-from tqdm.auto import tqdm
-import pandas as pd
+import threading
+import time
+from contextlib import contextmanager
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
+from . import instrument, meta, store
+from .cache import MISSING, cache_clear, cache_info, current_cache
 from .dataset import get_dataset
-
-DATA_URL = "https://storage.googleapis.com/hapi-data/hapi.tar.gz"
-
-__all__ = ["get_dataset", "download", "get_predictions", "get_labels", "summary"]
+from .instrument import CallStats, add_hook, remove_hook, stats, stats_reset
+from .parallel import map_ordered
+from .store import compile_store
+from .stream import iter_json_array
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from .table import PredictionTable
+
+# attributes that are imported from their submodule on first access (PEP 562), so
+# that `import hapi` doesn't pay for pandas, NumPy or urllib up front
+_LAZY_ATTRIBUTES = {
+    "DATA_URL": "fetch",
+    "download": "fetch",
+    "update": "fetch",
+    "evaluate": "metrics",
+    "evaluate_structured": "structured",
+    "build_prediction_tensor": "tensor",
+    "get_prediction_tensor": "tensor",
+    "simulate_cascades": "cascade",
+    "diff": "drift",
+    "diff_consecutive": "drift",
+    "build_index": "index",
+    "query": "index",
+    "build_stats": "meta",
+    "publish": "shared",
+    "attach": "shared",
+    "aggregate": "mapreduce",
+    "serve": "server",
+}
+
+# the formats `get_predictions` can return prediction files in
+FORMATS = ["records", "table"]
+
+__all__ = [
+    "get_dataset",
+    "download",
+    "update",
+    "get_predictions",
+    "iter_predictions",
+    "get_labels",
+    "summary",
+    "build_stats",
+    "compile_store",
+    "evaluate",
+    "evaluate_structured",
+    "build_prediction_tensor",
+    "get_prediction_tensor",
+    "simulate_cascades",
+    "diff",
+    "diff_consecutive",
+    "build_index",
+    "query",
+    "aggregate",
+    "publish",
+    "attach",
+    "serve",
+    "cache_info",
+    "cache_clear",
+    "stats",
+    "stats_reset",
+    "add_hook",
+    "remove_hook",
+    "CallStats",
+]
 
 
 @dataclass
 class HAPIConfig:
-    def __init__(self, data_dir: str, *args, **kwargs):
+    def __init__(
+        self,
+        data_dir: str,
+        workers: int = 1,
+        executor: str = "thread",
+        cache_size: int = 0,
+        profile: bool = False,
+        server_url: str = None,
+        progress: bool = True,
+        *args,
+        **kwargs,
+    ):
+        # settings overridden in the current thread, see `override`
+        self._local = threading.local()
         self._data_dir = data_dir
+
+        # default number of workers and executor ("thread" or "process") used to
+        # load files in `get_predictions` and `get_labels`, see `map_ordered`
+        self.workers = workers
+        self.executor = executor
+        self.cache_size = cache_size
+
+        # whether to capture a cProfile of every call to a public loader, see
+        # `hapi.add_hook`
+        self.profile = profile
+
+        # if set, `get_predictions`, `get_labels` and `summary` query the server
+        # started with `hapi serve` at this URL instead of reading `data_dir`
+        self.server_url = server_url
+
+        # whether to show progress bars while loading files
+        self.progress = progress
         super().__init__(*args, **kwargs)
 
+    @property
+    def cache_size(self) -> int:
+        """The budget in bytes of the in-process cache of loaded prediction and label
+        files, counted as the (estimated) memory taken by their decoded contents
+        rather than their size on disk. If 0, files are not cached. See
+        `hapi.cache_info()`.
+        """
+        return current_cache().max_size
+
+    @cache_size.setter
+    def cache_size(self, cache_size: int):
+        current_cache().max_size = cache_size
+
+    @property
+    def server_url(self) -> Optional[str]:
+        return getattr(self._local, "server_url", self._server_url)
+
+    @server_url.setter
+    def server_url(self, server_url: Optional[str]):
+        self._server_url = server_url
+
+    @property
+    def progress(self) -> bool:
+        return getattr(self._local, "progress", self._progress)
+
+    @progress.setter
+    def progress(self, progress: bool):
+        self._progress = progress
+
     @property
     def data_dir(self):
-        if self._data_dir is None or not os.path.exists(
-            os.path.join(self._data_dir, "tasks")
-        ):
+        data_dir = getattr(self._local, "data_dir", self._data_dir)
+        if data_dir is None or not os.path.exists(os.path.join(data_dir, "tasks")):
             raise ValueError(
                 "Set `data_dir` in the hapi config to point to the directory where "
                 "you've downloaded hapi `hapi.config.data_dir = /path/to/data`. If you "
@@ -35,7 +166,7 @@ class HAPIConfig:
                 "to the directory where you want to download the data to and call "
                 "`hapi.download()`."
             )
-        return self._data_dir
+        return data_dir
 
     @data_dir.setter
     def data_dir(self, data_dir: str):
@@ -43,55 +174,109 @@ class HAPIConfig:
         os.makedirs(self._data_dir, exist_ok=True)
         assert os.path.exists(self._data_dir)
 
+    @contextmanager
+    def override(self, **settings) -> Iterator["HAPIConfig"]:
+        """Override `data_dir`, `server_url` or `progress` in the current thread
+        only, leaving the settings of the other threads as they are.
 
-config = HAPIConfig(
-    data_dir=os.environ.get(
-        "HAPI_DATA_DIR", os.path.join(os.path.join(Path.home(), ".hapi"))
-    )
-)
+        Raises:
+            ValueError: If any other setting is passed.
+        """
+        unknown = settings.keys() - {"data_dir", "server_url", "progress"}
+        if unknown:
+            raise ValueError(
+                f"Can't override {sorted(unknown)}, only `data_dir`, `server_url` "
+                "and `progress` can be overridden."
+            )
+        previous = dict(vars(self._local))
+        vars(self._local).update(settings)
+        try:
+            yield self
+        finally:
+            vars(self._local).clear()
+            vars(self._local).update(previous)
 
 
-def download(data_dir: str = None) -> str:
-    """Download the HAPI database.
+def __getattr__(name: str):
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(f".{_LAZY_ATTRIBUTES[name]}", __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
 
-    The database is stored in a GCP bucket named hapi-data. All model predictions are
-    stored in hapi.tar.gz (Compressed size: 205.3MB, Full size: 1.2GB). This function
-    downloads the archive and extracts it.
 
-    Args:
-        data_dir (str, optional): Directory to download. Defaults to None, in which case
-        `config.data_dir` is used. If `config.data_dir` is not set, then the default
-        directory is used: `~/.hapi`.
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
 
-    Returns:
-        str: The path to the downloaded data.
-    """
-    if data_dir is None:
-        data_dir = config._data_dir
 
-    os.makedirs(data_dir, exist_ok=True)
+config = HAPIConfig(
+    data_dir=os.environ.get(
+        "HAPI_DATA_DIR", os.path.join(os.path.join(Path.home(), ".hapi"))
+    ),
+    workers=int(os.environ.get("HAPI_WORKERS", 1)),
+    cache_size=int(os.environ.get("HAPI_CACHE_SIZE", 0)),
+    profile=bool(os.environ.get("HAPI_PROFILE")),
+    server_url=os.environ.get("HAPI_SERVER_URL"),
+    progress=not os.environ.get("HAPI_NO_PROGRESS"),
+)
 
-    urlretrieve(
-        DATA_URL,
-        os.path.join(data_dir, "hapi.tar.gz"),
-    )
 
-    # extract the tarball
-    import tarfile
+def _load_json(path: str) -> Tuple[object, Dict[str, float], int]:
+    """Load a JSON file, returning its contents, the seconds spent opening (and
+    reading) and parsing it, and the number of bytes read.
+    """
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        data = f.read()
+    read = time.perf_counter()
+    result = json.loads(data)
+    return (
+        result,
+        {"open": read - start, "parse": time.perf_counter() - read},
+        len(data),
+    )
 
-    with tarfile.open(os.path.join(data_dir, "hapi.tar.gz")) as tar:
-        tar.extractall(data_dir)
 
-    return data_dir
+def _load_files(
+    paths: List[str], workers: int = None, loader: Callable = _load_json
+) -> List:
+    """Load JSON files, in parallel and through the in-process cache. `loader` must
+    return the same tuple as `_load_json`, and its results are cached separately
+    from those of other loaders.
+    """
+    keys = [path if loader is _load_json else (path, loader.__name__) for path in paths]
+    cache = current_cache()
+    results = [cache.get(key, source=path) for key, path in zip(keys, paths)]
+    misses = [i for i, result in enumerate(results) if result is MISSING]
+    loaded = map_ordered(loader, [paths[i] for i in misses], workers=workers)
+    for i, (result, phases, n_bytes) in zip(misses, loaded):
+        cache.put(keys[i], result, source=paths[i])
+        results[i] = result
+        instrument.add(phases, bytes_read=n_bytes)
+    instrument.add(cache_hits=len(paths) - len(misses), cache_misses=len(misses))
+    return results
+
+
+def _select(**filters: Union[str, List[str]]) -> List[Dict]:
+    """Get the rows of ``meta.csv`` that match all of the filters that are not None
+    (i.e. we apply AND logic), using the cached metadata index.
+    """
+    with instrument.phase("meta"):
+        return meta.get_index(config.data_dir).select(**filters)
 
 
+@instrument.instrumented
 def get_predictions(
     task: Union[str, List[str]] = None,
     dataset: Union[str, List[str]] = None,
     api: Union[str, List[str]] = None,
     date: Union[str, List[str]] = None,
     include_dataset: bool = None,
-) -> Dict[str, List[Dict]]:
+    workers: int = None,
+    example_id: Union[str, List[str]] = None,
+    format: str = "records",
+) -> Dict[str, Union[List[Dict], "PredictionTable"]]:
     """Load API predictions into memory.
 
     Use the `task`, `dataset`, `api`, and `date` parameters to filter to a subset of
@@ -99,6 +284,28 @@ def get_predictions(
     be filtered to include only those rows that match all of the specified filters
     (i.e. we apply AND logic).
 
+    If the database has been compiled with :func:`hapi.compile_store`, the
+    predictions are read from the columnar store instead of the JSON files, decoding
+    only the api/dates that match the filters.
+
+    If `config.cache_size` is set, loaded files are kept in an in-process LRU cache
+    and later calls only read files that aren't cached or have changed. Cached
+    predictions are shared between calls, so don't modify them in place.
+
+    If `example_id` is passed and an index has been built with
+    :func:`hapi.build_index`, only the predictions on those examples are read from
+    the index, without loading any prediction file. Lookups of more than 10,000
+    examples filter the prediction files instead, which is faster at that size.
+
+    If `config.server_url` is set, the predictions are fetched from the server
+    started with ``hapi serve`` at that URL instead of being read from
+    `config.data_dir`.
+
+    With ``format="table"``, every prediction file is returned as a compact
+    :class:`~hapi.table.PredictionTable` of NumPy columns instead of a list of
+    dictionaries, which takes a fraction of the memory. The dictionaries of a file
+    are dropped as soon as it is converted, so the full database fits in one process.
+
     Args:
         task (Union[str, List[str]]): The task(s) to include. If None, all tasks are
             loaded.  Default is None. Use ``hapi.summary()["task"].unique()`` to see
@@ -111,14 +318,27 @@ def get_predictions(
             options.
         date (Union[str, List[str]]): The date(s) to include in format "y-m-d". For
             example, "20-03-29". If None, all dates are loaded. Default is None.
-        include_dataset (bool, optional): If True, the raw dataset is downloaded and 
+        include_dataset (bool, optional): If True, the raw dataset is downloaded and
             loaded using `hapi.get_dataset()`. The dataset is then merged with the
             predictions on the "example_id" column. Default is False.
+        workers (int, optional): The number of workers used to load the prediction
+            files in parallel. Defaults to None, in which case `config.workers` is
+            used. The kind of worker pool is set by `config.executor`.
+        example_id (Union[str, List[str]]): The example(s) to include. If None, all
+            examples are loaded. Default is None.
+        format (str, optional): Either "records" to return every prediction file as a
+            list of dictionaries, or "table" to return it as a
+            :class:`~hapi.table.PredictionTable`. Default is "records".
+
+    Raises:
+        ValueError: If `format` is not "records" or "table", or `include_dataset`
+            is used with ``format="table"`` or with `config.server_url`.
 
     Returns:
-        Dict[str, List[Dict]]: A dictionary mapping keys in the format
-        "{task}/{dataset}/{api)/{date}" (e.g. "scr/command/google_scr/20-03-29") to a
-        list of dictionaries, each representing one prediction. These dictionaries
+        Dict[str, Union[List[Dict], PredictionTable]]: A dictionary mapping keys in
+        the format "{task}/{dataset}/{api)/{date}" (e.g.
+        "scr/command/google_scr/20-03-29") to a list of dictionaries (or a table),
+        each representing one prediction. These dictionaries
         include keys "confidence", "predicted_label", and "example_id". For example,
 
         .. code-block:: python
@@ -134,30 +354,34 @@ def get_predictions(
                 ...
             }
     """
-    df = summary()
-    if task is not None:
-        if isinstance(task, str):
-            df = df[df["task"] == task]
-        else:
-            df = df[df["task"].isin(task)]
+    if format not in FORMATS:
+        raise ValueError(
+            f"Unknown format '{format}'. Please pass one of the following: {FORMATS}"
+        )
+    if format == "table" and include_dataset:
+        raise ValueError('`include_dataset` is not supported with `format="table"`.')
 
-    if dataset is not None:
-        if isinstance(dataset, str):
-            df = df[df["dataset"] == dataset]
-        else:
-            df = df[df["dataset"].isin(dataset)]
+    if config.server_url is not None:
+        if include_dataset:
+            raise ValueError(
+                "`include_dataset` is not supported with `config.server_url`."
+            )
+        from . import client
 
-    if api is not None:
-        if isinstance(api, str):
-            df = df[df["api"] == api]
-        else:
-            df = df[df["api"].isin(api)]
+        path_to_preds = client.get_predictions(
+            config.server_url, task, dataset, api, date, example_id, format
+        )
+        instrument.add(records=sum(len(preds) for preds in path_to_preds.values()))
+        return path_to_preds
 
-    if date is not None:
-        if isinstance(date, str):
-            df = df[df["date"] == date]
-        else:
-            df = df[df["date"].isin(date)]
+    rows = _select(task=task, dataset=dataset, api=api, date=date)
+
+    if format == "table":
+        from .table import read_tables
+
+        path_to_tables = read_tables(config.data_dir, rows, example_id, workers)
+        instrument.add(records=sum(len(table) for table in path_to_tables.values()))
+        return path_to_tables
 
     if include_dataset:
         dataset_to_data = {
@@ -165,26 +389,132 @@ def get_predictions(
             for dataset in ([dataset] if isinstance(dataset, str) else dataset)
         }
 
-    path_to_preds = {}
-    for _, row in tqdm(df.iterrows(), total=len(df)):
-        path = row["path"]
-        preds = json.load(open(os.path.join(config.data_dir, "tasks", path)))
-
-        if include_dataset:
-            import meerkat as mk
+    from . import index
 
-            preds = mk.DataPanel(preds).merge(
-                dataset_to_data[row["dataset"]], on="example_id"
+    if example_id is not None and index.should_read(
+        config.data_dir, rows, example_id
+    ):
+        with instrument.phase("parse"):
+            path_to_preds = index.read_predictions(config.data_dir, rows, example_id)
+    else:
+        if store.has_store(config.data_dir):
+            path_to_preds = store.read_predictions(config.data_dir, rows)
+        else:
+            paths = [row["path"] for row in rows]
+            preds = _load_files(
+                [os.path.join(config.data_dir, "tasks", path) for path in paths],
+                workers=workers,
+            )
+            path_to_preds = {
+                os.path.splitext(path)[0]: pred for path, pred in zip(paths, preds)
+            }
+        if example_id is not None:
+            example_ids = (
+                {example_id} if isinstance(example_id, str) else set(example_id)
             )
+            path_to_preds = {
+                key: [pred for pred in preds if pred["example_id"] in example_ids]
+                for key, preds in path_to_preds.items()
+            }
+    instrument.add(records=sum(len(preds) for preds in path_to_preds.values()))
 
-        path_to_preds[os.path.splitext(path)[0]] = preds
+    if include_dataset:
+        import meerkat as mk
+
+        with instrument.phase("merge"):
+            for row in rows:
+                key = os.path.splitext(row["path"])[0]
+                path_to_preds[key] = mk.DataPanel(path_to_preds[key]).merge(
+                    dataset_to_data[row["dataset"]], on="example_id"
+                )
 
     return path_to_preds
 
 
+@instrument.instrumented
+def iter_predictions(
+    task: Union[str, List[str]] = None,
+    dataset: Union[str, List[str]] = None,
+    api: Union[str, List[str]] = None,
+    date: Union[str, List[str]] = None,
+    batch_size: int = None,
+) -> Iterator[Tuple[str, Union[Dict, List[Dict]]]]:
+    """Lazily iterate over API predictions without loading them all into memory.
+
+    Takes the same filters as :func:`hapi.get_predictions`. Prediction files are
+    read one at a time and parsed incrementally, so only one batch of predictions
+    (or, if the database has been compiled with :func:`hapi.compile_store`, one
+    prediction file) is held in memory at once, no matter how large the selection.
+
+    .. code-block:: python
+
+        for key, batch in hapi.iter_predictions(task="mic", batch_size=1024):
+            ...
+
+    Args:
+        task (Union[str, List[str]]): The task(s) to include. If None, all tasks are
+            included. Default is None.
+        dataset (Union[str, List[str]]): The dataset(s) to include. If None, all
+            datasets are included. Default is None.
+        api (Union[str, List[str]]): The API(s) to include. If None, all APIs are
+            included. Default is None.
+        date (Union[str, List[str]]): The date(s) to include in format "y-m-d". If
+            None, all dates are included. Default is None.
+        batch_size (int, optional): If None, predictions are yielded one at a time.
+            Otherwise, they are yielded in lists of at most `batch_size` predictions,
+            none of which spans more than one prediction file. Default is None.
+
+    Yields:
+        Tuple[str, Union[Dict, List[Dict]]]: Pairs of a key in the format
+        "{task}/{dataset}/{api)/{date}" (e.g. "scr/command/google_scr/20-03-29") and
+        either one prediction dictionary or, if `batch_size` is set, a list of them.
+    """
+    rows = _select(task=task, dataset=dataset, api=api, date=date)
+
+    if store.has_store(config.data_dir):
+        files = store.iter_predictions(config.data_dir, rows)
+    else:
+        files = (
+            (
+                os.path.splitext(row["path"])[0],
+                _iter_json_file(os.path.join(config.data_dir, "tasks", row["path"])),
+            )
+            for row in rows
+        )
+
+    for key, records in files:
+        count = 0
+        if batch_size is None:
+            for record in records:
+                count += 1
+                yield key, record
+            instrument.add(records=count)
+            continue
+
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) == batch_size:
+                count += len(batch)
+                yield key, batch
+                batch = []
+        if batch:
+            count += len(batch)
+            yield key, batch
+        instrument.add(records=count)
+
+
+def _iter_json_file(path: str) -> Iterator[Dict]:
+    with open(path) as f:
+        yield from iter_json_array(f)
+        instrument.add(bytes_read=os.fstat(f.fileno()).st_size)
+
+
+@instrument.instrumented
 def get_labels(
     task: Union[str, List[str]] = None,
     dataset: Union[str, List[str]] = None,
+    workers: int = None,
 ) -> Dict[str, List[Dict]]:
     """Load labels into memory.
 
@@ -193,6 +523,9 @@ def get_labels(
     to include only those rows that match all of the specified filters (i.e. we apply
     AND logic).
 
+    If `config.server_url` is set, the labels are fetched from the server started
+    with ``hapi serve`` at that URL instead of being read from `config.data_dir`.
+
     Args:
         task (Union[str, List[str]]): The task(s) to include. If None, all tasks are
             loaded.  Default is None. Use ``hapi.summary()["task"].unique()`` to see
@@ -200,6 +533,8 @@ def get_labels(
         dataset (Union[str, List[str]]): The dataset(s) to include. If None, all
             datasets are loaded. Default is None. Use
             ``hapi.summary()["dataset"].unique()`` to see options.
+        workers (int, optional): The number of workers used to load the label files
+            in parallel. Defaults to None, in which case `config.workers` is used.
 
     Returns:
         Dict[str, List[Dict]]: A dictionary mapping keys in the format
@@ -219,38 +554,76 @@ def get_labels(
                 ...
             }
     """
-    df = summary()
-    df = df[["task", "dataset"]].drop_duplicates()
-    if task is not None:
-        if isinstance(task, str):
-            df = df[df["task"] == task]
-        else:
-            df = df[df["task"].isin(task)]
-
-    if dataset is not None:
-        if isinstance(dataset, str):
-            df = df[df["dataset"] == dataset]
-        else:
-            df = df[df["dataset"].isin(dataset)]
+    if config.server_url is not None:
+        from . import client
+
+        path_to_labels = client.get_labels(config.server_url, task, dataset)
+        instrument.add(records=sum(len(labels) for labels in path_to_labels.values()))
+        return path_to_labels
+
+    # one row per task/dataset, in order of first appearance
+    rows = list(
+        {
+            (row["task"], row["dataset"]): row
+            for row in _select(task=task, dataset=dataset)
+        }.values()
+    )
 
-    path_to_labels = {}
-    for _, row in tqdm(df.iterrows(), total=len(df)):
-        path = os.path.join(row["task"], row["dataset"])
-        labels = json.load(
-            open(os.path.join(config.data_dir, "tasks", path, "labels.json"))
+    if store.has_store(config.data_dir):
+        path_to_labels = store.read_labels(config.data_dir, rows)
+    else:
+        paths = [os.path.join(row["task"], row["dataset"]) for row in rows]
+        labels = _load_files(
+            [
+                os.path.join(config.data_dir, "tasks", path, "labels.json")
+                for path in paths
+            ],
+            workers=workers,
         )
-        path_to_labels[path] = labels
+        path_to_labels = dict(zip(paths, labels))
+    instrument.add(records=sum(len(labels) for labels in path_to_labels.values()))
     return path_to_labels
 
 
-def summary() -> pd.DataFrame:
+@instrument.instrumented
+def summary(extended: bool = False) -> "pd.DataFrame":
     """Summarize the HAPI database.
 
+    The contents of ``meta.csv`` are cached in memory and only re-read when the file
+    changes, so calling this function repeatedly is cheap. If `config.server_url` is
+    set, the summary is fetched from the server started with ``hapi serve`` at that
+    URL instead.
+
+    Args:
+        extended (bool, optional): If True, add the per-file statistics precomputed
+            by :func:`hapi.build_stats`, which are read from a sidecar next to
+            ``meta.csv`` without loading any predictions. Default is False.
+
+    Raises:
+        ValueError: If `extended` is True and the statistics have not been built.
+
     Returns:
         pd.DataFrame: A dataframe where each row corresponds to one instance of API
             predictions (i.e. predictions from a single api on a single dataset on a
             single date). The dataframe contains the following columns: "task",
-            "dataset", "api", "date", "path", and "cost_per_10k".
+            "dataset", "api", "date", "path", and "cost_per_10k". The "task",
+            "dataset", "api" and "date" columns are categorical. If `extended` is
+            True, it also contains the columns "size" (of the prediction file in
+            bytes), "count", "accuracy" (NaN for multi-label tasks),
+            "mean_confidence", "confidence_q05", "confidence_q25", "confidence_q50",
+            "confidence_q75", "confidence_q95" and "label_histogram" (a dictionary
+            mapping each predicted label to its count).
     """
-    df = pd.read_csv(os.path.join(config.data_dir, "tasks", "meta.csv"))
+    if config.server_url is not None:
+        from . import client
+
+        df = client.summary(config.server_url, extended)
+        instrument.add(records=len(df))
+        return df
+
+    with instrument.phase("meta"):
+        df = meta.get_index(config.data_dir).df.copy()
+        if extended:
+            df = df.join(meta.get_stats(config.data_dir), on="path")
+    instrument.add(records=len(df))
     return df
@@ -0,0 +1,58 @@
+"""The command line of HAPI.
+
+.. code-block:: bash
+
+    hapi serve --data-dir /path/to/data --port 8642 --preload
+"""
+
+import argparse
+from typing import List
+
+from .server import DEFAULT_HOST, DEFAULT_PORT
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(prog="hapi", description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser(
+        "serve", help="Serve the database over HTTP to clients on this host."
+    )
+    serve_parser.add_argument(
+        "--data-dir",
+        default=None,
+        help="Directory holding the downloaded database. Defaults to $HAPI_DATA_DIR.",
+    )
+    serve_parser.add_argument("--host", default=DEFAULT_HOST)
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=None,
+        help="Budget in bytes of the cache of decoded files.",
+    )
+    serve_parser.add_argument(
+        "--preload",
+        action="store_true",
+        help="Load every prediction and label file into the cache on startup.",
+    )
+    serve_parser.add_argument(
+        "--quiet", action="store_true", help="Don't log requests."
+    )
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        from .server import serve
+
+        serve(
+            data_dir=args.data_dir,
+            host=args.host,
+            port=args.port,
+            cache_size=args.cache_size,
+            preload=args.preload,
+            quiet=args.quiet,
+        )
+
+
+if __name__ == "__main__":
+    main()
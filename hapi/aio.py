@@ -0,0 +1,299 @@
+"""Coroutine versions of the loaders, for use inside asyncio services.
+
+.. code-block:: python
+
+    from hapi import aio
+
+    path_to_preds = await aio.get_predictions(task="sa", dataset="imdb")
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import weakref
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, List, Union
+
+from . import instrument
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from .table import PredictionTable
+
+# the number of threads of the default executor, shared by all coroutines
+DEFAULT_WORKERS = 8
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# the loads in flight on each event loop, keyed by (path, loader)
+_inflight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+@instrument.instrumented
+async def get_predictions(
+    task: Union[str, List[str]] = None,
+    dataset: Union[str, List[str]] = None,
+    api: Union[str, List[str]] = None,
+    date: Union[str, List[str]] = None,
+    format: str = "records",
+    executor: Executor = None,
+    concurrency: int = None,
+) -> Dict[str, Union[List[Dict], "PredictionTable"]]:
+    """Load API predictions into memory without blocking the event loop.
+
+    Takes the same filters and returns the same results as
+    :func:`hapi.get_predictions`. Files are read and parsed on `executor`, at most
+    `concurrency` at a time per call, so that concurrent calls share the executor
+    instead of queueing behind each other. Concurrent calls that need the same file
+    share a single load of it, and loaded files go through the in-process cache
+    (see `config.cache_size`). If `config.server_url` is set, the predictions are
+    fetched from the server on `executor` instead, as in
+    :func:`hapi.get_predictions`. Calls are measured like those of the other
+    loaders, under the name "aio.get_predictions" (see :func:`hapi.stats`).
+
+    Cancelling the coroutine cancels the loads that haven't started yet, unless
+    another call is waiting for them.
+
+    Args:
+        task (Union[str, List[str]]): The task(s) to include. If None, all tasks are
+            loaded. Default is None.
+        dataset (Union[str, List[str]]): The dataset(s) to include. If None, all
+            datasets are loaded. Default is None.
+        api (Union[str, List[str]]): The API(s) to include. If None, all APIs are
+            loaded. Default is None.
+        date (Union[str, List[str]]): The date(s) to include in format "y-m-d". If
+            None, all dates are loaded. Default is None.
+        format (str, optional): Either "records" or "table", as in
+            :func:`hapi.get_predictions`. Default is "records".
+        executor (Executor, optional): The executor files are loaded on. Defaults to
+            None, in which case a thread pool of `DEFAULT_WORKERS` threads shared
+            by all coroutines is used.
+        concurrency (int, optional): The maximum number of files loaded at once by
+            this call. Defaults to None, in which case it is the number of threads
+            of the default executor.
+
+    Raises:
+        ValueError: If `format` is not "records" or "table".
+
+    Returns:
+        Dict[str, Union[List[Dict], PredictionTable]]: The predictions, as in
+            :func:`hapi.get_predictions`.
+    """
+    from . import FORMATS, _load_json, _select, config, store
+
+    if format not in FORMATS:
+        raise ValueError(
+            f"Unknown format '{format}'. Please pass one of the following: {FORMATS}"
+        )
+    executor = _get_executor(executor)
+
+    if config.server_url is not None:
+        from . import client
+
+        path_to_preds = await _run(
+            executor,
+            client.get_predictions,
+            config.server_url,
+            task,
+            dataset,
+            api,
+            date,
+            None,
+            format,
+        )
+        instrument.add(records=sum(len(preds) for preds in path_to_preds.values()))
+        return path_to_preds
+
+    rows = await _run(
+        executor,
+        functools.partial(_select, task=task, dataset=dataset, api=api, date=date),
+    )
+    keys = [os.path.splitext(row["path"])[0] for row in rows]
+
+    if await _run(executor, store.has_store, config.data_dir):
+        path_to_preds = await _run(
+            executor, store.read_predictions, config.data_dir, rows
+        )
+        if format == "table":
+            tables = await _run(executor, _to_tables, [path_to_preds[k] for k in keys])
+            path_to_preds = dict(zip(keys, tables))
+    else:
+        from .table import load_table, share_vocabularies
+
+        paths = [os.path.join(config.data_dir, "tasks", row["path"]) for row in rows]
+        if format == "records":
+            path_to_preds = dict(
+                zip(keys, await _load_all(paths, _load_json, executor, concurrency))
+            )
+        else:
+            tables = await _load_all(paths, load_table, executor, concurrency)
+            path_to_preds = dict(
+                zip(keys, await _run(executor, share_vocabularies, tables))
+            )
+    instrument.add(records=sum(len(preds) for preds in path_to_preds.values()))
+    return path_to_preds
+
+
+@instrument.instrumented
+async def get_labels(
+    task: Union[str, List[str]] = None,
+    dataset: Union[str, List[str]] = None,
+    executor: Executor = None,
+    concurrency: int = None,
+) -> Dict[str, List[Dict]]:
+    """Load labels into memory without blocking the event loop.
+
+    Takes the same filters and returns the same results as :func:`hapi.get_labels`.
+    Files are loaded (or fetched from `config.server_url`) and measured like in
+    :func:`get_predictions`.
+
+    Args:
+        task (Union[str, List[str]]): The task(s) to include. If None, all tasks are
+            loaded. Default is None.
+        dataset (Union[str, List[str]]): The dataset(s) to include. If None, all
+            datasets are loaded. Default is None.
+        executor (Executor, optional): The executor files are loaded on. Defaults to
+            None, in which case the default thread pool is used.
+        concurrency (int, optional): The maximum number of files loaded at once by
+            this call. Defaults to None, in which case it is the number of threads
+            of the default executor.
+
+    Returns:
+        Dict[str, List[Dict]]: The labels, as in :func:`hapi.get_labels`.
+    """
+    from . import _load_json, _select, config, store
+
+    executor = _get_executor(executor)
+
+    if config.server_url is not None:
+        from . import client
+
+        path_to_labels = await _run(
+            executor, client.get_labels, config.server_url, task, dataset
+        )
+        instrument.add(records=sum(len(labels) for labels in path_to_labels.values()))
+        return path_to_labels
+
+    rows = await _run(executor, functools.partial(_select, task=task, dataset=dataset))
+    # one row per task/dataset, in order of first appearance
+    rows = list({(row["task"], row["dataset"]): row for row in rows}.values())
+
+    if await _run(executor, store.has_store, config.data_dir):
+        path_to_labels = await _run(executor, store.read_labels, config.data_dir, rows)
+    else:
+        keys = [os.path.join(row["task"], row["dataset"]) for row in rows]
+        paths = [
+            os.path.join(config.data_dir, "tasks", key, "labels.json") for key in keys
+        ]
+        path_to_labels = dict(
+            zip(keys, await _load_all(paths, _load_json, executor, concurrency))
+        )
+    instrument.add(records=sum(len(labels) for labels in path_to_labels.values()))
+    return path_to_labels
+
+
+@instrument.instrumented
+async def summary(extended: bool = False, executor: Executor = None) -> "pd.DataFrame":
+    """Summarize the HAPI database (or fetch the summary from `config.server_url`)
+    without blocking the event loop. See :func:`hapi.summary`.
+    """
+    from . import summary as load_summary
+
+    # the undecorated loader, whose measurements go to this call
+    return await _run(_get_executor(executor), load_summary.__wrapped__, extended)
+
+
+def _get_executor(executor: Executor = None) -> Executor:
+    global _executor
+
+    if executor is not None:
+        return executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=DEFAULT_WORKERS, thread_name_prefix="hapi-aio"
+            )
+    return _executor
+
+
+async def _run(executor: Executor, fn: Callable, *args):
+    # run in a copy of the context, so that the work is measured as part of the
+    # current call
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, functools.partial(context.run, fn, *args)
+    )
+
+
+def _to_tables(files: List[List[Dict]]) -> List["PredictionTable"]:
+    from .table import PredictionTable, share_vocabularies
+
+    return share_vocabularies([PredictionTable.from_records(preds) for preds in files])
+
+
+async def _load_all(
+    paths: List[str], loader: Callable, executor: Executor, concurrency: int = None
+) -> List:
+    semaphore = asyncio.Semaphore(concurrency or DEFAULT_WORKERS)
+
+    async def load(path: str):
+        async with semaphore:
+            return await _load(path, loader, executor)
+
+    return await asyncio.gather(*(load(path) for path in paths))
+
+
+async def _load(path: str, loader: Callable, executor: Executor):
+    """Load a file through the in-process cache, sharing the load with any other
+    coroutine that needs the same file at the same time.
+    """
+    from . import _load_json
+    from .cache import MISSING, current_cache
+
+    cache = current_cache()
+    key = path if loader is _load_json else (path, loader.__name__)
+    result = cache.get(key, source=path)
+    if result is not MISSING:
+        instrument.add(cache_hits=1)
+        return result
+
+    loop = asyncio.get_running_loop()
+    inflight = _inflight.setdefault(loop, {})
+    entry = inflight.get((path, loader))
+    loads = entry is None
+    if loads:
+        future = loop.run_in_executor(executor, loader, path)
+        # [future, number of waiters]
+        entry = inflight[(path, loader)] = [future, 0]
+
+        def done(future: asyncio.Future, entry: list = entry):
+            if inflight.get((path, loader)) is entry:
+                del inflight[(path, loader)]
+            if not future.cancelled() and future.exception() is None:
+                cache.put(key, future.result()[0], source=path)
+
+        future.add_done_callback(done)
+
+    entry[1] += 1
+    try:
+        result, phases, n_bytes = await asyncio.shield(entry[0])
+        # the file is read once, by the call that started the load
+        if loads:
+            instrument.add(phases, bytes_read=n_bytes, cache_misses=1)
+        else:
+            instrument.add(cache_hits=1)
+        return result
+    except asyncio.CancelledError:
+        # the last waiter gives up on the load, which is dropped if it hasn't
+        # started yet
+        if entry[1] == 1:
+            entry[0].cancel()
+        raise
+    finally:
+        entry[1] -= 1
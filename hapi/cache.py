@@ -0,0 +1,201 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Hashable, Iterator, Sequence, Union
+
+MISSING = object()
+
+# the number of items of a list that are measured to estimate the size of the list
+SAMPLE_SIZE = 32
+
+
+@dataclass
+class CacheInfo:
+    """A snapshot of the state of a :class:`FileCache`.
+
+    Attributes:
+        hits (int): The number of lookups that were answered from the cache.
+        misses (int): The number of lookups that were not.
+        evictions (int): The number of entries evicted to stay within budget.
+        entries (int): The number of entries in the cache.
+        size (int): The total estimated size of the entries in the cache, in bytes.
+        max_size (int): The budget of the cache, in bytes.
+    """
+
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    size: int
+    max_size: int
+
+
+class FileCache:
+    """A thread-safe, byte-budgeted LRU cache for the parsed contents of files.
+
+    Entries are keyed on a file path (or any other key, along with the path(s) of the
+    file(s) they were computed from) and are invalidated when the modification time
+    or the size of one of those files changes. The least recently used entries are
+    evicted once the total size of the entries exceeds `max_size`. By default, the
+    size of an entry is the memory taken by its value as estimated by
+    :func:`sizeof`, which for parsed JSON is usually several times the size of the
+    file on disk.
+
+    Args:
+        max_size (int, optional): The budget of the cache in bytes. If 0, the cache
+            is disabled. Defaults to 0.
+    """
+
+    def __init__(self, max_size: int = 0):
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self._size = 0
+        self._max_size = max_size
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, max_size: int):
+        with self._lock:
+            self._max_size = max_size
+            self._evict()
+
+    def get(self, key: Hashable, source: Union[str, Sequence[str]] = None) -> Any:
+        """Get the cached value for `key`, or `MISSING` if there is no up-to-date
+        entry. `source` is the file (or files) the value was read from and defaults
+        to `key`.
+        """
+        if not self._max_size:
+            return MISSING
+        signature = _signature(key if source is None else source)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != signature:
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(
+        self,
+        key: Hashable,
+        value: Any,
+        source: Union[str, Sequence[str]] = None,
+        size: int = None,
+    ):
+        """Cache `value`, which was read from the file (or files) `source` (defaults
+        to `key`). `size` is the size of the entry in bytes and defaults to the
+        estimate of :func:`sizeof`.
+        """
+        if not self._max_size:
+            return
+        signature = _signature(key if source is None else source)
+        if size is None:
+            size = sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[2]
+            if size > self._max_size:
+                return
+            self._entries[key] = (signature, value, size)
+            self._size += size
+            self._evict()
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                entries=len(self._entries),
+                size=self._size,
+                max_size=self._max_size,
+            )
+
+    def clear(self):
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def _evict(self):
+        while self._size > self._max_size:
+            self._size -= self._entries.popitem(last=False)[1][2]
+            self.evictions += 1
+
+
+def sizeof(value: Any) -> int:
+    """Estimate the memory taken by a value in bytes, including the lists, tuples
+    and dictionaries it holds. Lists longer than `SAMPLE_SIZE` are estimated from a
+    sample of their items, so sizing a file of many records stays cheap. Values with
+    an `nbytes` attribute (e.g. NumPy arrays and prediction tables) count that many
+    bytes.
+    """
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        # the JSON decoder shares the keys between the records of a file
+        return size + sum(sizeof(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        if len(value) <= SAMPLE_SIZE:
+            return size + sum(sizeof(item) for item in value)
+        step = len(value) / SAMPLE_SIZE
+        sample = sum(sizeof(value[int(i * step)]) for i in range(SAMPLE_SIZE))
+        return size + sample * len(value) // SAMPLE_SIZE
+    return size
+
+
+def _signature(path: Union[str, Sequence[str]]):
+    if not isinstance(path, str):
+        return tuple(_signature(p) for p in path)
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+cache = FileCache()
+
+# the cache that replaces `cache` in the current thread, see `use_cache`
+_local = threading.local()
+
+
+def current_cache() -> FileCache:
+    """Get the cache that files are loaded through in the current thread: the one
+    passed to :func:`use_cache`, or the process-wide `cache`.
+    """
+    return getattr(_local, "cache", cache)
+
+
+@contextmanager
+def use_cache(file_cache: FileCache) -> Iterator[FileCache]:
+    """Load files through `file_cache` instead of the process-wide cache in the
+    current thread, e.g. in a server that keeps a budget of its own.
+    """
+    previous = current_cache()
+    _local.cache = file_cache
+    try:
+        yield file_cache
+    finally:
+        _local.cache = previous
+
+
+def cache_info() -> CacheInfo:
+    """Get the hit, miss and eviction counters and the size of the in-process cache
+    of prediction and label files. See `config.cache_size`.
+    """
+    return current_cache().info()
+
+
+def cache_clear():
+    """Empty the in-process cache of prediction and label files and reset its
+    counters.
+    """
+    current_cache().clear()
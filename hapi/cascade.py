@@ -0,0 +1,234 @@
+from typing import List, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from .metrics import CLASSIFICATION_TASKS
+
+MAX_LENGTH = 3
+
+
+def simulate_cascades(
+    task: str,
+    dataset: str,
+    date: str,
+    api: Union[str, List[str]] = None,
+    max_length: int = 3,
+    thresholds: Sequence[float] = None,
+    pareto: bool = True,
+) -> pd.DataFrame:
+    """Simulate every cascade of up to three APIs on one dataset and date, and
+    trade off their accuracy against their cost.
+
+    In a cascade, every example is first sent to the first API. If the confidence of
+    its prediction is at least the threshold of that API, the prediction is
+    accepted. Otherwise, the example is sent to the next API, and so on. The last
+    API of a cascade is always accepted. The cost of a cascade is the cost of all
+    the APIs an example is sent to, using the "cost_per_10k" column of
+    :func:`hapi.summary`. Predictions without a confidence never pass a threshold.
+
+    The predictions of all APIs are aligned into arrays once, and the confidences
+    are binned on the threshold grid. All thresholds of a cascade are then scored
+    at once from cumulative (2D) histograms of the bins, so the cost grows with the
+    number of API orderings, not with the number of threshold combinations.
+
+    Only single-label classification tasks ("scr", "sa" and "fer") are supported.
+    Only the examples that have a label and a prediction from every selected API are
+    used.
+
+    Args:
+        task (str): The task of the dataset.
+        dataset (str): The dataset to simulate cascades on.
+        date (str): The date of the predictions in format "y-m-d".
+        api (Union[str, List[str]], optional): The API(s) to build cascades from. If
+            None, all APIs with predictions on `date` are used. Default is None.
+        max_length (int, optional): The maximum number of APIs in a cascade, at most
+            3. Default is 3.
+        thresholds (Sequence[float], optional): The grid of confidence thresholds to
+            try for every API but the last. Defaults to None, in which case 21
+            evenly spaced thresholds between 0 and 1 are used.
+        pareto (bool, optional): If True, only return the cascades on the Pareto
+            frontier, i.e. those for which no other cascade is both cheaper (or as
+            cheap) and more accurate. Default is True.
+
+    Raises:
+        ValueError: If `task` is not a single-label classification task,
+            `max_length` is not between 1 and 3, the database holds no predictions
+            on `date`, or no examples are predicted by all APIs.
+
+    Returns:
+        pd.DataFrame: A dataframe with one row per cascade and threshold setting and
+            the columns "apis" (a tuple of the APIs, in order), "thresholds" (a tuple
+            with the threshold of every API but the last), "accuracy" and
+            "cost_per_10k" (the expected cost of 10,000 examples), sorted by cost.
+    """
+    from . import _select, get_labels, get_predictions
+
+    if task not in CLASSIFICATION_TASKS:
+        raise ValueError(
+            f"`hapi.simulate_cascades` only supports the tasks "
+            f"{CLASSIFICATION_TASKS}, got '{task}'."
+        )
+    if not 1 <= max_length <= MAX_LENGTH:
+        raise ValueError(
+            f"`max_length` must be between 1 and {MAX_LENGTH}, got {max_length}."
+        )
+    grid = np.sort(
+        np.linspace(0, 1, 21) if thresholds is None else np.asarray(thresholds, float)
+    )
+
+    rows = _select(task=task, dataset=dataset, api=api, date=date)
+    if not rows:
+        raise ValueError(f"No predictions found for '{task}/{dataset}' on '{date}'.")
+    apis = [row["api"] for row in rows]
+    costs = np.array([row["cost_per_10k"] for row in rows], dtype=float)
+    path_to_preds = get_predictions(task=task, dataset=dataset, api=apis, date=date)
+    labels = get_labels(task=task, dataset=dataset).get(f"{task}/{dataset}", [])
+    files = [path_to_preds[f"{task}/{dataset}/{api}/{date}"] for api in apis]
+
+    correct, confidence = _align(labels, files)
+    if correct.shape[1] == 0:
+        raise ValueError(
+            f"No examples of '{task}/{dataset}' are labeled and predicted by all of "
+            f"the APIs {apis} on '{date}'."
+        )
+
+    # the bin of a confidence is the number of thresholds it passes, so an example
+    # is rejected at threshold `u` iff its bin is <= u
+    n_bins = len(grid) + 1
+    bins = np.searchsorted(grid, np.nan_to_num(confidence, nan=-np.inf), "right")
+    n_examples = correct.shape[1]
+
+    # the results are collected in blocks of one cascade at all of its thresholds
+    results = {"apis": [], "thresholds": [], "accuracy": [], "cost": []}
+
+    def add(ordering, thresholds, accuracy, cost):
+        results["apis"].append(tuple(apis[a] for a in ordering))
+        results["thresholds"].append(thresholds)
+        results["accuracy"].append(accuracy)
+        results["cost"].append(cost)
+
+    for i in range(len(apis)):
+        add((i,), np.empty((1, 0)), correct[i].mean(keepdims=True), costs[i : i + 1])
+
+    u, v = np.meshgrid(np.arange(len(grid)), np.arange(len(grid)), indexing="ij")
+    pairs = np.stack([grid[u.ravel()], grid[v.ravel()]], axis=1)
+    for i in range(len(apis)) if max_length >= 2 else []:
+        # the number of examples rejected by `i`, and the correct predictions of
+        # `i` on the accepted ones and of every API on the rejected ones, at every
+        # threshold
+        rejected = np.cumsum(np.bincount(bins[i], minlength=n_bins))[:-1]
+        hits = np.stack(
+            [
+                np.bincount(bins[i], correct[k], minlength=n_bins)
+                for k in range(len(apis))
+            ]
+        )
+        accepted_hits = hits[i].sum() - np.cumsum(hits[i])[:-1]
+        rejected_hits = np.cumsum(hits, axis=1)[:, :-1]
+
+        for j in range(len(apis)):
+            if j == i:
+                continue
+            add(
+                (i, j),
+                grid[:, None],
+                (accepted_hits + rejected_hits[j]) / n_examples,
+                costs[i] + costs[j] * rejected / n_examples,
+            )
+            if max_length < 3:
+                continue
+
+            # 2D histograms over the bins of `i` and `j`, cumulated over both axes to
+            # count the examples rejected by both at every pair of thresholds
+            cells = bins[i] * n_bins + bins[j]
+            both = _cumsum2d(np.bincount(cells, minlength=n_bins**2), n_bins)
+            both_hits = np.stack(
+                [
+                    _cumsum2d(
+                        np.bincount(cells, correct[k], minlength=n_bins**2), n_bins
+                    )
+                    for k in range(len(apis))
+                ]
+            )
+            # `j` answers the examples rejected by `i` but not by `j`
+            answered_hits = (
+                accepted_hits[:, None] + rejected_hits[j][:, None] - both_hits[j]
+            )
+            partial_cost = costs[i] + costs[j] * rejected[:, None] / n_examples
+            for k in range(len(apis)):
+                if k in (i, j):
+                    continue
+                add(
+                    (i, j, k),
+                    pairs,
+                    ((answered_hits + both_hits[k]) / n_examples).ravel(),
+                    (partial_cost + costs[k] * both / n_examples).ravel(),
+                )
+
+    accuracy = np.concatenate(results["accuracy"])
+    cost = np.concatenate(results["cost"])
+    selected = _pareto(accuracy, cost) if pareto else np.lexsort((-accuracy, cost))
+
+    # only build the tuples of apis and thresholds for the selected rows
+    starts = np.cumsum([0] + [len(block) for block in results["accuracy"]])
+    blocks = np.searchsorted(starts, selected, side="right") - 1
+    return pd.DataFrame(
+        {
+            "apis": [results["apis"][b] for b in blocks],
+            "thresholds": [
+                tuple(results["thresholds"][b][s - starts[b]].tolist())
+                for b, s in zip(blocks, selected)
+            ],
+            "accuracy": accuracy[selected],
+            "cost_per_10k": cost[selected],
+        }
+    )
+
+
+def _align(labels: List[dict], files: List[List[dict]]):
+    """Align the predictions of several APIs to the labels.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Whether each prediction is correct and its
+        confidence, as arrays of shape (APIs, examples), over the examples that are
+        labeled and predicted by every API.
+    """
+    example_index = pd.Index([label["example_id"] for label in labels])
+    true = [label["true_label"] for label in labels]
+    n_files = len(files)
+
+    correct = np.zeros((n_files, len(labels)), dtype=bool)
+    confidence = np.full((n_files, len(labels)), np.nan)
+    predicted = np.zeros((n_files, len(labels)), dtype=bool)
+    for f, preds in enumerate(files):
+        positions = example_index.get_indexer([pred["example_id"] for pred in preds])
+        keep = positions >= 0
+        positions = positions[keep]
+        preds = [pred for pred, k in zip(preds, keep) if k]
+        predicted[f, positions] = True
+        correct[f, positions] = [
+            pred["predicted_label"] == true[p] for pred, p in zip(preds, positions)
+        ]
+        confidence[f, positions] = np.array(
+            [pred.get("confidence") for pred in preds], dtype=float
+        )
+
+    complete = predicted.all(axis=0)
+    return correct[:, complete], confidence[:, complete]
+
+
+def _cumsum2d(counts: np.ndarray, n_bins: int) -> np.ndarray:
+    """Cumulate a flattened (n_bins, n_bins) histogram over both axes, dropping the
+    last bin of each axis (the confidences that pass every threshold).
+    """
+    return counts.reshape(n_bins, n_bins).cumsum(axis=0).cumsum(axis=1)[:-1, :-1]
+
+
+def _pareto(accuracy: np.ndarray, cost: np.ndarray) -> np.ndarray:
+    """The positions of the points on the Pareto frontier, sorted by cost."""
+    order = np.lexsort((-accuracy, cost))
+    best = np.maximum.accumulate(accuracy[order])
+    # a point is on the frontier if it is more accurate than every cheaper point
+    improves = np.concatenate([[True], accuracy[order][1:] > best[:-1]])
+    return order[improves]
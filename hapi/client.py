@@ -0,0 +1,121 @@
+"""The client side of :mod:`hapi.server`, used by the loaders in place of the local
+database when `config.server_url` is set.
+"""
+
+import json
+import time
+from typing import TYPE_CHECKING, Dict, List, Tuple, Union
+
+from . import instrument
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from .table import PredictionTable
+
+# seconds to wait for the server to answer, which includes loading cold files
+TIMEOUT = 600
+
+
+def get_predictions(
+    url: str,
+    task: Union[str, List[str]] = None,
+    dataset: Union[str, List[str]] = None,
+    api: Union[str, List[str]] = None,
+    date: Union[str, List[str]] = None,
+    example_id: Union[str, List[str]] = None,
+    format: str = "records",
+) -> Dict[str, Union[List[Dict], "PredictionTable"]]:
+    """Get predictions from the server at `url`, one page at a time. Takes the same
+    filters and returns the same results as :func:`hapi.get_predictions`.
+    """
+    filters = dict(task=task, dataset=dataset, api=api, date=date)
+    filters["example_id"] = example_id
+    if format == "records":
+        return _get_pages(url, "predictions", filters)
+
+    from .server import decode_tables
+    from .table import share_vocabularies
+
+    path_to_tables, offset = {}, 0
+    while offset is not None:
+        data = _request(url, "predictions", filters, format="npz", offset=offset)
+        with instrument.phase("parse"):
+            tables, page = decode_tables(data)
+        path_to_tables.update(tables)
+        offset = page["next"]
+    with instrument.phase("merge"):
+        tables = share_vocabularies(list(path_to_tables.values()))
+    return dict(zip(path_to_tables, tables))
+
+
+def get_labels(
+    url: str,
+    task: Union[str, List[str]] = None,
+    dataset: Union[str, List[str]] = None,
+) -> Dict[str, List[Dict]]:
+    """Get labels from the server at `url`, one page at a time. Takes the same
+    filters and returns the same results as :func:`hapi.get_labels`.
+    """
+    return _get_pages(url, "labels", dict(task=task, dataset=dataset))
+
+
+def summary(url: str, extended: bool = False) -> "pd.DataFrame":
+    """Get the summary of the database from the server at `url`, like
+    :func:`hapi.summary`.
+    """
+    from .server import decode_frame
+
+    data = _request(url, "summary", {}, extended=int(extended))
+    with instrument.phase("parse"):
+        return decode_frame(json.loads(data))
+
+
+def metrics(url: str) -> Dict:
+    """Get the request counts, latencies and throughput of the server at `url`, and
+    the state of its cache. See :class:`hapi.server.HAPIServer`.
+    """
+    return json.loads(_request(url, "metrics", {}))
+
+
+def _get_pages(url: str, endpoint: str, filters: Dict) -> Dict[str, List[Dict]]:
+    results, offset = {}, 0
+    while offset is not None:
+        data = _request(url, endpoint, filters, format="json", offset=offset)
+        with instrument.phase("parse"):
+            page = json.loads(data)
+        results.update(page[endpoint])
+        offset = page["next"]
+    return results
+
+
+def _request(url: str, endpoint: str, filters: Dict, **params) -> bytes:
+    """Send a ``GET`` request to an endpoint of the server and read the whole
+    response.
+
+    Raises:
+        ValueError: If the server rejects the request as invalid.
+    """
+    from urllib.error import HTTPError
+    from urllib.parse import urlencode
+    from urllib.request import urlopen
+
+    query: List[Tuple[str, object]] = []
+    for name, value in filters.items():
+        if value is not None:
+            values = [value] if isinstance(value, str) else value
+            query.extend((name, v) for v in values)
+    query.extend(params.items())
+
+    start = time.perf_counter()
+    try:
+        with urlopen(
+            f"{url.rstrip('/')}/{endpoint}?{urlencode(query)}", timeout=TIMEOUT
+        ) as response:
+            data = response.read()
+    except HTTPError as e:
+        if e.code == 400:
+            raise ValueError(json.loads(e.read())["error"]) from None
+        raise
+    instrument.add({"open": time.perf_counter() - start}, bytes_read=len(data))
+    return data
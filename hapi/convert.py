@@ -1,12 +1,21 @@
+import argparse
+import hashlib
+import json
 import os
+import re
+import shutil
+import sys
 import tarfile
+import tempfile
+from typing import Dict, List, Tuple
+
 import pandas as pd
-import json
-import meerkat as mk
-import re
-from google.cloud import storage
-from pyrsistent import l
-from tqdm import tqdm
+
+if not __package__:
+    # run as a script (`python hapi/convert.py`), so make the package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hapi.parallel import map_ordered  # noqa: E402
 
 DATASET_TO_TASK = {
     "coco": "mic",
@@ -39,156 +48,207 @@ DST_DIR = "/Users/eyubogln/code/hapi/data/tasks"
 
 BUCKET_NAME = "hapi-data"
 
+MANIFEST_FILE = ".manifest.json"
+
+# what was last published to each sink, kept in `dst_dir` next to the manifest
+PUBLISHED_FILE = ".published.json"
 
-def get_structured_predictions(
-    predictions_dir: str, model: str, include_original: bool = False
-):
 
-    # regex pattern for converting from came
-    pattern = re.compile(r"(?<!^)(?=[A-Z])")
+SUFFIXES = [".jpg", ".jpeg", ".png", ".txt"]
 
-    # load in column with all the paths to images
-    dp = {}
-    for column in ["ImageName", "Context", "Confidence"]:
+# regex pattern for converting from camel case to snake case
+CAMEL_PATTERN = re.compile(r"(?<!^)(?=[A-Z])")
+
+
+def read_columns(
+    predictions_dir: str, model: str, columns: List[str]
+) -> Dict[str, List]:
+    """Read the per-model column files of a legacy prediction dump.
+
+    Every file is read once. The "ImageName" column is replaced by an "example_id"
+    column, which is the image name without its file extension. Missing column files
+    are skipped.
+
+    Returns:
+        Dict[str, List]: A mapping from the snake-cased column names to the values of
+            the columns, in the order of `columns`.
+    """
+    out = {}
+    for column in columns:
         path = os.path.join(predictions_dir, f"{model}_{column}.txt")
         if not os.path.exists(path):
             continue
-        column = pattern.sub("_", column).lower()
-        dp[column] = pd.read_csv(path, names=[column], index_col=False)[column]
-
-    # create the dp to be output, create a new column for image name
-    dp = mk.DataPanel(dp)
-    dp["example_id"] = dp["image_name"]
-    for suffix in [".jpg", ".jpeg", ".png", ".txt"]:
-        dp["example_id"] = dp["example_id"].str.removesuffix(suffix)
-
-    # match predicted labels to rows of the dataset by performing a merge
-    columns = (
-        ["PredictedLabel", "OriginalPredictedLabel"]
-        if include_original
-        else ["PredictedLabel"]
-    )
+        if column == "ImageName":
+            names = pd.read_csv(path, names=[column], index_col=False, dtype=str)
+            out["example_id"] = [_strip_suffixes(name) for name in names[column]]
+        else:
+            name = CAMEL_PATTERN.sub("_", column).lower()
+            out[name] = pd.read_csv(path, names=[name], index_col=False)[name].tolist()
+    return out
+
+
+def align_json_columns(
+    predictions_dir: str, model: str, example_ids: List[str], columns: List[str]
+) -> Dict[str, List]:
+    """Align the JSON column files of a structured prediction dump, which map
+    example ids to lists of ``{"transcription": ...}`` dicts, to `example_ids`.
+
+    Each file is parsed once and used as a hash index on the example id, so every
+    column is aligned in a single pass over `example_ids`.
+
+    Raises:
+        ValueError: If the example ids are not unique or a file is missing one.
+
+    Returns:
+        Dict[str, List]: A mapping from the snake-cased column names to the lists of
+            transcriptions of each example.
+    """
+    if len(set(example_ids)) != len(example_ids):
+        raise ValueError(f"Duplicate example ids in '{predictions_dir}' ({model}).")
+
+    out = {}
     for column in columns:
         path = os.path.join(predictions_dir, f"{model}_{column}.txt")
-        column = pattern.sub("_", column).lower()
+        with open(path, "rb") as f:
+            index = json.load(f)
+        try:
+            out[CAMEL_PATTERN.sub("_", column).lower()] = [
+                [pred["transcription"] for pred in index[example_id]]
+                for example_id in example_ids
+            ]
+        except KeyError as e:
+            raise ValueError(f"No {column} for example {e} in '{path}'.")
+    return out
+
 
-        out = json.load(open(path, "rb"))
-        other = mk.DataPanel(
-            {"example_id": list(out.keys()), column: list(out.values())}
+def get_structured_predictions(
+    predictions_dir: str, model: str, include_original: bool = False
+) -> List[Dict]:
+    columns = read_columns(
+        predictions_dir, model, ["ImageName", "Context", "Confidence"]
+    )
+    example_ids = columns.pop("example_id")
+    columns["example_id"] = example_ids
+    columns.update(
+        align_json_columns(
+            predictions_dir,
+            model,
+            example_ids,
+            (
+                ["PredictedLabel", "OriginalPredictedLabel"]
+                if include_original
+                else ["PredictedLabel"]
+            ),
         )
-        predicted_labels = dp.merge(other, on="example_id", validate="one_to_one")[
-            column
-        ]
-        assert len(predicted_labels) == len(dp)
+    )
+    return _to_records(columns)
 
-        # add the original labels to the output dp
-        dp[column] = [
-            [pred["transcription"] for pred in example] for example in predicted_labels
-        ]
-    dp.remove_column("image_name")
 
-    return dp
+def get_class_predictions(predictions_dir: str, model: str) -> List[Dict]:
+    columns = read_columns(
+        predictions_dir,
+        model,
+        ["ImageName", "Context", "Confidence", "PredictedLabel"],
+    )
+    columns["example_id"] = columns.pop("example_id")
+    return _to_records(columns)
 
 
-def get_class_predictions(predictions_dir: str, model: str):
-    # regex pattern for converting from came
-    pattern = re.compile(r"(?<!^)(?=[A-Z])")
+def get_structured_labels(
+    predictions_dir: str, model: str, include_original: bool = False
+) -> List[Dict]:
+    columns = read_columns(predictions_dir, model, ["ImageName"])
+    columns.update(
+        align_json_columns(predictions_dir, model, columns["example_id"], ["TrueLabel"])
+    )
+    return _to_records(columns)
 
-    # load in column with all the paths to images
-    dp = {}
-    for column in ["ImageName", "Context", "Confidence", "PredictedLabel"]:
-        path = os.path.join(predictions_dir, f"{model}_{column}.txt")
-        if not os.path.exists(path):
-            continue
-        column = pattern.sub("_", column).lower()
-        dp[column] = pd.read_csv(path, names=[column], index_col=False)[column]
 
-    # create the dp to be output, create a new column for image name
-    dp = mk.DataPanel(dp)
-    dp["example_id"] = dp["image_name"]
-    for suffix in [".jpg", ".jpeg", ".png", ".txt"]:
-        dp["example_id"] = dp["example_id"].str.removesuffix(suffix)
+def get_class_labels(predictions_dir: str, model: str) -> List[Dict]:
+    columns = read_columns(predictions_dir, model, ["ImageName", "TrueLabel"])
+    columns["example_id"] = columns.pop("example_id")
+    return _to_records(columns)
 
-    dp.remove_column("image_name")
 
-    return dp
+def _strip_suffixes(name: str) -> str:
+    for suffix in SUFFIXES:
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+    return name
 
 
-def get_structured_labels(
-    predictions_dir: str, model: str, include_original: bool = False
-):
-    # regex pattern for converting from came
-    pattern = re.compile(r"(?<!^)(?=[A-Z])")
+def _to_records(columns: Dict[str, List]) -> List[Dict]:
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*columns.values())]
 
-    # load in column with all the paths to images
-    dp = {}
-    for column in ["ImageName"]:
-        path = os.path.join(predictions_dir, f"{model}_{column}.txt")
-        if not os.path.exists(path):
-            continue
-        column = pattern.sub("_", column).lower()
-        dp[column] = pd.read_csv(path, names=[column], index_col=False)[column]
 
-    # create the dp to be output, create a new column for image name
-    dp = mk.DataPanel(dp)
-    dp["example_id"] = dp["image_name"]
-    for suffix in [".jpg", ".jpeg", ".png", ".txt"]:
-        dp["example_id"] = dp["example_id"].str.removesuffix(suffix)
+class Sink:
+    """Destination that a built database is uploaded to."""
 
-    # match predicted labels to rows of the dataset by performing a merge
-    columns = ["TrueLabel"]
-    for column in columns:
-        path = os.path.join(predictions_dir, f"{model}_{column}.txt")
-        column = pattern.sub("_", column).lower()
+    @property
+    def url(self) -> str:
+        """The location of the sink, under which :func:`publish` records what was
+        uploaded to it.
+        """
+        raise NotImplementedError
 
-        out = json.load(open(path, "rb"))
-        other = mk.DataPanel(
-            {"example_id": list(out.keys()), column: list(out.values())}
-        )
-        predicted_labels = dp.merge(other, on="example_id", validate="one_to_one")[
-            column
-        ]
-        assert len(predicted_labels) == len(dp)
-
-        # add the original labels to the output dp
-        dp[column] = [
-            [pred["transcription"] for pred in example] for example in predicted_labels
-        ]
-    dp.remove_column("image_name")
-    return dp
-
-
-def get_class_labels(predictions_dir: str, model: str):
-    # regex pattern for converting from came
-    pattern = re.compile(r"(?<!^)(?=[A-Z])")
-
-    # load in column with all the paths to images
-    dp = {}
-    for column in ["ImageName", "TrueLabel"]:
-        path = os.path.join(predictions_dir, f"{model}_{column}.txt")
-        if not os.path.exists(path):
-            continue
-        column = pattern.sub("_", column).lower()
-        dp[column] = pd.read_csv(path, names=[column], index_col=False)[column]
+    def upload(self, path: str, name: str):
+        """Upload the local file at `path` under the name `name`, which may contain
+        ``/``.
+        """
+        raise NotImplementedError
 
-    # create the dp to be output, create a new column for image name
-    dp = mk.DataPanel(dp)
-    dp["example_id"] = dp["image_name"]
-    for suffix in [".jpg", ".jpeg", ".png", ".txt"]:
-        dp["example_id"] = dp["example_id"].str.removesuffix(suffix)
-    dp.remove_column("image_name")
 
-    return dp
+class GCSSink(Sink):
+    """Uploads to a Google Cloud Storage bucket."""
 
+    def __init__(self, bucket_name: str = BUCKET_NAME):
+        self.bucket_name = bucket_name
 
-if __name__ == "__main__":
-    meta = []
-    for predictions_dir in tqdm(os.listdir(DATA_DIR)):
+    @property
+    def url(self) -> str:
+        return f"gs://{self.bucket_name}"
+
+    def upload(self, path: str, name: str):
+        from google.cloud import storage
+
+        storage_client = storage.Client()
+        bucket = storage_client.bucket(self.bucket_name)
+        blob = bucket.blob(name)
+        blob.upload_from_filename(path)
+
+
+class LocalSink(Sink):
+    """Copies to a local directory, e.g. to stand in for the bucket in tests."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    @property
+    def url(self) -> str:
+        return f"file://{os.path.abspath(self.directory)}"
+
+    def upload(self, path: str, name: str):
+        dst_path = os.path.join(self.directory, *name.split("/"))
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        tmp_path = os.path.join(
+            os.path.dirname(dst_path), f".{os.path.basename(dst_path)}.tmp"
+        )
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, dst_path)
+
+
+def get_units(data_dir: str) -> List[Dict]:
+    """List the conversion units in the legacy predictions directory, i.e. the
+    predictions of one model on one dataset on one date.
+    """
+    units = []
+    for predictions_dir in sorted(os.listdir(data_dir)):
         if predictions_dir.startswith("."):
             # ignore hiddne files
             continue
         _, run_id = predictions_dir.split("_", 1)
-        predictions_dir = os.path.join(DATA_DIR, predictions_dir)
+        predictions_dir = os.path.join(data_dir, predictions_dir)
         dataset, date = run_id.split("20", 1)
         dataset = dataset.lower()
         date = f"{date[:2]}-{date[2:4]}-{date[4:]}"
@@ -212,52 +272,338 @@ if __name__ == "__main__":
             for index, cost in zip(old_meta_df["Index"], old_meta_df[cost_column])
         }
 
-        for model in models:
+        for model in sorted(models):
             if model not in model_to_api:
                 continue
-            labels_path = os.path.join(DST_DIR, task, dataset, "labels.json")
-            if not os.path.exists(labels_path):
-                if task in ["ner", "mic", "str"]:
-                    dp = get_structured_labels(predictions_dir, model)
-                else:
-                    dp = get_class_labels(predictions_dir, model)
-                dp.to_pandas().to_json(labels_path, orient="records")
-
-            api = model_to_api[model]
-
-            if task in ["ner", "mic", "str"]:
-                dp = get_structured_predictions(predictions_dir, model)
-            else:
-                dp = get_class_predictions(predictions_dir, model)
-
-            new_dir = os.path.join(
-                DST_DIR,
-                task,
-                dataset,
-                api,
-            )
-            os.makedirs(new_dir, exist_ok=True)
-
-            path = os.path.join(new_dir, f"{date}.json")
-            dp.to_pandas().to_json(path, orient="records")
-
-            meta.append(
+            units.append(
                 {
+                    "predictions_dir": predictions_dir,
+                    "model": model,
                     "task": task,
                     "dataset": dataset,
-                    "api": api,
+                    "api": model_to_api[model],
                     "date": date,
-                    "path": os.path.relpath(path, DST_DIR),
                     "cost_per_10k": model_to_cost[model],
                 }
             )
+    return units
+
+
+def hash_unit(unit: Dict) -> str:
+    """Hash the contents of the source files of a conversion unit."""
+    sha256 = hashlib.sha256()
+    predictions_dir, model = unit["predictions_dir"], unit["model"]
+    for name in ["meta.csv"] + sorted(
+        f for f in os.listdir(predictions_dir) if f.startswith(f"{model}_")
+    ):
+        sha256.update(name.encode("utf-8"))
+        with open(os.path.join(predictions_dir, name), "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def convert_labels(unit: Dict, dst_dir: str = DST_DIR) -> str:
+    """Write the labels of the dataset of a conversion unit, read from the source
+    files of the unit.
+
+    Returns:
+        str: The path to the labels.
+    """
+    predictions_dir, model = unit["predictions_dir"], unit["model"]
+    task, dataset = unit["task"], unit["dataset"]
+
+    if task in ["ner", "mic", "str"]:
+        records = get_structured_labels(predictions_dir, model)
+    else:
+        records = get_class_labels(predictions_dir, model)
+    labels_path = os.path.join(dst_dir, task, dataset, "labels.json")
+    os.makedirs(os.path.dirname(labels_path), exist_ok=True)
+    _write_json(records, labels_path)
+    return labels_path
+
+
+def convert_unit(unit: Dict, dst_dir: str = DST_DIR) -> Dict:
+    """Convert the predictions of one model on one dataset on one date to the HAPI
+    format. The labels of the dataset are written separately, by
+    :func:`convert_labels`.
+
+    Returns:
+        Dict: The row of ``meta.csv`` describing the converted predictions.
+    """
+    predictions_dir, model = unit["predictions_dir"], unit["model"]
+    task, dataset = unit["task"], unit["dataset"]
+
+    if task in ["ner", "mic", "str"]:
+        records = get_structured_predictions(predictions_dir, model)
+    else:
+        records = get_class_predictions(predictions_dir, model)
+
+    os.makedirs(os.path.join(dst_dir, task, dataset, unit["api"]), exist_ok=True)
+
+    path = _unit_path(unit)
+    _write_json(records, os.path.join(dst_dir, path))
+
+    return {
+        "task": task,
+        "dataset": dataset,
+        "api": unit["api"],
+        "date": unit["date"],
+        "path": path,
+        "cost_per_10k": unit["cost_per_10k"],
+    }
+
+
+def _convert_unit(args: Tuple[Dict, str]) -> Dict:
+    return convert_unit(*args)
+
+
+def _convert_labels(args: Tuple[Dict, str]) -> str:
+    return convert_labels(*args)
+
+
+def _write_json(records: List[Dict], path: str):
+    # written with `DataFrame.to_json`, like the published database was, so that
+    # rebuilt files are byte-identical and aren't uploaded again: floats are rounded
+    # to 10 decimal places, missing values (NaN) are null and "/" is escaped
+    df = pd.DataFrame.from_records(records)
+    # write to a temporary file of our own first, so readers never see a partial
+    # file and concurrent writers don't clobber each other's
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}."
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            df.to_json(f, orient="records")
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def build(
+    data_dir: str = DATA_DIR,
+    dst_dir: str = DST_DIR,
+    workers: int = 1,
+    incremental: bool = True,
+) -> List[Dict]:
+    """Convert the legacy predictions in `data_dir` to the HAPI format in `dst_dir`.
+
+    In incremental mode, a manifest of the hashes of the source files of every
+    conversion unit (one model on one dataset on one date) is kept in `dst_dir`, and
+    only the units that are new or whose source files changed are converted. The
+    labels of every dataset are written first, once per dataset (if they don't exist
+    yet, or always if not `incremental`), then the units are converted on a pool of
+    `workers` processes, and their rows are merged into ``meta.csv``, which is
+    replaced atomically. The predictions, labels and rows of ``meta.csv`` of units
+    whose source files were removed are removed too.
+
+    Returns:
+        List[Dict]: The rows of ``meta.csv`` that were (re)built.
+    """
+    os.makedirs(dst_dir, exist_ok=True)
+    manifest_path = os.path.join(dst_dir, MANIFEST_FILE)
+    manifest = {}
+    if incremental and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    units = get_units(data_dir)
+    hashes = map_ordered(hash_unit, units, workers=workers, executor="process")
+    todo = [
+        (unit, digest)
+        for unit, digest in zip(units, hashes)
+        if manifest.get(_unit_id(unit)) != digest
+    ]
+
+    # one unit per dataset writes its labels, before any unit of the dataset is
+    # converted, so that no two workers write the same file
+    labels = {}
+    for unit in units:
+        labels_path = os.path.join(
+            dst_dir, unit["task"], unit["dataset"], "labels.json"
+        )
+        if not incremental or not os.path.exists(labels_path):
+            labels.setdefault(labels_path, unit)
+    map_ordered(
+        _convert_labels,
+        [(unit, dst_dir) for unit in labels.values()],
+        workers=workers,
+        executor="process",
+    )
 
-    pd.DataFrame(meta).to_csv(os.path.join(DST_DIR, "meta.csv"), index=False)
+    rows = map_ordered(
+        _convert_unit,
+        [(unit, dst_dir) for unit, _ in todo],
+        workers=workers,
+        executor="process",
+    )
 
-    with tarfile.open(DST_DIR + ".tar.gz", "w:gz") as tar:
-        tar.add(DST_DIR, arcname=os.path.basename(DST_DIR))
+    # merge the new rows into meta.csv, replacing the rows of rebuilt files and
+    # dropping those of removed units along with their files
+    meta_path = os.path.join(dst_dir, "meta.csv")
+    meta = []
+    if os.path.exists(meta_path):
+        meta = pd.read_csv(meta_path).to_dict("records")
+    paths = [_unit_path(unit) for unit in units]
+    path_set = set(paths)
+    datasets = {(unit["task"], unit["dataset"]) for unit in units}
+    for row in meta:
+        if row["path"] not in path_set:
+            _remove(os.path.join(dst_dir, row["path"]))
+        if (row["task"], row["dataset"]) not in datasets:
+            _remove(os.path.join(dst_dir, row["task"], row["dataset"], "labels.json"))
+    # keep the rows in the order of the units, so that meta.csv only changes when
+    # its rows do
+    path_to_row = {row["path"]: row for row in meta}
+    path_to_row.update((row["path"], row) for row in rows)
+    meta = [path_to_row[path] for path in paths if path in path_to_row]
+    pd.DataFrame(meta).to_csv(f"{meta_path}.tmp", index=False)
+    os.replace(f"{meta_path}.tmp", meta_path)
+
+    unit_ids = {_unit_id(unit) for unit in units}
+    manifest = {
+        unit_id: digest for unit_id, digest in manifest.items() if unit_id in unit_ids
+    }
+    for unit, digest in todo:
+        manifest[_unit_id(unit)] = digest
+    with open(f"{manifest_path}.tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    return rows
+
+
+def publish(
+    dst_dir: str = DST_DIR, sink: Sink = None, force: bool = False
+) -> List[str]:
+    """Publish the database in `dst_dir` to `sink` (by default, the hapi-data bucket)
+    for :func:`hapi.download` and :func:`hapi.update`.
+
+    The manifest of the database is written with :func:`hapi.fetch.write_manifest`
+    and compared to the one last published to `sink`. If nothing changed, nothing is
+    uploaded. Otherwise, only the changed files are uploaded (``meta.csv`` last),
+    then the database is archived to ``hapi.tar.gz`` and uploaded along with its
+    checksum, and the manifest is uploaded last, so that clients only see it once
+    the files it lists are in place.
+
+    Args:
+        dst_dir (str, optional): The ``tasks`` directory of the database. Defaults to
+            DST_DIR.
+        sink (Sink, optional): Where to upload the database. Defaults to None, in
+            which case the hapi-data bucket is used.
+        force (bool, optional): Upload every file, even if it was already
+            published. Defaults to False.
+
+    Returns:
+        List[str]: The paths of the uploaded files of the database, relative to the
+            parent of `dst_dir`.
+
+    Raises:
+        ValueError: If `dst_dir` is not named ``tasks``.
+    """
+    from hapi.fetch import _file_digest, write_manifest
+
+    dst_dir = os.path.normpath(dst_dir)
+    if os.path.basename(dst_dir) != "tasks":
+        raise ValueError(
+            f"The database to publish must be in a directory named 'tasks', got "
+            f"'{dst_dir}'."
+        )
+    if sink is None:
+        sink = GCSSink()
+    data_dir = os.path.dirname(dst_dir)
+
+    manifest_path = write_manifest(data_dir)
+    with open(manifest_path) as f:
+        files = json.load(f)["files"]
+
+    published_path = os.path.join(dst_dir, PUBLISHED_FILE)
+    published = {}
+    if os.path.exists(published_path):
+        with open(published_path) as f:
+            published = json.load(f)
+    last = {} if force else published.get(sink.url, {})
+    if files == last:
+        return []
+
+    changed = sorted(
+        (path for path, entry in files.items() if last.get(path) != entry),
+        key=lambda path: path == "tasks/meta.csv",
+    )
+    for path in changed:
+        sink.upload(os.path.join(data_dir, path), path)
+
+    archive_path = dst_dir + ".tar.gz"
+    with tarfile.open(archive_path, "w:gz") as tar:
+        tar.add(
+            dst_dir,
+            arcname=os.path.basename(dst_dir),
+            filter=lambda info: (
+                None if os.path.basename(info.name).startswith(".") else info
+            ),
+        )
+    with open(f"{archive_path}.sha256", "w") as f:
+        # same format as the output of `sha256sum`
+        f.write(f"{_file_digest(archive_path)}  hapi.tar.gz\n")
+    sink.upload(archive_path, "hapi.tar.gz")
+    sink.upload(f"{archive_path}.sha256", "hapi.tar.gz.sha256")
+    sink.upload(manifest_path, "manifest.json")
+
+    published[sink.url] = files
+    with open(f"{published_path}.tmp", "w") as f:
+        json.dump(published, f)
+    os.replace(f"{published_path}.tmp", published_path)
+    return changed
+
+
+def _unit_id(unit: Dict) -> str:
+    return f"{os.path.basename(unit['predictions_dir'])}/{unit['model']}"
+
+
+def _unit_path(unit: Dict) -> str:
+    return os.path.join(
+        unit["task"], unit["dataset"], unit["api"], f"{unit['date']}.json"
+    )
+
+
+def _remove(path: str):
+    if os.path.exists(path):
+        os.remove(path)
 
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(BUCKET_NAME)
-    blob = bucket.blob("hapi.tar.gz")
-    blob.upload_from_filename(DST_DIR + ".tar.gz")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert legacy predictions to the HAPI database format."
+    )
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--dst-dir", default=DST_DIR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--full", action="store_true", help="Rebuild every unit from scratch."
+    )
+    parser.add_argument(
+        "--sink",
+        default=None,
+        help="Local directory to upload the archive to instead of the bucket.",
+    )
+    parser.add_argument("--no-upload", action="store_true")
+    parser.add_argument(
+        "--force-upload",
+        action="store_true",
+        help="Upload every file, even if it was already published.",
+    )
+    args = parser.parse_args()
+
+    build(
+        args.data_dir,
+        args.dst_dir,
+        workers=args.workers,
+        incremental=not args.full,
+    )
+    if not args.no_upload:
+        publish(
+            args.dst_dir,
+            sink=LocalSink(args.sink) if args.sink is not None else GCSSink(),
+            force=args.force_upload,
+        )
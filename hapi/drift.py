@@ -0,0 +1,283 @@
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .cache import MISSING, current_cache
+from .structured import STRUCTURED_TASKS
+
+
+@dataclass
+class PredictionDiff:
+    """The changes in the predictions of one API between two dates.
+
+    Attributes:
+        example_ids (np.ndarray): The ids of the examples predicted on both dates.
+        changed (np.ndarray): Whether the predicted label of each example changed.
+            For structured tasks, the predicted tags are compared as sets.
+        confidence_delta (np.ndarray): The confidence on the later date minus the
+            confidence on the earlier date for each example (NaN if either is
+            missing).
+        transitions (Optional[pd.DataFrame]): For classification tasks, the number
+            of examples predicted as each label (rows) on the earlier date and as
+            each label (columns) on the later date. None for structured tasks.
+        added (np.ndarray): The ids of the examples only predicted on the later date.
+        removed (np.ndarray): The ids of the examples only predicted on the earlier
+            date.
+    """
+
+    example_ids: np.ndarray
+    changed: np.ndarray
+    confidence_delta: np.ndarray
+    transitions: Optional[pd.DataFrame]
+    added: np.ndarray
+    removed: np.ndarray
+
+    @property
+    def change_rate(self) -> float:
+        """The fraction of examples whose prediction changed."""
+        return float(self.changed.mean()) if len(self.changed) else float("nan")
+
+
+def diff(task: str, dataset: str, api: str, date_a: str, date_b: str) -> PredictionDiff:
+    """Compare the predictions of an API on a dataset between two dates.
+
+    Examples are aligned by id, and the changed predictions, the confidence deltas
+    and the label transitions are computed with vectorized NumPy operations. If
+    `config.cache_size` is set, the result is cached per pair of prediction files
+    and recomputed when either file changes.
+
+    .. code-block:: python
+
+        d = hapi.diff("sa", "imdb", "google_sa", "20-10-28", "21-03-17")
+        d.change_rate, d.transitions
+
+    Args:
+        task (str): The task of the dataset.
+        dataset (str): The dataset.
+        api (str): The API.
+        date_a (str): The earlier date in format "y-m-d".
+        date_b (str): The later date in format "y-m-d".
+
+    Raises:
+        ValueError: If the database holds no predictions of `api` on one of the
+            dates.
+
+    Returns:
+        PredictionDiff: The changes between `date_a` and `date_b`.
+    """
+    from . import _select
+
+    rows = {
+        row["date"]: row
+        for row in _select(task=task, dataset=dataset, api=api, date=[date_a, date_b])
+    }
+    for date in [date_a, date_b]:
+        if date not in rows:
+            raise ValueError(
+                f"No predictions found for '{task}/{dataset}/{api}/{date}'."
+            )
+    return _diff_pairs(task, dataset, api, [(rows[date_a], rows[date_b])])[0]
+
+
+def diff_consecutive(
+    task: Union[str, List[str]] = None,
+    dataset: Union[str, List[str]] = None,
+    api: Union[str, List[str]] = None,
+) -> pd.DataFrame:
+    """Compare the predictions of every selected API on every selected dataset
+    between each pair of consecutive dates, e.g. for a drift report over the full
+    history of the database.
+
+    Use the `task`, `dataset` and `api` parameters to filter to a subset of the
+    database, with the same semantics as in :func:`hapi.get_predictions`. Results
+    are cached per pair of prediction files like in :func:`hapi.diff`. The dates of
+    an API are walked in order, and a file that ends one pair and starts the next is
+    only loaded once, so at most two prediction files are held in memory at a time.
+
+    Args:
+        task (Union[str, List[str]]): The task(s) to include. If None, all tasks are
+            included. Default is None.
+        dataset (Union[str, List[str]]): The dataset(s) to include. If None, all
+            datasets are included. Default is None.
+        api (Union[str, List[str]]): The API(s) to include. If None, all APIs are
+            included. Default is None.
+
+    Returns:
+        pd.DataFrame: A dataframe with one row per pair of consecutive dates and the
+            columns "task", "dataset", "api", "date_a", "date_b", "count" (the
+            number of examples predicted on both dates), "n_changed",
+            "change_rate", "mean_confidence_delta" and "diff" (the
+            :class:`PredictionDiff`).
+    """
+    from . import _select
+
+    series: Dict[tuple, List[Dict]] = {}
+    for row in _select(task=task, dataset=dataset, api=api):
+        series.setdefault((row["task"], row["dataset"], row["api"]), []).append(row)
+
+    records = []
+    for (task_name, dataset_name, api_name), rows in series.items():
+        rows = sorted(rows, key=lambda row: row["date"])
+        pairs = list(zip(rows[:-1], rows[1:]))
+        for (row_a, row_b), result in zip(
+            pairs, _diff_pairs(task_name, dataset_name, api_name, pairs)
+        ):
+            records.append(
+                {
+                    "task": task_name,
+                    "dataset": dataset_name,
+                    "api": api_name,
+                    "date_a": row_a["date"],
+                    "date_b": row_b["date"],
+                    "count": len(result.example_ids),
+                    "n_changed": int(result.changed.sum()),
+                    "change_rate": result.change_rate,
+                    "mean_confidence_delta": (
+                        np.nanmean(result.confidence_delta)
+                        if np.isfinite(result.confidence_delta).any()
+                        else np.nan
+                    ),
+                    "diff": result,
+                }
+            )
+
+    return pd.DataFrame(
+        records,
+        columns=[
+            "task",
+            "dataset",
+            "api",
+            "date_a",
+            "date_b",
+            "count",
+            "n_changed",
+            "change_rate",
+            "mean_confidence_delta",
+            "diff",
+        ],
+    )
+
+
+def _diff_pairs(
+    task: str, dataset: str, api: str, pairs: List[tuple]
+) -> List[PredictionDiff]:
+    """Diff pairs of rows of ``meta.csv`` for one api. The pairs that aren't cached
+    are diffed in order, and when a pair starts where the previous one ended (as
+    consecutive dates do), the columns of the shared file are reused instead of
+    loading it again. So every file is loaded at most once, and at most two are held
+    in memory at a time.
+    """
+    from . import config
+
+    def source(pair: tuple) -> List[str]:
+        return [os.path.join(config.data_dir, "tasks", row["path"]) for row in pair]
+
+    structured = task in STRUCTURED_TASKS
+    results = [
+        current_cache().get(("diff", *source(pair)), source=source(pair))
+        for pair in pairs
+    ]
+    previous: Tuple[Optional[str], Optional[_Columns]] = (None, None)
+    for i, (row_a, row_b) in enumerate(pairs):
+        if results[i] is not MISSING:
+            continue
+        columns_a = (
+            previous[1]
+            if previous[0] == row_a["path"]
+            else _load_columns(row_a, structured)
+        )
+        columns_b = _load_columns(row_b, structured)
+        previous = (row_b["path"], columns_b)
+
+        result = _diff(columns_a, columns_b, structured)
+        current_cache().put(
+            ("diff", *source(pairs[i])),
+            result,
+            source=source(pairs[i]),
+            size=sum(
+                array.nbytes
+                for array in [result.changed, result.confidence_delta]
+                + [result.example_ids, result.added, result.removed]
+            ),
+        )
+        results[i] = result
+    return results
+
+
+@dataclass
+class _Columns:
+    """The columns of a prediction file that are compared by :func:`_diff`."""
+
+    example_ids: List
+    labels: List
+    confidence: np.ndarray
+
+
+def _load_columns(row: Dict, structured: bool) -> _Columns:
+    """Load the prediction file of a row of ``meta.csv`` and extract the columns
+    that are compared. For structured tasks, the predicted tags are compared as
+    sets.
+    """
+    from . import get_predictions
+
+    preds = get_predictions(
+        task=row["task"], dataset=row["dataset"], api=row["api"], date=row["date"]
+    )[os.path.splitext(row["path"])[0]]
+    return _Columns(
+        example_ids=[pred["example_id"] for pred in preds],
+        labels=[
+            (
+                tuple(sorted(set(pred["predicted_label"])))
+                if structured
+                else pred["predicted_label"]
+            )
+            for pred in preds
+        ],
+        confidence=np.array([pred.get("confidence") for pred in preds], dtype=float),
+    )
+
+
+def _diff(columns_a: _Columns, columns_b: _Columns, structured: bool) -> PredictionDiff:
+    # intern the example ids of both files, and find the position in `columns_b` of
+    # every example of `columns_a`
+    ids_a, ids_b = columns_a.example_ids, columns_b.example_ids
+    codes, example_ids = pd.factorize(pd.Series(ids_a + ids_b, dtype=object))
+    codes_a, codes_b = codes[: len(ids_a)], codes[len(ids_a) :]
+    position_b = np.full(len(example_ids), -1)
+    position_b[codes_b] = np.arange(len(ids_b))
+
+    matched_b = position_b[codes_a]
+    index_a = np.flatnonzero(matched_b >= 0)
+    index_b = matched_b[index_a]
+
+    # intern the predicted labels of both files into one vocabulary
+    label_codes, classes = pd.factorize(
+        pd.Series(columns_a.labels + columns_b.labels, dtype=object)
+    )
+    labels_a = label_codes[: len(ids_a)][index_a]
+    labels_b = label_codes[len(ids_a) :][index_b]
+
+    transitions = None
+    if not structured:
+        n_classes = len(classes)
+        # missing labels are interned as -1, count them in an extra row and column
+        cells = (labels_a % (n_classes + 1)) * (n_classes + 1) + (
+            labels_b % (n_classes + 1)
+        )
+        counts = np.bincount(cells, minlength=(n_classes + 1) ** 2).reshape(
+            n_classes + 1, n_classes + 1
+        )[:n_classes, :n_classes]
+        transitions = pd.DataFrame(counts, index=list(classes), columns=list(classes))
+
+    example_ids = np.asarray(example_ids, dtype=object)
+    return PredictionDiff(
+        example_ids=example_ids[codes_a[index_a]],
+        changed=labels_a != labels_b,
+        confidence_delta=columns_b.confidence[index_b] - columns_a.confidence[index_a],
+        transitions=transitions,
+        added=example_ids[np.setdiff1d(codes_b, codes_a[index_a])],
+        removed=example_ids[codes_a[matched_b < 0]],
+    )
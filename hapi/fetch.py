@@ -0,0 +1,560 @@
+import hashlib
+import http.client
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import warnings
+from typing import Dict, List, Optional, Union
+from urllib.error import HTTPError
+from urllib.parse import quote, urljoin
+from urllib.request import Request, urlopen
+
+import pandas as pd
+from tqdm.auto import tqdm
+
+DATA_URL = "https://storage.googleapis.com/hapi-data/hapi.tar.gz"
+MANIFEST_URL = "https://storage.googleapis.com/hapi-data/manifest.json"
+
+# the hashes of the files of the last update, so that they aren't re-hashed
+LOCAL_MANIFEST_FILE = ".hapi-manifest.json"
+
+CHUNK_SIZE = 1 << 20
+TIMEOUT = 60
+
+
+def download(
+    data_dir: str = None,
+    task: Union[str, List[str]] = None,
+    dataset: Union[str, List[str]] = None,
+    api: Union[str, List[str]] = None,
+    date: Union[str, List[str]] = None,
+    url: str = DATA_URL,
+    checksum: str = None,
+    retries: int = 5,
+) -> str:
+    """Download the HAPI database.
+
+    The database is stored in a GCP bucket named hapi-data. All model predictions are
+    stored in hapi.tar.gz (Compressed size: 205.3MB, Full size: 1.2GB). This function
+    streams the archive and extracts it on the fly, so the archive itself is never
+    written to disk and extraction overlaps with the transfer. If the connection
+    drops, the transfer is resumed from where it left off with an HTTP Range request.
+
+    The archive is verified against its SHA-256 checksum, which is published next to
+    the archive at ``{url}.sha256``. The extracted files are only moved into
+    `data_dir` once the checksum has been verified.
+
+    Use the `task`, `dataset`, `api`, and `date` parameters to only extract a subset
+    of the database, with the same semantics as in :func:`hapi.get_predictions`.
+    Members of the archive that don't match are skipped without being written to
+    disk (the archive is gzip-compressed, so they are still decompressed), and
+    ``meta.csv`` is pruned to the extracted prediction files, with a warning. Calling
+    this function again with other filters adds to the previously downloaded subset.
+
+    Args:
+        data_dir (str, optional): Directory to download. Defaults to None, in which case
+            `config.data_dir` is used. If `config.data_dir` is not set, then the default
+            directory is used: `~/.hapi`.
+        task (Union[str, List[str]]): The task(s) to extract. If None, all tasks are
+            extracted. Default is None.
+        dataset (Union[str, List[str]]): The dataset(s) to extract. If None, all
+            datasets are extracted. Default is None.
+        api (Union[str, List[str]]): The API(s) to extract. If None, all APIs are
+            extracted. Default is None.
+        date (Union[str, List[str]]): The date(s) to extract in format "y-m-d". If
+            None, all dates are extracted. Default is None.
+        url (str, optional): The URL of the archive. Defaults to the hapi-data bucket.
+        checksum (str, optional): The expected SHA-256 hex digest of the archive.
+            Defaults to None, in which case the checksum published at
+            ``{url}.sha256`` is used. If no checksum is published, a warning is
+            raised and the archive is not verified.
+        retries (int, optional): The number of times to resume the transfer after
+            the connection drops. Defaults to 5.
+
+    Raises:
+        ValueError: If the checksum of the archive does not match.
+
+    Returns:
+        str: The path to the downloaded data.
+    """
+    if data_dir is None:
+        from . import config
+
+        data_dir = config._data_dir
+
+    os.makedirs(data_dir, exist_ok=True)
+
+    if checksum is None:
+        checksum = _published_checksum(url)
+
+    filters = {"task": task, "dataset": dataset, "api": api, "date": date}
+    partial = any(value is not None for value in filters.values())
+
+    with tempfile.TemporaryDirectory(dir=data_dir, prefix=".download-") as tmp_dir:
+        with ResumableStream(url, retries=retries) as stream:
+            buffered = io.BufferedReader(stream, CHUNK_SIZE)
+            with tarfile.open(fileobj=buffered, mode="r|gz") as tar:
+                for member in tar:
+                    if not partial or _member_matches(member, **filters):
+                        _extract(tar, member, tmp_dir)
+            stream.drain()
+
+        if checksum is not None and stream.hexdigest() != checksum.lower():
+            raise ValueError(
+                f"Checksum mismatch for '{url}': expected {checksum}, got "
+                f"{stream.hexdigest()}. Please try downloading again."
+            )
+        _move_tree(tmp_dir, data_dir)
+
+    if partial:
+        _prune_meta(data_dir)
+    return data_dir
+
+
+def update(
+    data_dir: str = None,
+    task: Union[str, List[str]] = None,
+    dataset: Union[str, List[str]] = None,
+    api: Union[str, List[str]] = None,
+    date: Union[str, List[str]] = None,
+    url: str = MANIFEST_URL,
+    workers: int = 8,
+    retries: int = 5,
+) -> List[str]:
+    """Bring a downloaded HAPI database up to date by fetching only the files that
+    are new or have changed.
+
+    The published manifest at `url` lists the SHA-256 digest and size of every file
+    of the database (see :func:`write_manifest`), and the files themselves are
+    published next to it, at the same relative paths (e.g.
+    ``tasks/sa/imdb/google_sa/21-03-17.json``). The manifest is compared to the
+    local ``tasks`` tree, and the missing or outdated files are fetched over a pool
+    of `workers` concurrent connections, verified against their digest and moved
+    into place. ``meta.csv`` is replaced last, so the rest of the package never sees
+    predictions whose files haven't arrived yet.
+
+    The digests of local files are kept in ``{data_dir}/.hapi-manifest.json`` and
+    only recomputed for files whose size or modification time changed, so an update
+    that finds nothing new reads no prediction file and only fetches the manifest.
+
+    Use the `task`, `dataset`, `api`, and `date` parameters to only update a subset
+    of the database, with the same semantics as in :func:`hapi.download`. The
+    ``meta.csv`` of a subset is pruned to the downloaded files, so it is compared to
+    the manifest through the digest of the published ``meta.csv`` it was pruned
+    from, and only fetched again when that changes or other files were fetched.
+
+    Derived artifacts that are built from the fetched files become out of date. The
+    prediction tensors of the datasets of the fetched files (see
+    :func:`hapi.build_prediction_tensor`) are deleted. The columnar store, the
+    SQLite index and the per-file statistics record the signature of every file
+    they were built from, so they read the fetched files from JSON, skip them or
+    mark them as missing until :func:`hapi.compile_store`, :func:`hapi.build_index`
+    or :func:`hapi.build_stats` is run again.
+
+    Args:
+        data_dir (str, optional): Directory holding the downloaded database. Defaults
+            to None, in which case `config.data_dir` is used.
+        task (Union[str, List[str]]): The task(s) to update. If None, all tasks are
+            updated. Default is None.
+        dataset (Union[str, List[str]]): The dataset(s) to update. If None, all
+            datasets are updated. Default is None.
+        api (Union[str, List[str]]): The API(s) to update. If None, all APIs are
+            updated. Default is None.
+        date (Union[str, List[str]]): The date(s) to update in format "y-m-d". If
+            None, all dates are updated. Default is None.
+        url (str, optional): The URL of the manifest. Defaults to the hapi-data
+            bucket.
+        workers (int, optional): The maximum number of concurrent connections.
+            Defaults to 8.
+        retries (int, optional): The number of times to resume the transfer of a
+            file after the connection drops. Defaults to 5.
+
+    Raises:
+        ValueError: If the digest of a fetched file does not match the manifest.
+
+    Returns:
+        List[str]: The paths of the fetched files, relative to `data_dir`.
+    """
+    from .parallel import map_ordered
+
+    if data_dir is None:
+        from . import config
+
+        data_dir = config._data_dir
+
+    with urlopen(url, timeout=TIMEOUT) as response:
+        manifest = json.load(response)["files"]
+
+    filters = {"task": task, "dataset": dataset, "api": api, "date": date}
+    partial = any(value is not None for value in filters.values())
+    selected = {
+        path: entry
+        for path, entry in manifest.items()
+        if not partial or _path_matches(path, **filters)
+    }
+
+    local = _read_local_manifest(data_dir)
+    outdated = [
+        path
+        for path, entry in selected.items()
+        if _local_digest(data_dir, path, local) != entry["sha256"]
+    ]
+    # meta.csv goes last, once the files it lists are in place. It is also fetched
+    # again whenever other files are, since a pruned one doesn't list them
+    files = [path for path in outdated if os.path.basename(path) != "meta.csv"]
+    meta = [
+        path
+        for path in selected
+        if os.path.basename(path) == "meta.csv" and (path in outdated or files)
+    ]
+
+    def fetch(path: str):
+        _fetch_file(urljoin(url, quote(path)), data_dir, path, selected[path], retries)
+        local[path] = _local_entry(data_dir, path, selected[path]["sha256"])
+
+    try:
+        map_ordered(fetch, files, workers=workers, executor="thread")
+        for path in meta:
+            fetch(path)
+        if partial and meta:
+            _prune_meta(data_dir)
+            # record the digest of the published meta.csv the local one was pruned
+            # from, so that it only counts as outdated once the published one changes
+            for path in meta:
+                local[path] = _local_entry(data_dir, path, selected[path]["sha256"])
+    finally:
+        # record what has been fetched so far, even if a transfer failed
+        _write_local_manifest(data_dir, local)
+        _invalidate_tensors(data_dir, files)
+    return files + meta
+
+
+def write_manifest(data_dir: str = None) -> str:
+    """Write the manifest that :func:`update` compares against, listing the SHA-256
+    digest and size of every file of the database in ``{data_dir}/tasks``.
+
+    Hidden files (e.g. the manifest of :mod:`hapi.convert`) are not listed. The
+    manifest is written to ``{data_dir}/manifest.json``. Publish it along with the
+    ``tasks`` tree, at the same relative paths.
+
+    Args:
+        data_dir (str, optional): Directory holding the database. Defaults to None,
+            in which case `config.data_dir` is used.
+
+    Returns:
+        str: The path to the manifest.
+    """
+    if data_dir is None:
+        from . import config
+
+        data_dir = config._data_dir
+
+    files = {}
+    for root, _, names in os.walk(os.path.join(data_dir, "tasks")):
+        for name in sorted(names):
+            if name.startswith("."):
+                continue
+            path = os.path.relpath(os.path.join(root, name), data_dir)
+            path = path.replace(os.sep, "/")
+            files[path] = {
+                "sha256": _file_digest(os.path.join(data_dir, path)),
+                "size": os.path.getsize(os.path.join(data_dir, path)),
+            }
+
+    manifest_path = os.path.join(data_dir, "manifest.json")
+    with open(manifest_path, "w") as f:
+        json.dump({"files": dict(sorted(files.items()))}, f, indent=1)
+    return manifest_path
+
+
+class ResumableStream(io.RawIOBase):
+    """A readable binary stream over the body of an HTTP response that reconnects
+    with a Range request when the connection drops.
+
+    The stream computes the SHA-256 digest of the bytes read and reports progress
+    and throughput with a progress bar.
+
+    Args:
+        url (str): The URL to stream.
+        retries (int, optional): The number of times to reconnect before giving up.
+            Defaults to 5.
+        progress (bool, optional): Whether to show a progress bar. Defaults to True.
+    """
+
+    def __init__(self, url: str, retries: int = 5, progress: bool = True):
+        self.url = url
+        self.retries = retries
+        self.offset = 0
+        self._sha256 = hashlib.sha256()
+        self._response = urlopen(Request(url), timeout=TIMEOUT)
+        length = self._response.headers.get("Content-Length")
+        self.total = int(length) if length is not None else None
+        self._progress = tqdm(
+            total=self.total,
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+            disable=not progress,
+        )
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while True:
+            try:
+                n = self._response.readinto(buffer)
+            except (OSError, http.client.HTTPException) as e:
+                self._reconnect(e)
+                continue
+
+            if n == 0 and self.total is not None and self.offset < self.total:
+                # the server closed the connection before sending the full body
+                self._reconnect(
+                    http.client.IncompleteRead(b"", self.total - self.offset)
+                )
+                continue
+
+            self._sha256.update(memoryview(buffer)[:n])
+            self.offset += n
+            self._progress.update(n)
+            return n
+
+    def drain(self):
+        """Read the rest of the body (e.g. the padding at the end of an archive), so
+        that the digest covers all of it.
+        """
+        buffer = bytearray(CHUNK_SIZE)
+        while self.readinto(buffer):
+            pass
+
+    def hexdigest(self) -> str:
+        return self._sha256.hexdigest()
+
+    def close(self):
+        if not self.closed:
+            self._response.close()
+            self._progress.close()
+        super().close()
+
+    def _reconnect(self, error: Exception):
+        self._response.close()
+        for _ in range(self.retries):
+            self.retries -= 1
+            try:
+                response = urlopen(
+                    Request(self.url, headers={"Range": f"bytes={self.offset}-"}),
+                    timeout=TIMEOUT,
+                )
+            except (OSError, http.client.HTTPException) as e:
+                error = e
+                continue
+
+            if response.status == 200:
+                # the server ignored the Range header, so skip what we already have
+                remaining = self.offset
+                while remaining > 0:
+                    skipped = len(response.read(min(remaining, CHUNK_SIZE)))
+                    if skipped == 0:
+                        break
+                    remaining -= skipped
+                if remaining > 0:
+                    response.close()
+                    continue
+            elif response.status != 206 or not response.headers.get(
+                "Content-Range", ""
+            ).startswith(f"bytes {self.offset}-"):
+                response.close()
+                raise ValueError(
+                    f"Could not resume the download of '{self.url}' at byte "
+                    f"{self.offset}: unexpected response {response.status}."
+                )
+
+            self._response = response
+            return
+        raise error
+
+
+def _published_checksum(url: str) -> Optional[str]:
+    try:
+        with urlopen(url + ".sha256", timeout=TIMEOUT) as response:
+            # same format as the output of `sha256sum`: "{digest}  {filename}"
+            return response.read().decode("utf-8").split()[0]
+    except HTTPError as e:
+        if e.code != 404:
+            raise
+    warnings.warn(
+        f"No checksum is published for '{url}', the download will not be verified."
+    )
+    return None
+
+
+def _member_matches(member: tarfile.TarInfo, **filters: Union[str, List[str]]) -> bool:
+    """Whether a member of the archive is needed for the predictions selected by
+    `filters`.
+    """
+    # directories are created as needed when extracting the files in them
+    return member.isfile() and _path_matches(member.name, **filters)
+
+
+def _path_matches(path: str, **filters: Union[str, List[str]]) -> bool:
+    """Whether a file of the database is needed for the predictions selected by
+    `filters`. Files are laid out as ``tasks/meta.csv``,
+    ``tasks/{task}/{dataset}/labels.json`` and
+    ``tasks/{task}/{dataset}/{api}/{date}.json``.
+    """
+    parts = path.split("/")
+    if parts[-1] == "meta.csv":
+        return True
+    if len(parts) == 4 and parts[-1] == "labels.json":
+        keys = {"task": parts[1], "dataset": parts[2]}
+    elif len(parts) == 5:
+        keys = {
+            "task": parts[1],
+            "dataset": parts[2],
+            "api": parts[3],
+            "date": os.path.splitext(parts[4])[0],
+        }
+    else:
+        return False
+
+    for column, value in filters.items():
+        if value is None or column not in keys:
+            continue
+        if keys[column] not in ([value] if isinstance(value, str) else value):
+            return False
+    return True
+
+
+def _prune_meta(data_dir: str):
+    """Drop the rows of ``meta.csv`` whose prediction files haven't been extracted,
+    so that the rest of the package only sees the downloaded subset. Warns if any
+    row is dropped, since ``meta.csv`` then no longer lists the whole database.
+    """
+    meta_path = os.path.join(data_dir, "tasks", "meta.csv")
+    df = pd.read_csv(meta_path)
+    pruned = df[
+        [os.path.exists(os.path.join(data_dir, "tasks", path)) for path in df["path"]]
+    ]
+    pruned.to_csv(meta_path, index=False)
+    if len(pruned) < len(df):
+        warnings.warn(
+            f"Pruned meta.csv to the {len(pruned)} downloaded prediction files, "
+            f"{len(df) - len(pruned)} prediction files of the published database "
+            "are not listed. Download or update without filters to get all of them."
+        )
+
+
+def _extract(tar: tarfile.TarFile, member: tarfile.TarInfo, path: str):
+    if hasattr(tarfile, "data_filter"):
+        tar.extract(member, path, filter="data")
+        return
+
+    # older Pythons don't support extraction filters, so at least make sure the
+    # member doesn't end up outside of `path`
+    target = os.path.realpath(os.path.join(path, member.name))
+    if not (member.isfile() or member.isdir()) or os.path.commonpath(
+        [target, os.path.realpath(path)]
+    ) != os.path.realpath(path):
+        raise ValueError(f"Refusing to extract unsafe archive member '{member.name}'.")
+    tar.extract(member, path)
+
+
+def _move_tree(src_dir: str, dst_dir: str):
+    """Move every file in `src_dir` to the same relative path in `dst_dir`,
+    replacing existing files.
+    """
+    for root, _, files in os.walk(src_dir):
+        rel_root = os.path.relpath(root, src_dir)
+        os.makedirs(os.path.join(dst_dir, rel_root), exist_ok=True)
+        for file in files:
+            os.replace(os.path.join(root, file), os.path.join(dst_dir, rel_root, file))
+
+
+def _fetch_file(url: str, data_dir: str, path: str, entry: Dict, retries: int):
+    """Fetch one file of the database into `data_dir`, replacing the local file
+    only once its digest has been verified.
+    """
+    dst = os.path.join(data_dir, *path.split("/"))
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dst), prefix=".update-")
+    try:
+        with os.fdopen(fd, "wb") as f, ResumableStream(
+            url, retries=retries, progress=False
+        ) as stream:
+            buffer = bytearray(CHUNK_SIZE)
+            view = memoryview(buffer)
+            while True:
+                n = stream.readinto(buffer)
+                if not n:
+                    break
+                f.write(view[:n])
+        if stream.hexdigest() != entry["sha256"]:
+            raise ValueError(
+                f"Checksum mismatch for '{url}': expected {entry['sha256']}, got "
+                f"{stream.hexdigest()}. Please try updating again."
+            )
+        os.replace(tmp_path, dst)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _invalidate_tensors(data_dir: str, paths: List[str]):
+    """Delete the prediction tensors of the datasets of the fetched files."""
+    from .tensor import TENSOR_DIR
+
+    for path in paths:
+        parts = path.split("/")
+        if len(parts) in [4, 5]:
+            tensor_dir = os.path.join(data_dir, TENSOR_DIR, parts[1], parts[2])
+            shutil.rmtree(tensor_dir, ignore_errors=True)
+
+
+def _file_digest(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _local_entry(data_dir: str, path: str, sha256: str) -> Dict:
+    stat = os.stat(os.path.join(data_dir, path))
+    return {"sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _local_digest(data_dir: str, path: str, local: Dict[str, Dict]) -> Optional[str]:
+    """The digest of a local file, or None if it doesn't exist. Digests recorded in
+    `local` are reused if the file hasn't changed since, and updated otherwise.
+    """
+    full_path = os.path.join(data_dir, path)
+    if not os.path.exists(full_path):
+        return None
+    stat = os.stat(full_path)
+    entry = local.get(path)
+    if (
+        entry is None
+        or entry["size"] != stat.st_size
+        or entry["mtime_ns"] != stat.st_mtime_ns
+    ):
+        local[path] = entry = _local_entry(data_dir, path, _file_digest(full_path))
+    return entry["sha256"]
+
+
+def _read_local_manifest(data_dir: str) -> Dict[str, Dict]:
+    path = os.path.join(data_dir, LOCAL_MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_local_manifest(data_dir: str, local: Dict[str, Dict]):
+    path = os.path.join(data_dir, LOCAL_MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(local, f)
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,403 @@
+import json
+import os
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterator, List, Union
+
+from .store import _file_signature, _labels_path, _meta_signature
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+INDEX_FILE = "hapi.sqlite"
+
+# above this many examples, looking them up in the index is slower than filtering
+# the prediction files, so `get_predictions` reads the files instead
+MAX_LOOKUP_EXAMPLES = 10_000
+
+# filters with more values than this are joined against a temporary table instead
+# of being passed as parameters, of which SQLite allows only 999 in older versions
+MAX_PARAMS = 500
+
+# the keys of a prediction that get their own column, any other keys (e.g.
+# "context") are kept in the "record" column
+PREDICTION_KEYS = {"example_id", "predicted_label", "confidence"}
+
+SCHEMA = """
+CREATE TABLE manifest (
+    meta_mtime_ns INTEGER NOT NULL,
+    meta_size INTEGER NOT NULL
+);
+CREATE TABLE sources (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER
+);
+CREATE TABLE files (
+    file_id INTEGER PRIMARY KEY,
+    task TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    api TEXT NOT NULL,
+    date TEXT NOT NULL,
+    path TEXT NOT NULL,
+    cost_per_10k REAL
+);
+CREATE TABLE examples (
+    example_id INTEGER PRIMARY KEY,
+    task TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    name TEXT NOT NULL,
+    UNIQUE (task, dataset, name)
+);
+CREATE TABLE predictions (
+    file_id INTEGER NOT NULL REFERENCES files (file_id),
+    example_id INTEGER NOT NULL REFERENCES examples (example_id),
+    predicted_label TEXT,
+    confidence REAL,
+    record TEXT
+);
+CREATE TABLE labels (
+    example_id INTEGER PRIMARY KEY REFERENCES examples (example_id),
+    true_label TEXT
+);
+"""
+
+# created after the tables are filled, which is faster than updating them on insert
+INDEXES = """
+CREATE INDEX examples_name ON examples (name);
+CREATE INDEX predictions_example ON predictions (example_id);
+CREATE INDEX predictions_file ON predictions (file_id);
+CREATE INDEX files_api ON files (api);
+CREATE INDEX files_date ON files (date);
+"""
+
+
+def build_index(data_dir: str = None) -> str:
+    """Build a SQLite index of the extracted HAPI database for fast lookups of
+    individual examples.
+
+    The index is written to ``{data_dir}/hapi.sqlite`` and holds normalized
+    tables of the prediction files (the rows of ``meta.csv``), the examples, the
+    predictions and the labels, indexed on the example id, the api and the date.
+    Once built, it is used by :func:`hapi.query` and by :func:`hapi.get_predictions`
+    when the `example_id` filter is passed. Like the columnar store, the index is
+    tied to the ``meta.csv`` it was built from and to the size and modification time
+    of every prediction and label file, and is ignored for any selection that
+    includes a file that changed since (e.g. with :func:`hapi.update`), so re-run
+    this function after updating the database.
+
+    Args:
+        data_dir (str, optional): Directory holding the downloaded database. Defaults
+            to None, in which case `config.data_dir` is used.
+
+    Returns:
+        str: The path to the index.
+    """
+    from . import config, meta
+
+    if data_dir is None:
+        data_dir = config.data_dir
+
+    tasks_dir = os.path.join(data_dir, "tasks")
+    meta_path = os.path.join(tasks_dir, "meta.csv")
+    rows = meta.get_index(data_dir).rows
+
+    path = os.path.join(data_dir, INDEX_FILE)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.executescript(SCHEMA)
+
+        # recorded before reading the files, so a file that changes while the
+        # index is being built makes it stale
+        paths = [
+            _labels_path(task, dataset)
+            for task, dataset in dict.fromkeys(
+                (row["task"], row["dataset"]) for row in rows
+            )
+        ] + [row["path"] for row in rows]
+        conn.executemany(
+            "INSERT INTO sources VALUES (?, ?, ?)",
+            (
+                (path, *(_file_signature(tasks_dir, path) or [None, None]))
+                for path in paths
+            ),
+        )
+
+        example_ids: Dict[tuple, int] = {}
+
+        def intern(task: str, dataset: str, names: List[str]) -> List[int]:
+            new = []
+            for name in names:
+                key = (task, dataset, name)
+                if key not in example_ids:
+                    example_ids[key] = len(example_ids) + 1
+                    new.append((example_ids[key], task, dataset, name))
+            conn.executemany("INSERT INTO examples VALUES (?, ?, ?, ?)", new)
+            return [example_ids[(task, dataset, name)] for name in names]
+
+        for task, dataset in dict.fromkeys(
+            (row["task"], row["dataset"]) for row in rows
+        ):
+            with open(os.path.join(tasks_dir, task, dataset, "labels.json")) as f:
+                labels = json.load(f)
+            ids = intern(task, dataset, [label["example_id"] for label in labels])
+            conn.executemany(
+                "INSERT OR REPLACE INTO labels VALUES (?, ?)",
+                (
+                    (example_id, json.dumps(label["true_label"]))
+                    for example_id, label in zip(ids, labels)
+                ),
+            )
+
+        for file_id, row in enumerate(rows, start=1):
+            conn.execute(
+                "INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    file_id,
+                    row["task"],
+                    row["dataset"],
+                    row["api"],
+                    row["date"],
+                    row["path"],
+                    row.get("cost_per_10k"),
+                ),
+            )
+            with open(os.path.join(tasks_dir, row["path"])) as f:
+                preds = json.load(f)
+            ids = intern(
+                row["task"], row["dataset"], [pred["example_id"] for pred in preds]
+            )
+            conn.executemany(
+                "INSERT INTO predictions VALUES (?, ?, ?, ?, ?)",
+                (
+                    (
+                        file_id,
+                        example_id,
+                        json.dumps(pred.get("predicted_label")),
+                        pred.get("confidence"),
+                        json.dumps(pred) if pred.keys() - PREDICTION_KEYS else None,
+                    )
+                    for example_id, pred in zip(ids, preds)
+                ),
+            )
+
+        conn.executescript(INDEXES)
+        # the manifest is written last, so an interrupted build is never picked up
+        signature = _meta_signature(meta_path)
+        conn.execute(
+            "INSERT INTO manifest VALUES (?, ?)",
+            (signature["meta_mtime_ns"], signature["meta_size"]),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    return path
+
+
+def has_index(data_dir: str, rows: List[Dict] = None) -> bool:
+    """Whether an index built from the current ``meta.csv`` exists in `data_dir`,
+    and none of the prediction files listed in `rows` (rows of ``meta.csv``, all of
+    them if None) or their labels changed since it was built.
+    """
+    path = os.path.join(data_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return False
+    if rows is None:
+        from . import meta
+
+        rows = meta.get_index(data_dir).rows
+    with _connect(data_dir) as conn:
+        row = conn.execute("SELECT meta_mtime_ns, meta_size FROM manifest").fetchone()
+        try:
+            sources = {
+                path: [size, mtime_ns]
+                for path, size, mtime_ns in conn.execute("SELECT * FROM sources")
+            }
+        except sqlite3.OperationalError:
+            # indexes built before file signatures were recorded can't be checked
+            return False
+    signature = _meta_signature(os.path.join(data_dir, "tasks", "meta.csv"))
+    if row != (signature["meta_mtime_ns"], signature["meta_size"]):
+        return False
+
+    tasks_dir = os.path.join(data_dir, "tasks")
+    paths = {_labels_path(row["task"], row["dataset"]) for row in rows}
+    paths.update(row["path"] for row in rows)
+    return all(
+        sources.get(path) is not None
+        and sources[path] == _file_signature(tasks_dir, path)
+        for path in paths
+    )
+
+
+def should_read(
+    data_dir: str, rows: List[Dict], example_id: Union[str, List[str]]
+) -> bool:
+    """Whether to read the predictions on `example_id` in the prediction files
+    listed in `rows` from the index rather than filtering the files: the index must
+    be up to date for `rows`, and at most `MAX_LOOKUP_EXAMPLES` examples looked up.
+    """
+    n_examples = 1 if isinstance(example_id, str) else len(set(example_id))
+    return n_examples <= MAX_LOOKUP_EXAMPLES and has_index(data_dir, rows)
+
+
+def query(
+    example_id: Union[str, List[str]] = None,
+    task: Union[str, List[str]] = None,
+    dataset: Union[str, List[str]] = None,
+    api: Union[str, List[str]] = None,
+    date: Union[str, List[str]] = None,
+) -> "pd.DataFrame":
+    """Look up predictions and labels in the SQLite index built with
+    :func:`hapi.build_index`, without loading any prediction file.
+
+    Every filter takes either a single value or a list of values, and rows must
+    match all of the filters that are not None. For example, to get the prediction
+    of every API on every date for one example:
+
+    .. code-block:: python
+
+        hapi.query(example_id="COMMAND_004ae714_nohash_0", dataset="command")
+
+    Args:
+        example_id (Union[str, List[str]]): The example(s) to include. If None, all
+            examples are included. Default is None.
+        task (Union[str, List[str]]): The task(s) to include. If None, all tasks are
+            included. Default is None.
+        dataset (Union[str, List[str]]): The dataset(s) to include. If None, all
+            datasets are included. Default is None.
+        api (Union[str, List[str]]): The API(s) to include. If None, all APIs are
+            included. Default is None.
+        date (Union[str, List[str]]): The date(s) to include in format "y-m-d". If
+            None, all dates are included. Default is None.
+
+    Raises:
+        ValueError: If no index built from the current ``meta.csv`` exists, or a
+            file of the selected predictions changed since it was built.
+
+    Returns:
+        pd.DataFrame: A dataframe with one row per prediction and the columns
+            "task", "dataset", "api", "date", "example_id", "predicted_label",
+            "confidence" and "true_label" (None for unlabeled examples).
+    """
+    import pandas as pd
+
+    from . import config, meta
+
+    rows = meta.get_index(config.data_dir).select(
+        task=task, dataset=dataset, api=api, date=date
+    )
+    if not has_index(config.data_dir, rows):
+        raise ValueError(
+            "No up-to-date index found. Build it first with `hapi.build_index()`."
+        )
+    results = _select(
+        config.data_dir,
+        example_id=example_id,
+        task=task,
+        dataset=dataset,
+        api=api,
+        date=date,
+    )
+    columns = ["task", "dataset", "api", "date", "example_id"]
+    return pd.DataFrame(
+        [
+            (*key[:5], record.get("predicted_label"), record.get("confidence"), label)
+            for key, record, label in results
+        ],
+        columns=columns + ["predicted_label", "confidence", "true_label"],
+    )
+
+
+def read_predictions(
+    data_dir: str, rows: List[Dict], example_id: Union[str, List[str]]
+) -> Dict[str, List[Dict]]:
+    """Read the predictions on `example_id` in the prediction files listed in `rows`
+    (rows of ``meta.csv``) from the index.
+    """
+    path_to_preds = {os.path.splitext(row["path"])[0]: [] for row in rows}
+    if not rows:
+        return path_to_preds
+    results = _select(
+        data_dir,
+        example_id=example_id,
+        task=list({row["task"] for row in rows}),
+        dataset=list({row["dataset"] for row in rows}),
+    )
+    for key, record, _ in results:
+        preds = path_to_preds.get(os.path.splitext(key[5])[0])
+        if preds is not None:
+            preds.append(record)
+    return path_to_preds
+
+
+def _select(data_dir: str, **filters: Union[str, List[str]]) -> Iterator:
+    """Yield the predictions that match the filters, as tuples of the (task,
+    dataset, api, date, example_id, path) key, the prediction and the true label.
+    """
+    columns = {
+        "example_id": "e.name",
+        "task": "f.task",
+        "dataset": "f.dataset",
+        "api": "f.api",
+        "date": "f.date",
+        "path": "f.path",
+    }
+    conditions, params, tables = [], [], {}
+    for name, value in filters.items():
+        if value is None:
+            continue
+        values = [value] if isinstance(value, str) else list(value)
+        if len(values) > MAX_PARAMS:
+            tables[name] = values
+            conditions.append(f"{columns[name]} IN (SELECT value FROM temp.{name})")
+        else:
+            conditions.append(f"{columns[name]} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+
+    sql = (
+        "SELECT f.task, f.dataset, f.api, f.date, e.name, f.path, "
+        "p.predicted_label, p.confidence, p.record, l.true_label "
+        "FROM predictions p "
+        "JOIN files f ON p.file_id = f.file_id "
+        "JOIN examples e ON p.example_id = e.example_id "
+        "LEFT JOIN labels l ON p.example_id = l.example_id"
+    )
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY p.rowid"
+
+    with _connect(data_dir) as conn:
+        for name, values in tables.items():
+            # temporary tables live outside of the (read-only) index
+            conn.execute(f"CREATE TEMP TABLE {name} (value TEXT PRIMARY KEY)")
+            conn.executemany(
+                f"INSERT OR IGNORE INTO temp.{name} VALUES (?)",
+                [(value,) for value in values],
+            )
+        for row in conn.execute(sql, params):
+            key, (predicted_label, confidence, record, true_label) = row[:6], row[6:]
+            if record is not None:
+                record = json.loads(record)
+            else:
+                record = {
+                    "confidence": confidence,
+                    "predicted_label": json.loads(predicted_label),
+                    "example_id": key[4],
+                }
+            yield key, record, None if true_label is None else json.loads(true_label)
+
+
+def _connect(data_dir: str) -> "closing[sqlite3.Connection]":
+    """Open a read-only connection to the index, which is closed on exit (the
+    context manager of `sqlite3.Connection` itself only commits).
+    """
+    uri = Path(os.path.abspath(os.path.join(data_dir, INDEX_FILE))).as_uri()
+    return closing(sqlite3.connect(f"{uri}?mode=ro", uri=True))
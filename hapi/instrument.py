@@ -0,0 +1,259 @@
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+
+PHASES = ["meta", "open", "parse", "merge"]
+COUNTERS = ["bytes_read", "records", "cache_hits", "cache_misses"]
+
+
+@dataclass
+class CallStats:
+    """The measurements of one call to a public loader.
+
+    Attributes:
+        function (str): The name of the loader, e.g. "get_predictions", or e.g.
+            "aio.get_predictions" for the coroutines of :mod:`hapi.aio`.
+        wall (float): The wall time of the call in seconds. For
+            :func:`hapi.iter_predictions`, only the time spent producing predictions
+            is counted, not the time spent by the consumer between them.
+        phases (Dict[str, float]): The seconds spent in each phase of the call:
+            "meta" (looking up the selected files in ``meta.csv``), "open" (reading
+            files from disk), "parse" (decoding JSON or the columnar store) and
+            "merge" (merging predictions with datasets). Reads in worker processes
+            or threads are measured in the workers, so with several workers the
+            phases can add up to more than `wall`. JSON files are read and parsed
+            incrementally by :func:`hapi.iter_predictions`, so their time is not
+            split into "open" and "parse".
+        bytes_read (int): The number of bytes read from disk.
+        records (int): The number of predictions or labels returned.
+        cache_hits (int): The number of files (or store row groups) read from the
+            in-process cache.
+        cache_misses (int): The number of files (or store row groups) read from disk.
+        profile (pstats.Stats): The cProfile statistics of the call if
+            `config.profile` is set, otherwise None. Coroutines are not profiled.
+    """
+
+    function: str
+    wall: float = 0.0
+    phases: Dict[str, float] = field(
+        default_factory=lambda: {phase: 0.0 for phase in PHASES}
+    )
+    bytes_read: int = 0
+    records: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    profile: object = None
+
+
+_local = threading.local()
+# the coroutine call running in this context, whose work is spread over the event
+# loop and executor threads (see `hapi.aio`)
+_async_call: "contextvars.ContextVar[CallStats]" = contextvars.ContextVar(
+    "hapi_async_call", default=None
+)
+_lock = threading.Lock()
+_hooks: List[Callable[[CallStats], None]] = []
+_totals: Dict[str, Dict[str, float]] = {}
+
+
+def add_hook(hook: Callable[[CallStats], None]) -> Callable[[CallStats], None]:
+    """Register a function that is called with the :class:`CallStats` of every call
+    to a public loader (:func:`hapi.get_predictions`, :func:`hapi.iter_predictions`,
+    :func:`hapi.get_labels`, :func:`hapi.summary` and their coroutine versions in
+    :mod:`hapi.aio`) once it completes, e.g. to export them to a metrics system.
+    Hooks run in the calling thread.
+
+    Returns:
+        Callable[[CallStats], None]: The hook, so that this can be used as a
+        decorator.
+    """
+    with _lock:
+        _hooks.append(hook)
+    return hook
+
+
+def remove_hook(hook: Callable[[CallStats], None]):
+    """Unregister a hook registered with :func:`add_hook`."""
+    with _lock:
+        _hooks.remove(hook)
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    """Get a snapshot of the measurements of the public loaders, summed over all
+    calls since the start of the process (or the last :func:`stats_reset`).
+
+    Returns:
+        Dict[str, Dict[str, float]]: A dictionary mapping the name of each loader
+        that has been called to a flat dictionary with the number of "calls", the
+        total "wall" time, the time spent in each phase ("meta", "open", "parse" and
+        "merge", see :class:`CallStats`) and the "bytes_read", "records",
+        "cache_hits" and "cache_misses" counters.
+    """
+    with _lock:
+        return {function: dict(totals) for function, totals in _totals.items()}
+
+
+def stats_reset():
+    """Reset the measurements returned by :func:`stats`."""
+    with _lock:
+        _totals.clear()
+
+
+def current() -> CallStats:
+    """The :class:`CallStats` of the loader call running in this thread (or in this
+    context, for coroutines), if any.
+    """
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else _async_call.get()
+
+
+def add(phases: Dict[str, float] = None, **counters: int):
+    """Add to the phase timers and counters of the current call, if any."""
+    stack = getattr(_local, "stack", None)
+    if stack:
+        _add(stack[-1], phases, counters)
+        return
+    call = _async_call.get()
+    if call is not None:
+        # a coroutine call is measured from several threads at once
+        with _lock:
+            _add(call, phases, counters)
+
+
+def _add(call: CallStats, phases: Dict[str, float], counters: Dict[str, int]):
+    for phase, seconds in (phases or {}).items():
+        call.phases[phase] += seconds
+    for counter, value in counters.items():
+        setattr(call, counter, getattr(call, counter) + value)
+
+
+@contextmanager
+def phase(name: str):
+    """Time the body of the `with` statement as phase `name` of the current call."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add({name: time.perf_counter() - start})
+
+
+def instrumented(fn: Callable) -> Callable:
+    """Measure every call to a public loader and report it to :func:`stats` and
+    the hooks. Generator functions are measured while they produce items. Coroutine
+    functions are reported under the name of their module (e.g.
+    "aio.get_predictions") and measured across the threads that run their work in a
+    copy of their context.
+    """
+    if inspect.iscoroutinefunction(fn):
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            module = fn.__module__.rsplit(".", 1)[-1]
+            call = CallStats(function=f"{module}.{fn.__name__}")
+            token = _async_call.set(call)
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                call.wall = time.perf_counter() - start
+                _async_call.reset(token)
+                _finish(call, None)
+
+        return wrapper
+
+    if inspect.isgeneratorfunction(fn):
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            call = CallStats(function=fn.__name__)
+            profiler = _start(call)
+            gen = fn(*args, **kwargs)
+            try:
+                while True:
+                    start = time.perf_counter()
+                    _push(call, profiler)
+                    try:
+                        item = next(gen)
+                    except StopIteration:
+                        return
+                    finally:
+                        _pop(call, profiler)
+                        call.wall += time.perf_counter() - start
+                    yield item
+            finally:
+                gen.close()
+                _finish(call, profiler)
+
+        return wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        call = CallStats(function=fn.__name__)
+        profiler = _start(call)
+        start = time.perf_counter()
+        _push(call, profiler)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _pop(call, profiler)
+            call.wall = time.perf_counter() - start
+            _finish(call, profiler)
+
+    return wrapper
+
+
+def _start(call: CallStats):
+    """Create a profiler for `call` if `config.profile` is set and no other call is
+    being profiled in this thread (only one profiler can be active at a time).
+    """
+    from . import config
+
+    if not config.profile or getattr(_local, "profiling", False):
+        return None
+    import cProfile
+
+    return cProfile.Profile()
+
+
+def _push(call: CallStats, profiler):
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    _local.stack.append(call)
+    if profiler is not None:
+        _local.profiling = True
+        profiler.enable()
+
+
+def _pop(call: CallStats, profiler):
+    if profiler is not None:
+        profiler.disable()
+        _local.profiling = False
+    _local.stack.pop()
+
+
+def _finish(call: CallStats, profiler):
+    if profiler is not None:
+        import pstats
+
+        call.profile = pstats.Stats(profiler)
+
+    with _lock:
+        totals = _totals.setdefault(
+            call.function,
+            dict.fromkeys(["calls", "wall"] + PHASES + COUNTERS, 0),
+        )
+        totals["calls"] += 1
+        totals["wall"] += call.wall
+        for name, seconds in call.phases.items():
+            totals[name] += seconds
+        for counter in COUNTERS:
+            totals[counter] += getattr(call, counter)
+        hooks = list(_hooks)
+
+    for hook in hooks:
+        hook(call)
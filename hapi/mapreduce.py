@@ -0,0 +1,331 @@
+import heapq
+import os
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .table import PredictionTable, load_table
+
+KEYS = ["task", "dataset", "api", "date"]
+
+# the number of shards per worker, more shards even out differences in parse speed
+SHARDS_PER_WORKER = 4
+
+# the quantiles of the "confidence_quantiles" aggregate, which are read off a
+# histogram of the confidences with `QUANTILE_BINS` bins over [0, 1]
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+QUANTILE_BINS = 1000
+
+
+@dataclass(frozen=True)
+class Aggregator:
+    """An aggregate computed with map-reduce over prediction files.
+
+    `map` computes a partial result for every prediction file, and `reduce` merges
+    two partial results. Because partial results are merged in an arbitrary order,
+    `reduce` must be associative and commutative. To run on a process pool, the
+    functions must be picklable (i.e. defined at the top level of a module).
+
+    Attributes:
+        name (str): The name of the column holding the aggregate.
+        map (Callable[[PredictionTable, np.ndarray], Any]): Computes the partial
+            result of one prediction file from its table and the true label of each
+            of its rows (an object array, with None for unlabeled examples).
+        reduce (Callable[[Any, Any], Any]): Merges two partial results.
+        finalize (Callable[[Any], Any], optional): Turns the merged partial result
+            into the aggregate. Defaults to None, in which case the merged partial
+            result is the aggregate.
+    """
+
+    name: str
+    map: Callable[[PredictionTable, np.ndarray], Any]
+    reduce: Callable[[Any, Any], Any]
+    finalize: Callable[[Any], Any] = None
+
+
+def aggregate(
+    fn: Union[str, Callable, Aggregator, Sequence[Union[str, Callable, Aggregator]]],
+    by: Union[str, List[str]] = None,
+    task: Union[str, List[str]] = None,
+    dataset: Union[str, List[str]] = None,
+    api: Union[str, List[str]] = None,
+    date: Union[str, List[str]] = None,
+    workers: int = None,
+) -> pd.DataFrame:
+    """Compute aggregates over the prediction files of the database with map-reduce
+    on a process pool.
+
+    The selected prediction files are partitioned into shards of about the same
+    total size on disk, and every shard is mapped in a worker process: its files are
+    read as :class:`~hapi.table.PredictionTable` and reduced to one partial result
+    per group. Only the partial results are sent back and merged, so aggregating the
+    full database scales with the number of cores and never holds more than one
+    prediction file per worker in memory.
+
+    The builtin aggregates are:
+
+    - "count": the number of predictions.
+    - "accuracy": the fraction of correct predictions among the labeled examples of
+      single-label tasks (NaN for multi-label tasks).
+    - "mean_confidence": the mean of the confidences that are not missing.
+    - "confidence_quantiles": a dictionary mapping each of the `QUANTILES` to the
+      quantile of the confidences that are not missing, to within 0.001.
+    - "label_histogram": a dictionary mapping each predicted label to its count.
+
+    A function is aggregated by summing its results, e.g. with
+
+    .. code-block:: python
+
+        def n_confident(table, true_label):
+            return int((table.confidence > 0.9).sum())
+
+        hapi.aggregate(["count", n_confident], by=["task", "api"])
+
+    Args:
+        fn (Union[str, Callable, Aggregator, Sequence]): The aggregate(s) to
+            compute: the name of a builtin aggregate, a function that takes a
+            :class:`~hapi.table.PredictionTable` and the true labels of its rows
+            and returns a number (or another value that can be added with ``+``),
+            an :class:`Aggregator`, or a list of them.
+        by (Union[str, List[str]], optional): The column(s) among "task",
+            "dataset", "api" and "date" to group by. Defaults to None, in which
+            case every prediction file is a group.
+        task (Union[str, List[str]]): The task(s) to include. If None, all tasks are
+            included. Default is None.
+        dataset (Union[str, List[str]]): The dataset(s) to include. If None, all
+            datasets are included. Default is None.
+        api (Union[str, List[str]]): The API(s) to include. If None, all APIs are
+            included. Default is None.
+        date (Union[str, List[str]]): The date(s) to include in format "y-m-d". If
+            None, all dates are included. Default is None.
+        workers (int, optional): The number of worker processes. If 1, the files
+            are aggregated in the calling process. Defaults to None, in which case
+            one worker per CPU is used.
+
+    Raises:
+        ValueError: If an unknown builtin aggregate or grouping column is passed.
+
+    Returns:
+        pd.DataFrame: A dataframe with one row per group, in the order of
+            ``meta.csv``, the `by` columns and one column per aggregate.
+    """
+    from . import _select, config
+
+    aggregators = [
+        _aggregator(item)
+        for item in ([fn] if isinstance(fn, (str, Aggregator)) or callable(fn) else fn)
+    ]
+    by = KEYS if by is None else [by] if isinstance(by, str) else list(by)
+    for column in by:
+        if column not in KEYS:
+            raise ValueError(
+                f"Unknown column '{column}'. Please pass one or more of the "
+                f"following: {KEYS}"
+            )
+    rows = _select(task=task, dataset=dataset, api=api, date=date)
+    groups = _aggregate(config.data_dir, rows, aggregators, by, workers)
+
+    records = []
+    for group, values in groups.items():
+        record = dict(zip(by, group))
+        for aggregator, value in zip(aggregators, values):
+            record[aggregator.name] = value
+        records.append(record)
+    return pd.DataFrame(records, columns=by + [agg.name for agg in aggregators])
+
+
+def _aggregate(
+    data_dir: str,
+    rows: List[Dict],
+    aggregators: List[Aggregator],
+    by: List[str],
+    workers: int = None,
+) -> Dict[tuple, List]:
+    """Aggregate the prediction files listed in `rows` (rows of ``meta.csv``),
+    returning the finalized aggregates of every group, in the order of `rows`.
+    """
+    from .parallel import map_ordered
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    groups: Dict[tuple, List] = dict.fromkeys(
+        tuple(row[column] for column in by) for row in rows
+    )
+    paths = [os.path.join(data_dir, "tasks", row["path"]) for row in rows]
+    shards = _shards(
+        [os.path.getsize(path) for path in paths],
+        min(len(rows), workers * SHARDS_PER_WORKER),
+    )
+    results = map_ordered(
+        _map_shard,
+        [(data_dir, [rows[i] for i in shard], aggregators, by) for shard in shards],
+        workers=workers,
+        executor="process",
+    )
+    for partials in results:
+        for group, values in partials.items():
+            groups[group] = _merge(aggregators, groups[group], values)
+
+    return {
+        group: [
+            value if aggregator.finalize is None else aggregator.finalize(value)
+            for aggregator, value in zip(aggregators, values)
+        ]
+        for group, values in groups.items()
+    }
+
+
+def _aggregator(fn: Union[str, Callable, Aggregator]) -> Aggregator:
+    if isinstance(fn, Aggregator):
+        return fn
+    if isinstance(fn, str):
+        if fn not in BUILTINS:
+            raise ValueError(
+                f"Unknown aggregate '{fn}'. Please pass one of the following: "
+                f"{list(BUILTINS)}, a function or an `Aggregator`."
+            )
+        return BUILTINS[fn]
+    return Aggregator(name=fn.__name__, map=fn, reduce=_add)
+
+
+def _shards(sizes: List[int], n_shards: int) -> List[List[int]]:
+    """Partition files into `n_shards` shards of about the same total size, by
+    assigning the largest remaining file to the smallest shard. The files of each
+    shard are kept in their original order.
+    """
+    shards = [[] for _ in range(n_shards)]
+    heap = [(0, i) for i in range(n_shards)]
+    for position in sorted(range(len(sizes)), key=lambda p: -sizes[p]):
+        size, i = heapq.heappop(heap)
+        shards[i].append(position)
+        heapq.heappush(heap, (size + sizes[position], i))
+    return [sorted(shard) for shard in shards if shard]
+
+
+def _map_shard(
+    item: Tuple[str, List[Dict], List[Aggregator], List[str]]
+) -> Dict[tuple, List]:
+    """Map the prediction files of a shard and merge their partial results per
+    group. Runs in a worker process.
+    """
+    data_dir, rows, aggregators, by = item
+    tasks_dir = os.path.join(data_dir, "tasks")
+
+    labels: Dict[tuple, Tuple[pd.Index, np.ndarray]] = {}
+    partials: Dict[tuple, List] = {}
+    for row in rows:
+        dataset_key = (row["task"], row["dataset"])
+        if dataset_key not in labels:
+            labels[dataset_key] = _read_labels(
+                os.path.join(tasks_dir, row["task"], row["dataset"], "labels.json")
+            )
+        example_index, true_labels = labels[dataset_key]
+
+        table, _, _ = load_table(os.path.join(tasks_dir, row["path"]))
+        # the true label of every row, unlabeled examples index the appended None
+        positions = example_index.get_indexer(table.example_ids)
+        true_label = np.append(true_labels, None)[positions[table.example]]
+
+        group = tuple(row[column] for column in by)
+        values = [aggregator.map(table, true_label) for aggregator in aggregators]
+        partials[group] = _merge(aggregators, partials.get(group), values)
+    return partials
+
+
+def _read_labels(path: str) -> Tuple[pd.Index, np.ndarray]:
+    import json
+
+    if not os.path.exists(path):
+        return pd.Index([]), np.empty(0, dtype=object)
+    with open(path) as f:
+        labels = json.load(f)
+    true_labels = np.empty(len(labels), dtype=object)
+    true_labels[:] = [label["true_label"] for label in labels]
+    return pd.Index([label["example_id"] for label in labels]), true_labels
+
+
+def _merge(aggregators: List[Aggregator], a: List, b: List) -> List:
+    if a is None:
+        return b
+    return [aggregator.reduce(x, y) for aggregator, x, y in zip(aggregators, a, b)]
+
+
+def _add(a, b):
+    return a + b
+
+
+def _add_pairs(a: Tuple, b: Tuple) -> Tuple:
+    return tuple(x + y for x, y in zip(a, b))
+
+
+def _ratio(pair: Tuple) -> float:
+    numerator, denominator = pair
+    return numerator / denominator if denominator else np.nan
+
+
+def _count(table: PredictionTable, true_label: np.ndarray) -> int:
+    return len(table)
+
+
+def _accuracy(table: PredictionTable, true_label: np.ndarray) -> Tuple[int, int]:
+    if table.label_offsets is not None:
+        return 0, 0
+    labeled = ~pd.isna(true_label)
+    # labels that are never predicted are -1, and can't match a predicted label
+    true = pd.Index(table.classes, dtype=object).get_indexer(true_label[labeled])
+    predicted = table.predicted_label[labeled]
+    return int(((true >= 0) & (predicted == true)).sum()), int(labeled.sum())
+
+
+def _mean_confidence(
+    table: PredictionTable, true_label: np.ndarray
+) -> Tuple[float, int]:
+    present = ~np.isnan(table.confidence)
+    return float(table.confidence[present].sum(dtype=np.float64)), int(present.sum())
+
+
+def _confidence_histogram(table: PredictionTable, true_label: np.ndarray) -> np.ndarray:
+    confidence = table.confidence[~np.isnan(table.confidence)]
+    bins = np.clip((confidence * QUANTILE_BINS).astype(np.int64), 0, QUANTILE_BINS - 1)
+    return np.bincount(bins, minlength=QUANTILE_BINS)
+
+
+def _quantiles(histogram: np.ndarray) -> Dict[float, float]:
+    total = histogram.sum()
+    if not total:
+        return {q: np.nan for q in QUANTILES}
+    # the first bin by which a fraction `q` of the confidences is reached, reported
+    # at its center
+    bins = np.searchsorted(np.cumsum(histogram), np.array(QUANTILES) * total)
+    return {q: (b + 0.5) / QUANTILE_BINS for q, b in zip(QUANTILES, bins.tolist())}
+
+
+def _label_histogram(table: PredictionTable, true_label: np.ndarray) -> Counter:
+    codes = table.predicted_label
+    if table.label_offsets is not None:
+        codes = codes[table.label_offsets[0] : table.label_offsets[-1]]
+    counts = np.bincount(codes[codes >= 0], minlength=len(table.classes))
+    return Counter(
+        {
+            label: int(count)
+            for label, count in zip(table.classes.tolist(), counts)
+            if count
+        }
+    )
+
+
+BUILTINS = {
+    "count": Aggregator("count", _count, _add),
+    "accuracy": Aggregator("accuracy", _accuracy, _add_pairs, _ratio),
+    "mean_confidence": Aggregator(
+        "mean_confidence", _mean_confidence, _add_pairs, _ratio
+    ),
+    "confidence_quantiles": Aggregator(
+        "confidence_quantiles", _confidence_histogram, _add, _quantiles
+    ),
+    "label_histogram": Aggregator("label_histogram", _label_histogram, _add, dict),
+}
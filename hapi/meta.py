@@ -0,0 +1,289 @@
+import csv
+import json
+import math
+import os
+import threading
+import warnings
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Tuple, Union
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+KEY_COLUMNS = ["task", "dataset", "api", "date"]
+
+# the sidecar of per-file statistics, next to meta.csv
+STATS_FILE = "meta_stats.json"
+STATS_AGGREGATES = [
+    "count",
+    "accuracy",
+    "mean_confidence",
+    "confidence_quantiles",
+    "label_histogram",
+]
+
+_lock = threading.Lock()
+_cache: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+
+
+class MetaIndex:
+    """An in-memory index over the rows of ``tasks/meta.csv``.
+
+    The rows are held as plain dictionaries and the positions of the rows holding
+    each value of the key columns ("task", "dataset", "api" and "date") are
+    precomputed, so that filtering the database is a handful of set operations
+    instead of a scan over the full table. Building and querying the index does not
+    need pandas; the rows are only loaded into a dataframe (with categorical key
+    columns) when :attr:`df` is first accessed.
+
+    Use :func:`get_index` to get the (cached) index of a data directory.
+
+    Args:
+        path (str): The path to ``meta.csv``.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, newline="") as f:
+            self.rows = [_parse_row(row) for row in csv.DictReader(f)]
+        self._df = None
+
+        self._positions = {column: {} for column in KEY_COLUMNS}
+        self._keys = {}
+        for position, row in enumerate(self.rows):
+            for column in KEY_COLUMNS:
+                self._positions[column].setdefault(row[column], set()).add(position)
+            self._keys[tuple(row[column] for column in KEY_COLUMNS)] = position
+
+    @property
+    def df(self) -> "pd.DataFrame":
+        """The contents of ``meta.csv`` as a dataframe with categorical key columns.
+        Treat it as read-only, it is shared between calls.
+        """
+        if self._df is None:
+            import pandas as pd
+
+            df = pd.read_csv(self.path)
+            for column in KEY_COLUMNS:
+                df[column] = df[column].astype(str).astype("category")
+            self._df = df
+        return self._df
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def lookup(self, task: str, dataset: str, api: str, date: str) -> Dict:
+        """Get the row for a single (task, dataset, api, date) key.
+
+        Raises:
+            KeyError: If the database holds no such predictions.
+        """
+        return self.rows[self._keys[(task, dataset, api, date)]]
+
+    def select(self, **filters: Union[str, List[str]]) -> List[Dict]:
+        """Get the rows that match all of the filters that are not None (i.e. we
+        apply AND logic), in the order of ``meta.csv``. Each filter is keyed by a
+        column name and takes either a single value or a list of values.
+        """
+        filters = {k: v for k, v in filters.items() if v is not None}
+        if not filters:
+            return list(self.rows)
+
+        if len(filters) == len(KEY_COLUMNS) and all(
+            isinstance(filters[column], str) for column in KEY_COLUMNS
+        ):
+            position = self._keys.get(tuple(filters[c] for c in KEY_COLUMNS))
+            return [] if position is None else [self.rows[position]]
+
+        positions = None
+        for column, value in filters.items():
+            values = [value] if isinstance(value, str) else value
+            lookup = self._positions[column]
+            matched = set().union(*(lookup.get(v, ()) for v in values))
+            positions = matched if positions is None else positions & matched
+        return [self.rows[position] for position in sorted(positions)]
+
+
+def get_index(data_dir: str) -> MetaIndex:
+    """Get the index of the ``meta.csv`` in `data_dir`.
+
+    The index is built once and cached in memory. It is rebuilt whenever the
+    modification time or the size of ``meta.csv`` changes.
+    """
+    return _cached(os.path.join(data_dir, "tasks", "meta.csv"), MetaIndex)
+
+
+def build_stats(data_dir: str = None, workers: int = None) -> str:
+    """Precompute statistics of every prediction file, so that
+    ``hapi.summary(extended=True)`` can answer without loading any predictions.
+
+    The statistics are computed with :func:`hapi.aggregate` and written to
+    ``{data_dir}/tasks/meta_stats.json``, next to ``meta.csv``. For every prediction
+    file, they hold its size in bytes, the number of predictions, the accuracy
+    against ``labels.json`` (for single-label tasks), the mean and quantiles of the
+    confidences and the histogram of the predicted labels. Only the files (and
+    labels) that changed since the last build are processed again.
+
+    Args:
+        data_dir (str, optional): Directory holding the downloaded database. Defaults
+            to None, in which case `config.data_dir` is used.
+        workers (int, optional): The number of worker processes. Defaults to None,
+            in which case one worker per CPU is used.
+
+    Returns:
+        str: The path to the statistics.
+    """
+    from .mapreduce import BUILTINS, _aggregate
+
+    if data_dir is None:
+        from . import config
+
+        data_dir = config.data_dir
+
+    tasks_dir = os.path.join(data_dir, "tasks")
+    path = os.path.join(tasks_dir, STATS_FILE)
+    files = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            files = json.load(f)["files"]
+
+    rows = get_index(data_dir).rows
+    signatures = {row["path"]: _file_signature(tasks_dir, row) for row in rows}
+    stale = [
+        row
+        for row in rows
+        if files.get(row["path"], {}).get("signature") != signatures[row["path"]]
+    ]
+    aggregators = [BUILTINS[name] for name in STATS_AGGREGATES]
+    results = _aggregate(data_dir, stale, aggregators, ["path"], workers)
+
+    for (file_path,), values in results.items():
+        stats = dict(zip(STATS_AGGREGATES, values))
+        files[file_path] = {
+            "signature": signatures[file_path],
+            "size": signatures[file_path][0],
+            "count": stats["count"],
+            "accuracy": _finite(stats["accuracy"]),
+            "mean_confidence": _finite(stats["mean_confidence"]),
+            "confidence_quantiles": [
+                [q, _finite(value)]
+                for q, value in stats["confidence_quantiles"].items()
+            ],
+            # label ids aren't all strings, so the histogram is stored as pairs
+            "label_histogram": [
+                [label, count] for label, count in stats["label_histogram"].items()
+            ],
+        }
+
+    files = {row["path"]: files[row["path"]] for row in rows}
+    with open(path + ".tmp", "w") as f:
+        json.dump({"files": files}, f)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def get_stats(data_dir: str) -> "pd.DataFrame":
+    """Get the statistics built by :func:`build_stats` as a dataframe indexed by
+    the "path" of each prediction file, with one column per statistic. Statistics of
+    files that changed since they were built are missing (NaN).
+
+    Raises:
+        ValueError: If the statistics have not been built.
+    """
+    path = os.path.join(data_dir, "tasks", STATS_FILE)
+    if not os.path.exists(path):
+        raise ValueError(
+            "No per-file statistics found. Build them first with "
+            "`hapi.build_stats()`."
+        )
+    df = _cached(path, _read_stats)
+
+    tasks_dir = os.path.join(data_dir, "tasks")
+    stale = [
+        row["path"]
+        for row in get_index(data_dir).rows
+        if row["path"] in df.index
+        and df.at[row["path"], "signature"] != _file_signature(tasks_dir, row)
+    ]
+    df = df.drop(columns="signature")
+    if stale:
+        warnings.warn(
+            f"The statistics of {len(stale)} prediction file(s) are out of date. "
+            "Run `hapi.build_stats()` to update them."
+        )
+        df = df.copy()
+        df.loc[stale] = None
+    return df
+
+
+def _read_stats(path: str) -> "pd.DataFrame":
+    import pandas as pd
+
+    from .mapreduce import QUANTILES
+
+    with open(path) as f:
+        files = json.load(f)["files"]
+    records = []
+    for file_path, stats in files.items():
+        quantiles = dict(map(tuple, stats["confidence_quantiles"]))
+        record = {
+            "path": file_path,
+            "signature": stats["signature"],
+            "size": stats["size"],
+            "count": stats["count"],
+            "accuracy": stats["accuracy"],
+            "mean_confidence": stats["mean_confidence"],
+        }
+        for q in QUANTILES:
+            record[_quantile_column(q)] = quantiles.get(q)
+        record["label_histogram"] = dict(map(tuple, stats["label_histogram"]))
+        records.append(record)
+    columns = ["path", "signature", "size", "count", "accuracy", "mean_confidence"]
+    columns += [_quantile_column(q) for q in QUANTILES] + ["label_histogram"]
+    df = pd.DataFrame(records, columns=columns).set_index("path")
+    return df.astype({column: float for column in columns[4:-1]})
+
+
+def _quantile_column(q: float) -> str:
+    return f"confidence_q{round(q * 100):02d}"
+
+
+def _file_signature(tasks_dir: str, row: Dict) -> List[int]:
+    """The size and modification time of a prediction file, and the modification
+    time of the labels it is scored against (0 if there are none).
+    """
+    stat = os.stat(os.path.join(tasks_dir, row["path"]))
+    labels_path = os.path.join(tasks_dir, row["task"], row["dataset"], "labels.json")
+    labels_mtime = (
+        os.stat(labels_path).st_mtime_ns if os.path.exists(labels_path) else 0
+    )
+    return [stat.st_size, stat.st_mtime_ns, labels_mtime]
+
+
+def _finite(value: float):
+    """JSON has no NaN, store it as null."""
+    return None if value is None or math.isnan(value) else value
+
+
+def _cached(path: str, build: Callable[[str], Any]) -> Any:
+    """Build an object from the file at `path` once, and rebuild it whenever the
+    modification time or the size of the file changes.
+    """
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+    value = build(path)
+    with _lock:
+        _cache[path] = (signature, value)
+    return value
+
+
+def _parse_row(row: Dict[str, str]) -> Dict:
+    # a missing cost is an empty field, which becomes None (NaN in `MetaIndex.df`)
+    if "cost_per_10k" in row:
+        cost = row["cost_per_10k"]
+        row["cost_per_10k"] = float(cost) if cost else None
+    return row
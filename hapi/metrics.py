@@ -0,0 +1,206 @@
+from typing import Dict, List, Union
+
+import numpy as np
+import pandas as pd
+
+CLASSIFICATION_TASKS = ["scr", "sa", "fer"]
+METRICS = ["accuracy", "per_class_accuracy", "calibration"]
+
+
+def evaluate(
+    task: Union[str, List[str]] = None,
+    dataset: Union[str, List[str]] = None,
+    api: Union[str, List[str]] = None,
+    date: Union[str, List[str]] = None,
+    metric: Union[str, List[str]] = "accuracy",
+    n_bins: int = 10,
+) -> pd.DataFrame:
+    """Score API predictions against the labels.
+
+    Use the `task`, `dataset`, `api`, and `date` parameters to filter to a subset of
+    the database, with the same semantics as in :func:`hapi.get_predictions`.
+
+    For every dataset, the example ids and class labels are encoded into integer
+    arrays once, and the predictions of all selected apis and dates are joined to the
+    labels and scored together in batch with NumPy. Predictions for examples without
+    a label are ignored.
+
+    Only single-label classification tasks ("scr", "sa" and "fer") are supported.
+
+    Args:
+        task (Union[str, List[str]]): The task(s) to include. If None, all
+            classification tasks are included. Default is None.
+        dataset (Union[str, List[str]]): The dataset(s) to include. If None, all
+            datasets are included. Default is None.
+        api (Union[str, List[str]]): The API(s) to include. If None, all APIs are
+            included. Default is None.
+        date (Union[str, List[str]]): The date(s) to include in format "y-m-d". If
+            None, all dates are included. Default is None.
+        metric (Union[str, List[str]], optional): The metric(s) to compute, one or
+            more of "accuracy", "per_class_accuracy" and "calibration". Default is
+            "accuracy".
+        n_bins (int, optional): The number of equal-width confidence bins used for
+            the "calibration" metric. Default is 10.
+
+    Raises:
+        ValueError: If an unknown metric or a task other than a classification task
+            is passed, or a selected dataset does not hold single-label
+            classification predictions.
+
+    Returns:
+        pd.DataFrame: A dataframe with one row per prediction file and the columns
+            "task", "dataset", "api", "date" and "count" (the number of scored
+            predictions), plus, depending on `metric`:
+
+            - "accuracy": the fraction of correct predictions.
+            - "per_class_accuracy": a dictionary mapping each true label to the
+              accuracy on the examples with that label.
+            - "ece" and "calibration": the expected calibration error, and a
+              dictionary with the "confidence", "accuracy" and "count" of each
+              confidence bin.
+    """
+    from . import get_labels, get_predictions
+
+    metrics = [metric] if isinstance(metric, str) else list(metric)
+    for name in metrics:
+        if name not in METRICS:
+            raise ValueError(
+                f"Unknown metric '{name}'. Please pass one of the following: {METRICS}"
+            )
+
+    if task is None:
+        task = CLASSIFICATION_TASKS
+    for name in [task] if isinstance(task, str) else task:
+        if name not in CLASSIFICATION_TASKS:
+            raise ValueError(
+                f"`hapi.evaluate` only supports the tasks {CLASSIFICATION_TASKS}, got "
+                f"'{name}'. Use `hapi.evaluate_structured` for structured tasks."
+            )
+
+    path_to_preds = get_predictions(task=task, dataset=dataset, api=api, date=date)
+    path_to_labels = get_labels(task=task, dataset=dataset)
+
+    dataset_to_keys = {}
+    for key in path_to_preds:
+        dataset_to_keys.setdefault(key.rsplit("/", 2)[0], []).append(key)
+
+    rows = []
+    for path, keys in dataset_to_keys.items():
+        scores = _score_dataset(
+            path_to_labels[path], [path_to_preds[key] for key in keys], n_bins
+        )
+        for key, score in zip(keys, scores):
+            task_name, dataset_name, api_name, date_name = key.split("/")
+            row = {
+                "task": task_name,
+                "dataset": dataset_name,
+                "api": api_name,
+                "date": date_name,
+                "count": score["count"],
+            }
+            for name in metrics:
+                if name == "calibration":
+                    row["ece"] = score["ece"]
+                row[name] = score[name]
+            rows.append(row)
+
+    return pd.DataFrame(
+        rows, columns=["task", "dataset", "api", "date", "count"] + _columns(metrics)
+    )
+
+
+def _columns(metrics: List[str]) -> List[str]:
+    columns = []
+    for name in metrics:
+        columns.extend(["ece", name] if name == "calibration" else [name])
+    return columns
+
+
+def _score_dataset(
+    labels: List[Dict], files: List[List[Dict]], n_bins: int
+) -> List[Dict]:
+    """Score several prediction files on the same dataset in one batch."""
+    if any(isinstance(label["true_label"], list) for label in labels):
+        raise ValueError(
+            "`hapi.evaluate` only supports single-label classification tasks. Use "
+            "`hapi.evaluate_structured` for multi-label and structured tasks."
+        )
+
+    # encode example ids and classes to integers once
+    example_index = pd.Index([label["example_id"] for label in labels])
+    true, classes = pd.factorize(
+        pd.Series([label["true_label"] for label in labels], dtype=object)
+    )
+    class_index = pd.Index(classes)
+
+    # concatenate all files, remembering which file each prediction came from
+    file_ids = np.repeat(np.arange(len(files)), [len(preds) for preds in files])
+    records = [pred for preds in files for pred in preds]
+    positions = example_index.get_indexer([pred["example_id"] for pred in records])
+    predicted = class_index.get_indexer(
+        pd.Series([pred["predicted_label"] for pred in records], dtype=object)
+    )
+    confidence = np.array([pred.get("confidence") for pred in records], dtype=float)
+
+    # join to the labels, dropping predictions for unlabeled examples
+    true = np.where(positions >= 0, true[positions], -1)
+    mask = true >= 0
+    file_ids, confidence, true = file_ids[mask], confidence[mask], true[mask]
+    correct = predicted[mask] == true
+
+    n_files, n_classes = len(files), len(classes)
+    count = np.bincount(file_ids, minlength=n_files)
+    accuracy = _divide(np.bincount(file_ids, correct, minlength=n_files), count)
+
+    cells = file_ids * n_classes + true
+    class_count = np.bincount(cells, minlength=n_files * n_classes).reshape(
+        n_files, n_classes
+    )
+    class_accuracy = _divide(
+        np.bincount(cells, correct, minlength=n_files * n_classes).reshape(
+            n_files, n_classes
+        ),
+        class_count,
+    )
+
+    bins = np.clip(np.floor(confidence * n_bins), 0, n_bins - 1)
+    bins = np.where(np.isnan(confidence), -1, bins).astype(int)
+    binned = bins >= 0
+    cells = file_ids[binned] * n_bins + bins[binned]
+    size = n_files * n_bins
+    bin_count = np.bincount(cells, minlength=size).reshape(n_files, n_bins)
+    bin_confidence = _divide(
+        np.bincount(cells, confidence[binned], minlength=size).reshape(n_files, n_bins),
+        bin_count,
+    )
+    bin_accuracy = _divide(
+        np.bincount(cells, correct[binned], minlength=size).reshape(n_files, n_bins),
+        bin_count,
+    )
+    ece = np.nansum(
+        bin_count * np.abs(bin_accuracy - bin_confidence), axis=1
+    ) / np.maximum(bin_count.sum(axis=1), 1)
+
+    return [
+        {
+            "count": int(count[i]),
+            "accuracy": accuracy[i],
+            "per_class_accuracy": {
+                label: class_accuracy[i, c]
+                for c, label in enumerate(classes)
+                if class_count[i, c] > 0
+            },
+            "ece": ece[i],
+            "calibration": {
+                "confidence": bin_confidence[i].tolist(),
+                "accuracy": bin_accuracy[i].tolist(),
+                "count": bin_count[i].tolist(),
+            },
+        }
+        for i in range(n_files)
+    ]
+
+
+def _divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return numerator / denominator
@@ -0,0 +1,71 @@
+import concurrent.futures
+import functools
+from concurrent.futures import Executor
+from typing import Callable, Iterable, List, Union
+
+# the executor classes are looked up on first use, `concurrent.futures` imports
+# them lazily
+EXECUTORS = {
+    "thread": "ThreadPoolExecutor",
+    "process": "ProcessPoolExecutor",
+}
+
+
+def map_ordered(
+    fn: Callable,
+    items: Iterable,
+    workers: int = None,
+    executor: Union[str, Executor] = None,
+    total: int = None,
+) -> List:
+    """Apply `fn` to every item in `items`, possibly in parallel.
+
+    Results are returned in the order of `items`, regardless of the order in which
+    they complete, so the output is deterministic.
+
+    Args:
+        fn (Callable): The function to apply. When using a process pool, it must be
+            picklable (i.e. defined at the top level of a module).
+        items (Iterable): The items to apply `fn` to.
+        workers (int, optional): The number of workers to use. If 1, `fn` is applied
+            serially in the calling thread. Defaults to None, in which case
+            `config.workers` is used.
+        executor (Union[str, Executor], optional): Either "thread" for a thread pool,
+            which suits I/O-bound work such as reading files, "process" for a process
+            pool, which suits parse-bound work, or an existing
+            ``concurrent.futures.Executor``, which is used as is and not shut down.
+            Defaults to None, in which case `config.executor` is used.
+        total (int, optional): The number of items, used for the progress bar if
+            `items` has no length. Defaults to None. The progress bar is only shown
+            if `config.progress` is set.
+
+    Returns:
+        List: The results of `fn`, one per item in `items`.
+    """
+    from tqdm.auto import tqdm
+
+    from . import config
+
+    if workers is None:
+        workers = config.workers
+    if executor is None:
+        executor = config.executor
+    if total is None and hasattr(items, "__len__"):
+        total = len(items)
+    progress = functools.partial(tqdm, total=total, disable=not config.progress)
+
+    if isinstance(executor, Executor):
+        return list(progress(executor.map(fn, items)))
+
+    if executor not in EXECUTORS:
+        raise ValueError(
+            f"Unknown executor '{executor}'. Please pass one of the following: "
+            f"{list(EXECUTORS.keys())}, or a `concurrent.futures.Executor`."
+        )
+
+    if workers == 1:
+        return [fn(item) for item in progress(items)]
+
+    pool_cls = getattr(concurrent.futures, EXECUTORS[executor])
+    with pool_cls(max_workers=workers) as pool:
+        return list(progress(pool.map(fn, items)))
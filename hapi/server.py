@@ -0,0 +1,611 @@
+"""A local HTTP server that answers queries on the HAPI database from memory, so
+that many processes on a host can share one warm copy instead of each loading the
+database. Start it with ``hapi serve`` and point clients at it with
+`config.server_url`.
+"""
+
+import io
+import json
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from .table import PredictionTable
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8642
+
+# the budget of the cache of decoded files if `config.cache_size` isn't set
+DEFAULT_CACHE_SIZE = 4 * 1024**3
+
+# the default number of prediction files (or label files) in a page of results
+PAGE_SIZE = 16
+
+# latencies are reported over the most recent requests to each endpoint, and
+# throughput over the last `WINDOW` seconds
+LATENCY_SAMPLES = 1024
+WINDOW = 60.0
+
+FILTERS = {
+    "/predictions": ["task", "dataset", "api", "date", "example_id"],
+    "/labels": ["task", "dataset"],
+}
+
+CONTENT_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "npz": "application/octet-stream",
+}
+
+
+class HAPIServer(ThreadingHTTPServer):
+    """A threaded HTTP server over the HAPI database in `data_dir`, created with
+    :func:`make_server`.
+
+    The server answers from its own settings, which it applies to the threads that
+    handle requests only (see :meth:`context`), so the settings of the rest of the
+    process, like `config.data_dir` and the in-process cache, are left as they are.
+
+    Endpoints (all ``GET``):
+
+    - ``/predictions``: the results of :func:`hapi.get_predictions`, filtered with
+      the ``task``, ``dataset``, ``api``, ``date`` and ``example_id`` parameters
+      (repeat a parameter to pass several values).
+    - ``/labels``: the results of :func:`hapi.get_labels`, filtered with the
+      ``task`` and ``dataset`` parameters.
+    - ``/summary``: the results of :func:`hapi.summary`, with ``extended=1`` for
+      the per-file statistics.
+    - ``/metrics``: the request counts, latencies and throughput of the server,
+      and the state of the cache of decoded files.
+
+    Results are paginated by prediction file (or label file) with the ``offset``
+    and ``limit`` parameters, and streamed as ``format=json`` (an object with the
+    ``offset`` of the page, the ``next`` offset, or null on the last page, the
+    ``total`` number of files and the results), ``format=ndjson`` (one
+    ``{"key": ..., "predictions": ...}`` line per file, every file by default) or,
+    for predictions, ``format=npz`` (the columns of the
+    :class:`~hapi.table.PredictionTable` of every file, see :func:`encode_tables`).
+    The next offset is also returned in the ``X-HAPI-Next-Offset`` header.
+
+    Attributes:
+        data_dir (str): Directory holding the downloaded database.
+        cache (FileCache): The cache of decoded files of the server.
+        metrics (Metrics): The request counters of the server.
+        quiet (bool): If True, requests are not logged to stderr.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        data_dir: str,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        quiet: bool = False,
+    ):
+        from .cache import FileCache
+
+        super().__init__(address, _Handler)
+        self.data_dir = data_dir
+        self.cache = FileCache(max_size=cache_size)
+        self.metrics = Metrics()
+        self.quiet = quiet
+
+    @contextmanager
+    def context(self) -> Iterator[None]:
+        """Read the database of the server through its cache in the current thread,
+        without drawing progress bars or forwarding queries to `config.server_url`.
+        """
+        from . import config
+        from .cache import use_cache
+
+        with config.override(
+            data_dir=self.data_dir, server_url=None, progress=False
+        ), use_cache(self.cache):
+            yield
+
+
+class Metrics:
+    """Thread-safe request counters, latencies and throughput of a
+    :class:`HAPIServer`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self._endpoints: Dict[str, Dict] = {}
+
+    def record(self, endpoint: str, seconds: float, n_bytes: int, error: bool):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._endpoints.setdefault(
+                endpoint,
+                {
+                    "requests": 0,
+                    "errors": 0,
+                    "bytes_sent": 0,
+                    # (finished at, seconds, bytes) of the most recent requests
+                    "recent": deque(maxlen=LATENCY_SAMPLES),
+                },
+            )
+            entry["requests"] += 1
+            entry["errors"] += error
+            entry["bytes_sent"] += n_bytes
+            entry["recent"].append((now, seconds, n_bytes))
+
+    def to_dict(self) -> Dict:
+        now = time.monotonic()
+        window = min(WINDOW, time.time() - self.started) or WINDOW
+        with self._lock:
+            endpoints = {
+                endpoint: dict(entry, recent=list(entry["recent"]))
+                for endpoint, entry in self._endpoints.items()
+            }
+        for endpoint, entry in endpoints.items():
+            recent = entry.pop("recent")
+            latencies = np.array([seconds for _, seconds, _ in recent]) * 1000
+            in_window = [n_bytes for end, _, n_bytes in recent if now - end <= WINDOW]
+            entry["latency_ms"] = {
+                name: float(np.percentile(latencies, q)) if len(latencies) else None
+                for name, q in [("p50", 50), ("p95", 95), ("p99", 99), ("max", 100)]
+            }
+            entry["requests_per_second"] = len(in_window) / window
+            entry["bytes_per_second"] = sum(in_window) / window
+        return {"uptime": time.time() - self.started, "endpoints": endpoints}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: HAPIServer
+
+    def do_GET(self):
+        start = time.perf_counter()
+        url = urlsplit(self.path)
+        self._sent = 0
+        error = True
+        try:
+            with self.server.context():
+                params = parse_qs(url.query)
+                if url.path == "/predictions":
+                    self._predictions(params)
+                elif url.path == "/labels":
+                    self._labels(params)
+                elif url.path == "/summary":
+                    self._summary(params)
+                elif url.path == "/metrics":
+                    self._metrics()
+                else:
+                    self._error(HTTPStatus.NOT_FOUND, f"Unknown endpoint '{url.path}'.")
+                    return
+                error = False
+        except ValueError as e:
+            self._error(HTTPStatus.BAD_REQUEST, str(e))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            self.log_error("%s failed: %r", url.path, e)
+            self._error(HTTPStatus.INTERNAL_SERVER_ERROR, f"{type(e).__name__}: {e}")
+        finally:
+            self.server.metrics.record(
+                url.path, time.perf_counter() - start, self._sent, error
+            )
+
+    def _predictions(self, params: Dict[str, List[str]]):
+        from . import _select, get_predictions
+
+        format = _param(params, "format", "json")
+        if format not in CONTENT_TYPES:
+            raise ValueError(
+                f"Unknown format '{format}'. Please pass one of the following: "
+                f"{list(CONTENT_TYPES)}"
+            )
+        filters = _filters(params, "/predictions")
+        example_id = filters.pop("example_id", None)
+        rows = _select(**filters)
+        total = len(rows)
+        rows, offset, next_offset = _page(params, rows, format)
+
+        def load(row: Dict, format: str):
+            return get_predictions(
+                task=row["task"],
+                dataset=row["dataset"],
+                api=row["api"],
+                date=row["date"],
+                example_id=example_id,
+                format=format,
+            )
+
+        if format == "npz":
+            from .table import share_vocabularies
+
+            tables = {}
+            for row in rows:
+                tables.update(load(row, "table"))
+            tables = dict(zip(tables, share_vocabularies(list(tables.values()))))
+            page = {"offset": offset, "next": next_offset, "total": total}
+            self._send_body(encode_tables(tables, page), format, next_offset)
+            return
+
+        self._stream(
+            (
+                (key, preds)
+                for row in rows
+                for key, preds in load(row, "records").items()
+            ),
+            "predictions",
+            format,
+            offset,
+            next_offset,
+            total,
+        )
+
+    def _labels(self, params: Dict[str, List[str]]):
+        from . import _select, get_labels
+
+        format = _param(params, "format", "json")
+        if format not in ["json", "ndjson"]:
+            raise ValueError(
+                f"Unknown format '{format}'. Please pass one of the following: "
+                "['json', 'ndjson']"
+            )
+        filters = _filters(params, "/labels")
+        # one row per task/dataset, in order of first appearance
+        rows = list(
+            {(row["task"], row["dataset"]): row for row in _select(**filters)}.values()
+        )
+        total = len(rows)
+        rows, offset, next_offset = _page(params, rows, format)
+        self._stream(
+            (
+                (key, labels)
+                for row in rows
+                for key, labels in get_labels(
+                    task=row["task"], dataset=row["dataset"]
+                ).items()
+            ),
+            "labels",
+            format,
+            offset,
+            next_offset,
+            total,
+        )
+
+    def _summary(self, params: Dict[str, List[str]]):
+        from . import summary
+
+        extended = _param(params, "extended", "0").lower() in ["1", "true", "yes"]
+        self._send_body(_json(encode_frame(summary(extended=extended))), "json")
+
+    def _metrics(self):
+        from . import cache_info, stats
+
+        metrics = self.server.metrics.to_dict()
+        metrics["cache"] = asdict(cache_info())
+        metrics["loaders"] = stats()
+        self._send_body(_json(metrics), "json")
+
+    def _stream(
+        self,
+        items: Iterator,
+        name: str,
+        format: str,
+        offset: int,
+        next_offset: Optional[int],
+        total: int,
+    ):
+        """Write `(key, value)` pairs as they are loaded, without holding the whole
+        response in memory. The length of the response is unknown up front, so the
+        connection is closed at the end of it.
+        """
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", CONTENT_TYPES[format])
+        if next_offset is not None:
+            self.send_header("X-HAPI-Next-Offset", str(next_offset))
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        if format == "ndjson":
+            for key, value in items:
+                self._write(_json({"key": key, name: value}) + b"\n")
+            return
+
+        head = {"offset": offset, "next": next_offset, "total": total}
+        self._write(_json(head)[:-1] + f', "{name}": {{'.encode("utf-8"))
+        for i, (key, value) in enumerate(items):
+            self._write((b", " if i else b"") + _json(key) + b": " + _json(value))
+        self._write(b"}}")
+
+    def _send_body(self, body: bytes, format: str, next_offset: int = None):
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", CONTENT_TYPES[format])
+        self.send_header("Content-Length", str(len(body)))
+        if next_offset is not None:
+            self.send_header("X-HAPI-Next-Offset", str(next_offset))
+        self.end_headers()
+        self._write(body)
+
+    def _error(self, status: HTTPStatus, message: str):
+        if self._sent:
+            # the response has already started, so the best we can do is cut it
+            self.close_connection = True
+            return
+        body = _json({"error": message})
+        self.send_response(status)
+        self.send_header("Content-Type", CONTENT_TYPES["json"])
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self._write(body)
+
+    def _write(self, data: bytes):
+        self.wfile.write(data)
+        self._sent += len(data)
+
+    def log_message(self, format: str, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+def make_server(
+    data_dir: str = None,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    cache_size: int = None,
+    preload: bool = False,
+    quiet: bool = False,
+) -> HAPIServer:
+    """Create a :class:`HAPIServer` over the HAPI database. Call ``serve_forever()``
+    on it to start answering requests, or use :func:`serve`. The settings are kept
+    by the server, the `config` of the process is left as it is.
+
+    Args:
+        data_dir (str, optional): Directory holding the downloaded database. Defaults
+            to None, in which case `config.data_dir` is used.
+        host (str, optional): The address to listen on. Defaults to "127.0.0.1", so
+            that only local processes can connect.
+        port (int, optional): The port to listen on. If 0, a free port is picked.
+            Defaults to 8642.
+        cache_size (int, optional): The budget in bytes of the cache of decoded
+            files. Defaults to None, in which case `config.cache_size` is used, or
+            `DEFAULT_CACHE_SIZE` if that isn't set.
+        preload (bool, optional): If True, load every prediction and label file into
+            the cache before returning, so that the first requests are as fast as
+            the later ones. Default is False.
+        quiet (bool, optional): If True, don't log requests to stderr. Default is
+            False.
+
+    Returns:
+        HAPIServer: The server, bound to `host` and `port`.
+    """
+    from . import config, get_labels, get_predictions, meta
+
+    if data_dir is None:
+        data_dir = config.data_dir
+    if cache_size is None:
+        cache_size = config.cache_size or DEFAULT_CACHE_SIZE
+    server = HAPIServer((host, port), data_dir, cache_size=cache_size, quiet=quiet)
+    try:
+        with server.context():
+            meta.get_index(config.data_dir)
+            if preload:
+                get_predictions()
+                get_labels()
+    except BaseException:
+        server.server_close()
+        raise
+    return server
+
+
+def serve(
+    data_dir: str = None,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    cache_size: int = None,
+    preload: bool = False,
+    quiet: bool = False,
+):
+    """Serve the HAPI database over HTTP until interrupted, so that other processes
+    can query it with `config.server_url` set instead of loading it themselves.
+    This is what ``hapi serve`` runs. See :func:`make_server` for the arguments and
+    :class:`HAPIServer` for the endpoints.
+
+    .. code-block:: bash
+
+        hapi serve --data-dir /path/to/data --preload
+        HAPI_SERVER_URL=http://127.0.0.1:8642 python my_script.py
+    """
+    server = make_server(
+        data_dir=data_dir,
+        host=host,
+        port=port,
+        cache_size=cache_size,
+        preload=preload,
+        quiet=quiet,
+    )
+    host, port = server.server_address[:2]
+    print(f"Serving the HAPI database on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def encode_tables(tables: Dict[str, "PredictionTable"], page: Dict) -> bytes:
+    """Encode prediction tables that share their vocabularies as an ``.npz``
+    archive, which can be read without pickle. The vocabularies, the extra columns
+    and `page` are stored as UTF-8 JSON arrays, and the columns of the i-th table as
+    ``"{i}/example"``, ``"{i}/confidence"`` and so on. See :func:`decode_tables`.
+    """
+    keys = list(tables)
+    arrays = {"page": _json_array(dict(page, keys=keys))}
+    if keys:
+        first = tables[keys[0]]
+        arrays["example_ids"] = _json_array(first.example_ids.tolist())
+        arrays["classes"] = _json_array(first.classes.tolist())
+    for i, table in enumerate(tables.values()):
+        arrays[f"{i}/example"] = table.example
+        arrays[f"{i}/confidence"] = table.confidence
+        arrays[f"{i}/predicted_label"] = table.predicted_label
+        if table.label_offsets is not None:
+            arrays[f"{i}/label_offsets"] = table.label_offsets
+        if table.extra:
+            arrays[f"{i}/extra"] = _json_array(
+                {column: values.tolist() for column, values in table.extra.items()}
+            )
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def decode_tables(data: bytes) -> Tuple[Dict[str, "PredictionTable"], Dict]:
+    """Decode an archive written by :func:`encode_tables` into a dictionary of
+    prediction tables that share their vocabularies, and the page it holds.
+    """
+    from .table import PredictionTable
+
+    def object_array(values: list) -> np.ndarray:
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+
+    with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+        page = _from_json_array(archive["page"])
+        tables = {}
+        if page["keys"]:
+            example_ids = object_array(_from_json_array(archive["example_ids"]))
+            classes = object_array(_from_json_array(archive["classes"]))
+        for i, key in enumerate(page.pop("keys")):
+            extra = {}
+            if f"{i}/extra" in archive:
+                extra = {
+                    column: object_array(values)
+                    for column, values in _from_json_array(
+                        archive[f"{i}/extra"]
+                    ).items()
+                }
+            tables[key] = PredictionTable(
+                example=archive[f"{i}/example"],
+                confidence=archive[f"{i}/confidence"],
+                predicted_label=archive[f"{i}/predicted_label"],
+                label_offsets=(
+                    archive[f"{i}/label_offsets"]
+                    if f"{i}/label_offsets" in archive
+                    else None
+                ),
+                example_ids=example_ids,
+                classes=classes,
+                extra=extra,
+            )
+    return tables, page
+
+
+def encode_frame(df: "pd.DataFrame") -> Dict:
+    """Encode a dataframe of :func:`hapi.summary` as JSON-serializable columns,
+    keeping the categories of categorical columns and the keys of the label
+    histograms. See :func:`decode_frame`.
+    """
+    columns = {}
+    for name, column in df.items():
+        values = column.astype(object).tolist()
+        if name == "label_histogram":
+            values = [
+                None if value is None else [[k, v] for k, v in value.items()]
+                for value in values
+            ]
+        columns[name] = [
+            None if isinstance(value, float) and math.isnan(value) else value
+            for value in values
+        ]
+    return {
+        "columns": columns,
+        "dtypes": {name: str(dtype) for name, dtype in df.dtypes.items()},
+        "categories": {
+            name: column.cat.categories.tolist()
+            for name, column in df.items()
+            if column.dtype == "category"
+        },
+    }
+
+
+def decode_frame(data: Dict) -> "pd.DataFrame":
+    """Decode a dataframe encoded with :func:`encode_frame`."""
+    import pandas as pd
+
+    columns = {}
+    for name, values in data["columns"].items():
+        dtype = data["dtypes"][name]
+        if name == "label_histogram":
+            values = [
+                None if value is None else dict(map(tuple, value)) for value in values
+            ]
+        if dtype == "category":
+            values = pd.Categorical(values, categories=data["categories"][name])
+        elif dtype.startswith("float"):
+            values = pd.array(
+                [np.nan if value is None else value for value in values], dtype=dtype
+            )
+        elif dtype != "object":
+            values = pd.array(values, dtype=dtype)
+        columns[name] = values
+    return pd.DataFrame(columns)
+
+
+def _param(params: Dict[str, List[str]], name: str, default: str = None) -> str:
+    values = params.get(name)
+    return default if not values else values[-1]
+
+
+def _filters(
+    params: Dict[str, List[str]], endpoint: str
+) -> Dict[str, Union[str, List[str]]]:
+    filters = {}
+    for name in FILTERS[endpoint]:
+        values = params.get(name)
+        if values:
+            filters[name] = values[0] if len(values) == 1 else values
+    return filters
+
+
+def _page(
+    params: Dict[str, List[str]], rows: List[Dict], format: str
+) -> Tuple[List[Dict], int, Optional[int]]:
+    """Slice `rows` to the page selected by the ``offset`` and ``limit`` parameters,
+    returning the page, its offset and the offset of the next page (None if it is
+    the last one).
+    """
+    try:
+        offset = int(_param(params, "offset", "0"))
+        # ndjson is streamed, so it returns every file unless asked otherwise
+        limit = _param(params, "limit", None if format == "ndjson" else str(PAGE_SIZE))
+        limit = None if limit is None else int(limit)
+    except ValueError:
+        raise ValueError("`offset` and `limit` must be integers.")
+    if offset < 0 or (limit is not None and limit < 1):
+        raise ValueError("`offset` must be >= 0 and `limit` must be >= 1.")
+    end = len(rows) if limit is None else min(offset + limit, len(rows))
+    return rows[offset:end], offset, end if end < len(rows) else None
+
+
+def _json(value) -> bytes:
+    return json.dumps(value).encode("utf-8")
+
+
+def _json_array(value) -> np.ndarray:
+    return np.frombuffer(_json(value), dtype=np.uint8)
+
+
+def _from_json_array(array: np.ndarray):
+    return json.loads(array.tobytes())
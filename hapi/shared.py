@@ -0,0 +1,358 @@
+import json
+import secrets
+import struct
+from dataclasses import dataclass, field
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from .table import PredictionTable, share_vocabularies
+
+# arrays are aligned to cache lines within the segment
+ALIGNMENT = 64
+
+# the segment starts with the length of the JSON directory, then the directory
+_HEADER = struct.Struct("<Q")
+
+_ARRAY_FIELDS = ["example", "confidence", "predicted_label", "label_offsets"]
+
+# labels are stored as tables without confidences
+_LABEL_FIELDS = ["example", "predicted_label", "label_offsets"]
+
+
+@dataclass
+class SharedTables:
+    """Predictions and labels in a shared memory segment, as published by
+    :func:`hapi.publish` or attached to with :func:`hapi.attach`.
+
+    The columns of the prediction tables are read-only views of the segment, so
+    any number of processes can attach to it without copying them. The labels and
+    the vocabularies of the tables (the example ids and labels) are stored as arrays
+    too, and only they and the extra columns of the tables are decoded into each
+    process.
+
+    Attributes:
+        name (str): The name of the shared memory segment, to pass to
+            :func:`hapi.attach`.
+        predictions (Dict[str, PredictionTable]): The prediction tables, keyed like
+            the results of :func:`hapi.get_predictions`.
+        labels (Dict[str, List[Dict]]): The labels, keyed like the results of
+            :func:`hapi.get_labels`.
+    """
+
+    name: str
+    predictions: Dict[str, PredictionTable]
+    labels: Dict[str, List[Dict]]
+    _shm: Optional[SharedMemory] = field(default=None, repr=False)
+
+    def close(self):
+        """Detach from the segment. Drop the tables (and any views of them) first,
+        the segment can't be detached while its memory is still referenced.
+        """
+        self.predictions = {}
+        if self._shm is not None:
+            self._shm.close()
+            self._shm = None
+
+    def unlink(self):
+        """Detach from and destroy the segment. Call this in the publishing process
+        once no worker needs the segment anymore.
+        """
+        shm = SharedMemory(name=self.name, create=False)
+        self.close()
+        shm.close()
+        shm.unlink()
+
+    def __enter__(self) -> "SharedTables":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def publish(
+    name: str = None,
+    task: Union[str, List[str]] = None,
+    dataset: Union[str, List[str]] = None,
+    api: Union[str, List[str]] = None,
+    date: Union[str, List[str]] = None,
+) -> SharedTables:
+    """Load predictions and labels into a shared memory segment that other
+    processes can attach to with :func:`hapi.attach`.
+
+    Use this in a loader process to serve the same data to many workers: the
+    predictions are decoded once, with ``hapi.get_predictions(format="table")``,
+    and their columns are copied into one segment, along with a small directory of
+    where each column lives. Workers then attach to the segment by name, so memory
+    use stays flat as workers are added.
+
+    .. code-block:: python
+
+        # in the loader process
+        shared = hapi.publish("hapi_sa", task="sa")
+        ...
+        shared.unlink()
+
+        # in every worker process
+        shared = hapi.attach("hapi_sa")
+        shared.predictions["sa/imdb/google_sa/20-10-28"].confidence
+
+    Use the `task`, `dataset`, `api`, and `date` parameters to filter to a subset of
+    the database, with the same semantics as in :func:`hapi.get_predictions`.
+
+    Args:
+        name (str, optional): The name of the segment. Defaults to None, in which
+            case a unique name is generated.
+        task (Union[str, List[str]]): The task(s) to include. If None, all tasks are
+            included. Default is None.
+        dataset (Union[str, List[str]]): The dataset(s) to include. If None, all
+            datasets are included. Default is None.
+        api (Union[str, List[str]]): The API(s) to include. If None, all APIs are
+            included. Default is None.
+        date (Union[str, List[str]]): The date(s) to include in format "y-m-d". If
+            None, all dates are included. Default is None.
+
+    Returns:
+        SharedTables: The published tables, whose `name` workers attach to. The
+            segment lives until :meth:`SharedTables.unlink` is called, or until the
+            publishing process exits.
+    """
+    from . import get_labels, get_predictions
+
+    if name is None:
+        name = f"hapi_{secrets.token_hex(8)}"
+    tables = get_predictions(
+        task=task, dataset=dataset, api=api, date=date, format="table"
+    )
+    labels = get_labels(task=task, dataset=dataset)
+
+    # the labels are stored like predictions, and the vocabularies of all of the
+    # tables are shared, so each of them is stored once
+    label_tables = share_vocabularies(
+        list(tables.values())
+        + [PredictionTable.from_records(_label_records(r)) for r in labels.values()]
+    )
+    label_tables = dict(zip(labels, label_tables[len(tables) :]))
+    vocabularies: List[np.ndarray] = []
+    vocabulary_ids: Dict[int, int] = {}
+
+    def vocabulary(array: np.ndarray) -> int:
+        if id(array) not in vocabulary_ids:
+            vocabulary_ids[id(array)] = len(vocabularies)
+            vocabularies.append(array)
+        return vocabulary_ids[id(array)]
+
+    # lay out the arrays and JSON blobs in the segment, after the directory
+    chunks: List[np.ndarray] = []
+    size = 0
+
+    def allocate(data: np.ndarray) -> int:
+        nonlocal size
+        offset = size
+        chunks.append(data)
+        size += _aligned(data.nbytes)
+        return offset
+
+    def add_array(array: np.ndarray) -> List:
+        array = np.ascontiguousarray(array)
+        return [allocate(array.view(np.uint8)), array.dtype.str, len(array)]
+
+    def add_blob(value) -> List[int]:
+        data = np.frombuffer(json.dumps(value).encode("utf-8"), dtype=np.uint8)
+        return [allocate(data), len(data)]
+
+    def add_table(table: PredictionTable, columns: List[str]) -> Dict:
+        entry = {
+            "example_ids": vocabulary(table.example_ids),
+            "classes": vocabulary(table.classes),
+        }
+        for column in columns:
+            if getattr(table, column) is not None:
+                entry[column] = add_array(getattr(table, column))
+        if table.extra:
+            entry["extra"] = add_blob(
+                {column: values.tolist() for column, values in table.extra.items()}
+            )
+        return entry
+
+    def add_vocabulary(array: np.ndarray) -> Dict:
+        values = array.tolist()
+        if all(type(value) is int and -(2**63) <= value < 2**63 for value in values):
+            return {"int": add_array(np.array(values, dtype=np.int64))}
+        if all(type(value) is str for value in values):
+            # UTF-8 bytes of all strings, with the offsets where each one starts
+            data = [value.encode("utf-8") for value in values]
+            offsets = np.zeros(len(data) + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in data], out=offsets[1:])
+            return {
+                "str": add_array(np.frombuffer(b"".join(data), dtype=np.uint8)),
+                "offsets": add_array(offsets),
+            }
+        return {"json": add_blob(values)}
+
+    directory = {
+        "tables": {
+            key: add_table(table, _ARRAY_FIELDS) for key, table in tables.items()
+        },
+        "labels": {
+            key: add_table(table, _LABEL_FIELDS) for key, table in label_tables.items()
+        },
+    }
+    directory["vocabularies"] = [add_vocabulary(array) for array in vocabularies]
+
+    header = json.dumps(directory).encode("utf-8")
+    start = _aligned(_HEADER.size + len(header))
+    # the publisher keeps its handle registered with the resource tracker, so the
+    # segment is destroyed if it exits without unlinking it
+    shm = SharedMemory(name=name, create=True, size=max(start + size, 1))
+    try:
+        _HEADER.pack_into(shm.buf, 0, len(header))
+        shm.buf[_HEADER.size : _HEADER.size + len(header)] = header
+        offset = start
+        for data in chunks:
+            shm.buf[offset : offset + data.nbytes] = data
+            offset += _aligned(data.nbytes)
+        return _read(name, shm)
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+
+
+def attach(name: str) -> SharedTables:
+    """Attach to the predictions and labels published with :func:`hapi.publish`.
+
+    The columns of the returned prediction tables are read-only views of the
+    shared memory segment, so attaching does not copy them. The segment is not
+    destroyed when the attaching process exits, only the publisher destroys it.
+
+    Args:
+        name (str): The name of the segment.
+
+    Raises:
+        FileNotFoundError: If no segment with this name exists.
+
+    Returns:
+        SharedTables: The attached tables. Call :meth:`SharedTables.close` to detach.
+    """
+    return _read(name, _open(name))
+
+
+def _read(name: str, shm: SharedMemory) -> SharedTables:
+    (length,) = _HEADER.unpack_from(shm.buf, 0)
+    directory = json.loads(bytes(shm.buf[_HEADER.size : _HEADER.size + length]))
+    start = _aligned(_HEADER.size + length)
+
+    def read_blob(spec: List[int]):
+        offset, size = spec
+        return json.loads(bytes(shm.buf[start + offset : start + offset + size]))
+
+    def read_array(spec: List) -> np.ndarray:
+        offset, dtype, size = spec
+        array = np.ndarray(size, dtype, buffer=shm.buf, offset=start + offset)
+        array.flags.writeable = False
+        return array
+
+    def read_vocabulary(spec: Dict) -> np.ndarray:
+        if "int" in spec:
+            values = read_array(spec["int"]).tolist()
+        elif "str" in spec:
+            data = read_array(spec["str"]).tobytes()
+            offsets = read_array(spec["offsets"]).tolist()
+            values = [
+                data[begin:end].decode("utf-8")
+                for begin, end in zip(offsets[:-1], offsets[1:])
+            ]
+        else:
+            values = read_blob(spec["json"])
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+
+    vocabularies = [read_vocabulary(spec) for spec in directory["vocabularies"]]
+
+    def read_table(entry: Dict) -> PredictionTable:
+        extra = {}
+        if "extra" in entry:
+            for column, values in read_blob(entry["extra"]).items():
+                extra[column] = np.empty(len(values), dtype=object)
+                extra[column][:] = values
+        example = read_array(entry["example"])
+        return PredictionTable(
+            example=example,
+            confidence=(
+                read_array(entry["confidence"])
+                if "confidence" in entry
+                else np.full(len(example), np.nan, dtype=np.float32)
+            ),
+            predicted_label=read_array(entry["predicted_label"]),
+            label_offsets=(
+                read_array(entry["label_offsets"]) if "label_offsets" in entry else None
+            ),
+            example_ids=vocabularies[entry["example_ids"]],
+            classes=vocabularies[entry["classes"]],
+            extra=extra,
+        )
+
+    labels = {
+        key: _true_labels(read_table(entry))
+        for key, entry in directory["labels"].items()
+    }
+    return SharedTables(
+        name=name,
+        predictions={
+            key: read_table(entry) for key, entry in directory["tables"].items()
+        },
+        labels=labels,
+        _shm=shm,
+    )
+
+
+def _label_records(labels: List[Dict]) -> List[Dict]:
+    """Rename the true labels to predicted labels, to store them as a table."""
+    return [
+        {
+            "predicted_label" if key == "true_label" else key: value
+            for key, value in record.items()
+        }
+        for record in labels
+    ]
+
+
+def _true_labels(table: PredictionTable) -> List[Dict]:
+    """Convert a table stored with :func:`_label_records` back to labels."""
+    labels = []
+    for record in table.to_dicts():
+        del record["confidence"]
+        labels.append(
+            {
+                "example_id": record.pop("example_id"),
+                "true_label": record.pop("predicted_label"),
+                **record,
+            }
+        )
+    return labels
+
+
+def _aligned(nbytes: int) -> int:
+    return -(-nbytes // ALIGNMENT) * ALIGNMENT
+
+
+def _open(name: str) -> SharedMemory:
+    """Open an existing segment without registering it with the resource tracker,
+    which would otherwise destroy it when this process exits.
+    """
+    try:
+        return SharedMemory(name=name, create=False, track=False)
+    except TypeError:
+        # Python < 3.13 always registers the segment. Unregistering it afterwards
+        # would also drop the publisher's registration when this process shares
+        # its resource tracker (a forked worker), so skip registering instead.
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return SharedMemory(name=name, create=False)
+        finally:
+            resource_tracker.register = register
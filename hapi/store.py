@@ -0,0 +1,313 @@
+import json
+import os
+import warnings
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import instrument
+from .cache import MISSING, current_cache
+
+STORE_DIR = "store"
+MANIFEST_FILE = "manifest.json"
+INDEX_KEY = "__index__"
+LABELS_GROUP = "labels"
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+def compile_store(data_dir: str = None) -> str:
+    """Compile the extracted HAPI database into a columnar on-disk store.
+
+    The JSON files in ``{data_dir}/tasks`` are converted into one NumPy archive per
+    task/dataset at ``{data_dir}/store/{task}/{dataset}.npz``. Within an archive,
+    every prediction file (i.e. every api/date) and the labels are stored as a
+    separate row group, so that loaders only decode the row groups that match their
+    filters. Numeric columns (e.g. "confidence") are stored as binary arrays, all
+    other columns as a single JSON-encoded array per column.
+
+    Once compiled, :func:`hapi.get_predictions` and :func:`hapi.get_labels` read from
+    the store transparently. The store is tied to the ``meta.csv`` it was compiled
+    from and is ignored if ``meta.csv`` changes. The size and modification time of
+    every prediction and label file are recorded too, and files that changed since
+    (e.g. with :func:`hapi.update`) are read from JSON instead, with a warning. Re-run
+    this function after updating the database.
+
+    Args:
+        data_dir (str, optional): Directory holding the downloaded database. Defaults
+            to None, in which case `config.data_dir` is used.
+
+    Returns:
+        str: The path to the compiled store.
+    """
+    import pandas as pd
+    from tqdm.auto import tqdm
+
+    if data_dir is None:
+        from . import config
+
+        data_dir = config.data_dir
+
+    tasks_dir = os.path.join(data_dir, "tasks")
+    store_dir = os.path.join(data_dir, STORE_DIR)
+    meta_path = os.path.join(tasks_dir, "meta.csv")
+    df = pd.read_csv(meta_path)
+    # recorded before reading the files, so a file that changes while it is being
+    # compiled is read from JSON later
+    paths = [
+        _labels_path(task, dataset)
+        for task, dataset in df[["task", "dataset"]].drop_duplicates().values
+    ] + list(df["path"])
+    files = {path: _file_signature(tasks_dir, path) for path in paths}
+
+    for (task, dataset), group_df in tqdm(
+        df.groupby(["task", "dataset"], sort=False),
+        total=len(df[["task", "dataset"]].drop_duplicates()),
+    ):
+        with open(os.path.join(tasks_dir, _labels_path(task, dataset))) as f:
+            groups = {LABELS_GROUP: json.load(f)}
+        for _, row in group_df.iterrows():
+            with open(os.path.join(tasks_dir, row["path"])) as f:
+                groups[_group_name(row["api"], row["date"])] = json.load(f)
+        _write_archive(os.path.join(store_dir, task, f"{dataset}.npz"), groups)
+
+    # the manifest is written last, so an interrupted compile is never picked up
+    with open(os.path.join(store_dir, MANIFEST_FILE), "w") as f:
+        json.dump(dict(_meta_signature(meta_path), files=files), f)
+    return store_dir
+
+
+def has_store(data_dir: str) -> bool:
+    """Whether a store compiled from the current ``meta.csv`` exists in `data_dir`."""
+    manifest_path = os.path.join(data_dir, STORE_DIR, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return False
+    manifest = _read_manifest(data_dir)
+    signature = _meta_signature(os.path.join(data_dir, "tasks", "meta.csv"))
+    return "files" in manifest and all(
+        manifest[key] == value for key, value in signature.items()
+    )
+
+
+def read_predictions(data_dir: str, rows: List[Dict]) -> Dict[str, List[Dict]]:
+    """Read the prediction files listed in `rows` (rows of ``meta.csv``) from the
+    store, decoding only the matching row groups.
+    """
+    return dict(iter_predictions(data_dir, rows))
+
+
+def iter_predictions(
+    data_dir: str, rows: List[Dict]
+) -> Iterator[Tuple[str, List[Dict]]]:
+    """Lazily read the prediction files listed in `rows` from the store, one row
+    group at a time. Files that changed since the store was compiled are read from
+    JSON instead.
+    """
+    changed = _changed_files(data_dir, [row["path"] for row in rows])
+    for path, archive, index, group_rows in _by_archive(data_dir, rows):
+        for row in group_rows:
+            if row["path"] in changed:
+                records = _read_json(data_dir, row["path"])
+            else:
+                records = _read_cached(
+                    path, archive, index, _group_name(row["api"], row["date"])
+                )
+            yield os.path.splitext(row["path"])[0], records
+
+
+def read_labels(data_dir: str, rows: List[Dict]) -> Dict[str, List[Dict]]:
+    """Read the labels of the task/datasets listed in `rows` from the store, or from
+    JSON for the label files that changed since the store was compiled.
+    """
+    changed = _changed_files(
+        data_dir, [_labels_path(row["task"], row["dataset"]) for row in rows]
+    )
+    path_to_labels = {}
+    for path, archive, index, group_rows in _by_archive(data_dir, rows):
+        row = group_rows[0]
+        labels_path = _labels_path(row["task"], row["dataset"])
+        if labels_path in changed:
+            labels = _read_json(data_dir, labels_path)
+        else:
+            labels = _read_cached(path, archive, index, LABELS_GROUP)
+        path_to_labels[os.path.join(row["task"], row["dataset"])] = labels
+    return path_to_labels
+
+
+def _by_archive(
+    data_dir: str, rows: List[Dict]
+) -> Iterable[Tuple[str, "np.lib.npyio.NpzFile", Dict, List[Dict]]]:
+    import numpy as np
+    from tqdm.auto import tqdm
+
+    from . import config
+
+    # group the rows by archive, in order of first appearance
+    archives = {}
+    for row in rows:
+        archives.setdefault((row["task"], row["dataset"]), []).append(row)
+
+    for (task, dataset), group_rows in tqdm(
+        archives.items(), disable=not config.progress
+    ):
+        path = os.path.join(data_dir, STORE_DIR, task, f"{dataset}.npz")
+        with instrument.phase("open"):
+            archive = np.load(path, allow_pickle=False)
+            index = _decode_json(archive[INDEX_KEY])
+        with archive:
+            yield path, archive, index, group_rows
+
+
+def _group_name(api: str, date: str) -> str:
+    return f"{api}/{date}"
+
+
+def _labels_path(task: str, dataset: str) -> str:
+    return f"{task}/{dataset}/labels.json"
+
+
+def _file_signature(tasks_dir: str, path: str) -> Optional[List[int]]:
+    """The size and modification time of a file in `tasks_dir`, or None if it is
+    missing.
+    """
+    try:
+        stat = os.stat(os.path.join(tasks_dir, path))
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _read_manifest(data_dir: str) -> Dict:
+    from .meta import _cached
+
+    def read(path: str) -> Dict:
+        with open(path) as f:
+            return json.load(f)
+
+    return _cached(os.path.join(data_dir, STORE_DIR, MANIFEST_FILE), read)
+
+
+def _changed_files(data_dir: str, paths: List[str]) -> set:
+    """The files among `paths` (relative to ``{data_dir}/tasks``) that changed since
+    the store was compiled.
+    """
+    files = _read_manifest(data_dir)["files"]
+    tasks_dir = os.path.join(data_dir, "tasks")
+    changed = {
+        path
+        for path in paths
+        if files.get(path) is None or files[path] != _file_signature(tasks_dir, path)
+    }
+    if changed:
+        warnings.warn(
+            f"{len(changed)} file(s) changed since the store was compiled and are "
+            "read from JSON. Run `hapi.compile_store()` to update the store."
+        )
+    return changed
+
+
+def _read_json(data_dir: str, path: str) -> List[Dict]:
+    from . import _load_files
+
+    return _load_files([os.path.join(data_dir, "tasks", path)])[0]
+
+
+def _meta_signature(meta_path: str) -> Dict:
+    stat = os.stat(meta_path)
+    return {"meta_mtime_ns": stat.st_mtime_ns, "meta_size": stat.st_size}
+
+
+def _encode_json(value) -> "np.ndarray":
+    import numpy as np
+
+    return np.frombuffer(json.dumps(value).encode("utf-8"), dtype=np.uint8)
+
+
+def _decode_json(array: "np.ndarray"):
+    return json.loads(array.tobytes().decode("utf-8"))
+
+
+def _column_dtype(values: List):
+    """The NumPy dtype a column can be stored as without changing the values that
+    come back out of it, or None if it has to be stored as JSON.
+    """
+    import numpy as np
+
+    types = set(map(type, values))
+    if types == {float}:
+        return np.float64
+    if types == {int}:
+        return np.int64
+    if types == {bool}:
+        return np.bool_
+    return None
+
+
+def _write_archive(path: str, groups: Dict[str, List[Dict]]):
+    import numpy as np
+
+    arrays, index = {}, {}
+    for group, records in groups.items():
+        columns = list(records[0].keys()) if records else []
+        if any(list(record.keys()) != columns for record in records):
+            # heterogeneous records can't be split into columns, store them as is
+            arrays[f"{group}/records"] = _encode_json(records)
+            index[group] = {"length": len(records), "columns": None}
+            continue
+
+        kinds = {}
+        for column in columns:
+            values = [record[column] for record in records]
+            dtype = _column_dtype(values)
+            if dtype is None:
+                kinds[column] = "json"
+                arrays[f"{group}/{column}"] = _encode_json(values)
+            else:
+                kinds[column] = "numeric"
+                arrays[f"{group}/{column}"] = np.array(values, dtype=dtype)
+        index[group] = {"length": len(records), "columns": kinds}
+    arrays[INDEX_KEY] = _encode_json(index)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def _read_cached(
+    path: str, archive: "np.lib.npyio.NpzFile", index: Dict, group: str
+) -> List[Dict]:
+    """Read a row group of the archive at `path` through the in-process cache."""
+    records = current_cache().get((path, group), source=path)
+    if records is MISSING:
+        records, size = _read_group(archive, index, group)
+        current_cache().put((path, group), records, source=path)
+        instrument.add(bytes_read=size, cache_misses=1)
+    else:
+        instrument.add(cache_hits=1)
+    return records
+
+
+def _read_group(
+    archive: "np.lib.npyio.NpzFile", index: Dict, group: str
+) -> Tuple[List[Dict], int]:
+    """Decode a row group, returning the records and the number of bytes read."""
+    spec = index[group]
+    if spec["columns"] is None:
+        with instrument.phase("open"):
+            array = archive[f"{group}/records"]
+        with instrument.phase("parse"):
+            return _decode_json(array), array.nbytes
+
+    names, columns, size = [], [], 0
+    for column, kind in spec["columns"].items():
+        with instrument.phase("open"):
+            array = archive[f"{group}/{column}"]
+        with instrument.phase("parse"):
+            names.append(column)
+            columns.append(array.tolist() if kind == "numeric" else _decode_json(array))
+        size += array.nbytes
+    with instrument.phase("parse"):
+        if not names:
+            return [{} for _ in range(spec["length"])], size
+        return [dict(zip(names, values)) for values in zip(*columns)], size
@@ -0,0 +1,83 @@
+import json
+from typing import IO, Any, Iterator
+
+CHUNK_SIZE = 1 << 16
+
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",]"
+
+
+def iter_json_array(fp: IO[str], chunk_size: int = CHUNK_SIZE) -> Iterator[Any]:
+    """Incrementally parse a file holding a JSON array, yielding one element at a
+    time.
+
+    Only the element being parsed and one chunk of the file are held in memory, so
+    arbitrarily large files (e.g. the ``{date}.json`` prediction files) can be
+    processed with bounded memory.
+
+    Args:
+        fp (IO[str]): A text file object positioned at the start of a JSON array.
+        chunk_size (int, optional): The number of characters read from `fp` at a
+            time. Defaults to 64k.
+
+    Raises:
+        ValueError: If the file does not hold a JSON array.
+
+    Yields:
+        Any: The elements of the array, e.g. the prediction dictionaries.
+    """
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+
+    def fill() -> bool:
+        # drop what has been consumed and append the next chunk
+        nonlocal buf, pos, eof
+        chunk = fp.read(chunk_size)
+        buf, pos = buf[pos:] + chunk, 0
+        eof = not chunk
+        return not eof
+
+    def skip_whitespace() -> bool:
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buf):
+                return True
+            if not fill():
+                return False
+
+    if not skip_whitespace() or buf[pos] != "[":
+        raise ValueError("Expected a JSON array.")
+    pos += 1
+
+    expect_value = None  # None until the first element has been read
+    while True:
+        if not skip_whitespace():
+            raise ValueError("Unexpected end of JSON array.")
+        if buf[pos] == "]" and expect_value is not True:
+            return
+        if expect_value is False:
+            if buf[pos] != ",":
+                raise ValueError(
+                    f"Expected ',' or ']' in JSON array, got {buf[pos]!r}."
+                )
+            pos += 1
+            expect_value = True
+            continue
+
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if not fill():
+                    raise
+                continue
+            if not eof and (end == len(buf) or buf[end] not in _DELIMITERS):
+                # a number at the end of the buffer may have been cut short
+                fill()
+                continue
+            break
+        pos = end
+        expect_value = False
+        yield value
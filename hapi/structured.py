@@ -0,0 +1,249 @@
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+STRUCTURED_TASKS = ["mic", "ner", "str"]
+
+
+@dataclass
+class CSRMatrix:
+    """A binary sparse matrix in compressed sparse row (CSR) format.
+
+    Row ``i`` holds the (sorted, unique) column ids
+    ``indices[indptr[i]:indptr[i + 1]]``. In HAPI, rows are examples and columns are
+    tags (or entities, or transcriptions) interned with :func:`intern`.
+
+    Attributes:
+        indptr (np.ndarray): The offsets of the rows in `indices` (int64).
+        indices (np.ndarray): The column ids of the non-zero entries (int64).
+        shape (Tuple[int, int]): The number of rows and columns.
+    """
+
+    indptr: np.ndarray
+    indices: np.ndarray
+    shape: Tuple[int, int]
+
+    @classmethod
+    def from_codes(
+        cls, lengths: Sequence[int], codes: np.ndarray, n_cols: int
+    ) -> "CSRMatrix":
+        """Build a matrix from the flattened column ids of each row, dropping
+        duplicate ids within a row and negative (i.e. missing) ids.
+        """
+        lengths = np.asarray(lengths, dtype=np.int64)
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        keys = np.unique((rows * n_cols + codes)[codes >= 0])
+        indptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // n_cols, minlength=len(lengths)), out=indptr[1:])
+        return cls(indptr=indptr, indices=keys % n_cols, shape=(len(lengths), n_cols))
+
+    def row_ids(self) -> np.ndarray:
+        """The row of every non-zero entry."""
+        return np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+
+    def take(self, rows: np.ndarray) -> "CSRMatrix":
+        """Select (and possibly repeat) rows of the matrix."""
+        lengths = self.indptr[rows + 1] - self.indptr[rows]
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        # position of every output entry in `indices`
+        starts = np.repeat(self.indptr[rows] - indptr[:-1], lengths)
+        positions = starts + np.arange(indptr[-1])
+        return CSRMatrix(
+            indptr=indptr,
+            indices=self.indices[positions],
+            shape=(len(rows), self.shape[1]),
+        )
+
+
+def intern(values: List[List]) -> Tuple[List[int], np.ndarray, pd.Index]:
+    """Intern the elements of a list of lists into a vocabulary.
+
+    Returns:
+        Tuple[List[int], np.ndarray, pd.Index]: The length of each list, the
+        flattened vocabulary ids of the elements and the vocabulary.
+    """
+    values = [[] if value is None else value for value in values]
+    lengths = [len(value) for value in values]
+    codes, vocab = pd.factorize(
+        pd.Series([item for value in values for item in value], dtype=object)
+    )
+    return lengths, codes.astype(np.int64), pd.Index(vocab)
+
+
+def evaluate_structured(
+    task: Union[str, List[str]] = None,
+    dataset: Union[str, List[str]] = None,
+    api: Union[str, List[str]] = None,
+    date: Union[str, List[str]] = None,
+    per_tag: bool = False,
+) -> pd.DataFrame:
+    """Score the predictions of structured tasks ("mic", "ner" and "str"), where
+    every prediction and label is a set of tags (or entities, or transcriptions).
+
+    Use the `task`, `dataset`, `api`, and `date` parameters to filter to a subset of
+    the database, with the same semantics as in :func:`hapi.get_predictions`.
+
+    For every dataset, the tags of the labels and of the predictions of all selected
+    apis and dates are interned into one vocabulary and stored as sparse CSR
+    matrices. True positives, predicted and true tag counts are then computed for all
+    files and tags at once with vectorized sparse operations. Duplicate tags within
+    a prediction are counted once, and predictions for examples without a label are
+    ignored. True tags are counted over all labeled examples of the dataset, so the
+    tags of examples that a file has no prediction for count as missed in recall;
+    the "coverage" column reports the fraction of labeled examples predicted.
+
+    Args:
+        task (Union[str, List[str]]): The task(s) to include. If None, all
+            structured tasks are included. Default is None.
+        dataset (Union[str, List[str]]): The dataset(s) to include. If None, all
+            datasets are included. Default is None.
+        api (Union[str, List[str]]): The API(s) to include. If None, all APIs are
+            included. Default is None.
+        date (Union[str, List[str]]): The date(s) to include in format "y-m-d". If
+            None, all dates are included. Default is None.
+        per_tag (bool, optional): If True, add a "per_tag" column holding a dataframe
+            with the "precision", "recall", "f1" and "support" of every tag. Default
+            is False.
+
+    Raises:
+        ValueError: If a task that is not structured is passed.
+
+    Returns:
+        pd.DataFrame: A dataframe with one row per prediction file and the columns
+            "task", "dataset", "api", "date", "count" (the number of scored
+            predictions), "coverage" (the fraction of the labeled examples of the
+            dataset that the file has a prediction for), "micro_precision",
+            "micro_recall", "micro_f1", "macro_precision", "macro_recall" and
+            "macro_f1". Macro averages are taken over the tags that appear in the
+            labels of the dataset or the predictions of the file.
+    """
+    from . import get_labels, get_predictions
+
+    if task is None:
+        task = STRUCTURED_TASKS
+    for name in [task] if isinstance(task, str) else task:
+        if name not in STRUCTURED_TASKS:
+            raise ValueError(
+                f"`hapi.evaluate_structured` only supports the tasks "
+                f"{STRUCTURED_TASKS}, got '{name}'."
+            )
+
+    path_to_preds = get_predictions(task=task, dataset=dataset, api=api, date=date)
+    path_to_labels = get_labels(task=task, dataset=dataset)
+
+    dataset_to_keys = {}
+    for key in path_to_preds:
+        dataset_to_keys.setdefault(key.rsplit("/", 2)[0], []).append(key)
+
+    columns = ["task", "dataset", "api", "date", "count", "coverage"] + [
+        f"{average}_{name}"
+        for average in ["micro", "macro"]
+        for name in ["precision", "recall", "f1"]
+    ]
+    rows = []
+    for path, keys in dataset_to_keys.items():
+        scores = _score_dataset(
+            path_to_labels[path], [path_to_preds[key] for key in keys], per_tag
+        )
+        for key, score in zip(keys, scores):
+            rows.append(dict(zip(["task", "dataset", "api", "date"], key.split("/"))))
+            rows[-1].update(score)
+
+    return pd.DataFrame(rows, columns=columns + (["per_tag"] if per_tag else []))
+
+
+def _score_dataset(
+    labels: List[Dict], files: List[List[Dict]], per_tag: bool
+) -> List[Dict]:
+    """Score several prediction files on the same dataset in one batch."""
+    records = [pred for preds in files for pred in preds]
+
+    # intern the tags of the labels and the predictions into one vocabulary
+    lengths, codes, vocab = intern(
+        [label["true_label"] for label in labels]
+        + [pred["predicted_label"] for pred in records]
+    )
+    n_tags = max(len(vocab), 1)
+    n_labels = len(labels)
+    n_label_codes = int(np.sum(lengths[:n_labels]))
+    true = CSRMatrix.from_codes(lengths[:n_labels], codes[:n_label_codes], n_tags)
+    predicted = CSRMatrix.from_codes(lengths[n_labels:], codes[n_label_codes:], n_tags)
+
+    # join the predictions to the labels, dropping predictions for unlabeled examples
+    example_index = pd.Index([label["example_id"] for label in labels])
+    positions = example_index.get_indexer([pred["example_id"] for pred in records])
+    file_ids = np.repeat(np.arange(len(files)), [len(preds) for preds in files])
+    keep = np.flatnonzero(positions >= 0)
+    predicted = predicted.take(keep)
+    positions, file_ids = positions[keep], file_ids[keep]
+
+    # a predicted tag is a true positive if the (example, tag) pair is in the labels
+    true_keys = true.row_ids() * n_tags + true.indices
+    predicted_keys = positions[predicted.row_ids()] * n_tags + predicted.indices
+    hits = np.isin(predicted_keys, true_keys)
+
+    n_files = len(files)
+    size = n_files * n_tags
+    predicted_cells = file_ids[predicted.row_ids()] * n_tags + predicted.indices
+    tp = np.bincount(predicted_cells, hits, minlength=size).reshape(n_files, n_tags)
+    n_predicted = np.bincount(predicted_cells, minlength=size).reshape(n_files, n_tags)
+    # the true tags of every labeled example, whether a file predicts it or not
+    n_true = np.broadcast_to(
+        np.bincount(true.indices, minlength=n_tags), (n_files, n_tags)
+    )
+    count = np.bincount(file_ids, minlength=n_files)
+    covered = np.unique(file_ids * max(n_labels, 1) + positions) // max(n_labels, 1)
+    coverage = np.bincount(covered, minlength=n_files) / max(n_labels, 1)
+
+    precision, recall, f1 = _prf(tp, n_predicted, n_true)
+    micro_precision, micro_recall, micro_f1 = _prf(
+        tp.sum(axis=1), n_predicted.sum(axis=1), n_true.sum(axis=1)
+    )
+    present = (n_predicted + n_true) > 0
+    n_present = np.maximum(present.sum(axis=1), 1)
+
+    scores = []
+    for i in range(n_files):
+        score = {
+            "count": int(count[i]),
+            "coverage": coverage[i],
+            "micro_precision": micro_precision[i],
+            "micro_recall": micro_recall[i],
+            "micro_f1": micro_f1[i],
+            "macro_precision": precision[i, present[i]].sum() / n_present[i],
+            "macro_recall": recall[i, present[i]].sum() / n_present[i],
+            "macro_f1": f1[i, present[i]].sum() / n_present[i],
+        }
+        if per_tag:
+            score["per_tag"] = pd.DataFrame(
+                {
+                    "precision": precision[i, present[i]],
+                    "recall": recall[i, present[i]],
+                    "f1": f1[i, present[i]],
+                    "support": n_true[i, present[i]],
+                },
+                index=vocab[present[i][: len(vocab)]],
+            )
+        scores.append(score)
+    return scores
+
+
+def _prf(
+    tp: np.ndarray, n_predicted: np.ndarray, n_true: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Precision, recall and F1, defined as 0 where their denominator is 0."""
+    precision = np.divide(
+        tp, n_predicted, out=np.zeros(tp.shape), where=n_predicted > 0
+    )
+    recall = np.divide(tp, n_true, out=np.zeros(tp.shape), where=n_true > 0)
+    denominator = precision + recall
+    f1 = np.divide(
+        2 * precision * recall,
+        denominator,
+        out=np.zeros(tp.shape),
+        where=denominator > 0,
+    )
+    return precision, recall, f1
@@ -0,0 +1,226 @@
+import json
+import os
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from .structured import STRUCTURED_TASKS
+
+# the datasets of every task, named as in the real database so that the legacy
+# format can be converted with `hapi/convert.py`
+TASK_TO_DATASETS = {
+    "mic": ["coco", "mir", "pascal"],
+    "ner": ["gmb", "conll", "zhner"],
+    "str": ["lsvt", "rects", "mtwi"],
+    "fer": ["expw", "ferplus", "rafdb", "afnet"],
+    "sa": ["imdb", "waimai", "yelp", "shop"],
+    "scr": ["digit", "command", "amnist", "fluent"],
+}
+
+
+def generate(
+    data_dir: str,
+    tasks: List[str] = ("sa", "mic"),
+    n_datasets: int = 1,
+    n_apis: int = 2,
+    n_dates: int = 2,
+    n_examples: int = 1000,
+    n_classes: int = 10,
+    accuracy: float = 0.8,
+    legacy: bool = False,
+    seed: int = 0,
+) -> str:
+    """Write a synthetic database with the same shape as the HAPI database, e.g. to
+    benchmark the package offline.
+
+    Classification tasks ("scr", "sa" and "fer") get single integer labels and
+    structured tasks ("mic", "ner" and "str") get lists of string tags. Every API
+    predicts the true label with probability `accuracy` and a random one otherwise.
+
+    Args:
+        data_dir (str): The directory to write the database to. The database is
+            written to ``{data_dir}/tasks``, or to ``{data_dir}/legacy`` if `legacy`.
+        tasks (List[str], optional): The tasks to include. Defaults to ("sa", "mic").
+        n_datasets (int, optional): The number of datasets per task. Defaults to 1.
+        n_apis (int, optional): The number of APIs per task. Defaults to 2.
+        n_dates (int, optional): The number of dates. Defaults to 2.
+        n_examples (int, optional): The number of examples per dataset. Defaults to
+            1000.
+        n_classes (int, optional): The number of classes (or tags) per dataset.
+            Defaults to 10.
+        accuracy (float, optional): The probability that a prediction (or tag) is
+            correct. Defaults to 0.8.
+        legacy (bool, optional): Whether to write the legacy, per-model column files
+            that are converted by ``hapi/convert.py`` instead. Defaults to False.
+        seed (int, optional): The random seed. Defaults to 0.
+
+    Raises:
+        ValueError: If an unknown task is passed or `n_datasets` exceeds the number
+            of datasets of a task.
+
+    Returns:
+        str: The path to the written database.
+    """
+    rng = np.random.RandomState(seed)
+    dates = [f"{20 + i // 12:02d}-{i % 12 + 1:02d}-01" for i in range(n_dates)]
+    out_dir = os.path.join(data_dir, "legacy" if legacy else "tasks")
+
+    rows = []
+    for task in tasks:
+        if task not in TASK_TO_DATASETS:
+            raise ValueError(
+                f"Unknown task '{task}'. Please pass one of the following: "
+                f"{list(TASK_TO_DATASETS)}"
+            )
+        if n_datasets > len(TASK_TO_DATASETS[task]):
+            raise ValueError(
+                f"Task '{task}' only has {len(TASK_TO_DATASETS[task])} datasets, got "
+                f"`n_datasets={n_datasets}`."
+            )
+        structured = task in STRUCTURED_TASKS
+        for dataset in TASK_TO_DATASETS[task][:n_datasets]:
+            example_ids = [f"{dataset}_{i}" for i in range(n_examples)]
+            labels = _sample_labels(rng, n_examples, n_classes, structured)
+            for date in dates:
+                predictions = {
+                    f"api{i}": _sample_predictions(
+                        rng, labels, n_classes, accuracy, structured
+                    )
+                    for i in range(n_apis)
+                }
+                if legacy:
+                    _write_legacy(
+                        out_dir, dataset, date, example_ids, labels, predictions
+                    )
+                    continue
+                for api, (predicted, confidence) in predictions.items():
+                    path = os.path.join(task, dataset, f"{api}_{task}", f"{date}.json")
+                    _write_json(
+                        os.path.join(out_dir, path),
+                        [
+                            {
+                                "confidence": conf,
+                                "predicted_label": pred,
+                                "example_id": example_id,
+                            }
+                            for example_id, pred, conf in zip(
+                                example_ids, predicted, confidence
+                            )
+                        ],
+                    )
+                    rows.append(
+                        {
+                            "task": task,
+                            "dataset": dataset,
+                            "api": f"{api}_{task}",
+                            "date": date,
+                            "path": path,
+                            "cost_per_10k": 1.5 + int(api[3:]),
+                        }
+                    )
+            if not legacy:
+                _write_json(
+                    os.path.join(out_dir, task, dataset, "labels.json"),
+                    [
+                        {"example_id": example_id, "true_label": label}
+                        for example_id, label in zip(example_ids, labels)
+                    ],
+                )
+
+    if not legacy:
+        os.makedirs(out_dir, exist_ok=True)
+        pd.DataFrame(
+            rows, columns=["task", "dataset", "api", "date", "path", "cost_per_10k"]
+        ).to_csv(os.path.join(out_dir, "meta.csv"), index=False)
+    return out_dir
+
+
+def _sample_labels(
+    rng: np.random.RandomState, n_examples: int, n_classes: int, structured: bool
+) -> List:
+    if not structured:
+        return rng.randint(n_classes, size=n_examples).tolist()
+    return [
+        [f"tag{tag}" for tag in rng.choice(n_classes, size=size, replace=False)]
+        for size in rng.randint(1, min(n_classes, 3) + 1, size=n_examples)
+    ]
+
+
+def _sample_predictions(
+    rng: np.random.RandomState,
+    labels: List,
+    n_classes: int,
+    accuracy: float,
+    structured: bool,
+):
+    """Sample the predicted labels and confidences of one API on one date."""
+    confidence = np.round(rng.uniform(size=len(labels)), 4).tolist()
+    if not structured:
+        noise = rng.randint(n_classes, size=len(labels))
+        correct = rng.uniform(size=len(labels)) < accuracy
+        return np.where(correct, labels, noise).tolist(), confidence
+
+    # replace each true tag with a random one with probability 1 - `accuracy`
+    predicted = []
+    for label in labels:
+        keep = rng.uniform(size=len(label)) < accuracy
+        predicted.append(
+            [
+                tag if correct else f"tag{rng.randint(n_classes)}"
+                for tag, correct in zip(label, keep)
+            ]
+        )
+    return predicted, confidence
+
+
+def _write_legacy(
+    out_dir: str,
+    dataset: str,
+    date: str,
+    example_ids: List[str],
+    labels: List,
+    predictions: Dict,
+):
+    """Write the predictions of every API on one dataset on one date to a legacy
+    ``Run_{DATASET}{yyyymmdd}`` directory, with one column file per model.
+    """
+    run_dir = os.path.join(out_dir, f"Run_{dataset.upper()}20{date.replace('-', '')}")
+    os.makedirs(run_dir, exist_ok=True)
+    structured = bool(labels) and isinstance(labels[0], list)
+
+    pd.DataFrame(
+        {
+            "Index": range(1, len(predictions) + 1),
+            "MLaaS(API)": list(predictions),
+            "Cost per 10k (USD)": [1.5 + i for i in range(len(predictions))],
+        }
+    ).to_csv(os.path.join(run_dir, "meta.csv"), index=False)
+
+    def write_column(model: str, column: str, values: List):
+        with open(os.path.join(run_dir, f"{model}_{column}.txt"), "w") as f:
+            if structured and column in ["PredictedLabel", "TrueLabel"]:
+                json.dump(
+                    {
+                        example_id: [{"transcription": tag} for tag in value]
+                        for example_id, value in zip(example_ids, values)
+                    },
+                    f,
+                )
+            else:
+                f.write("".join(f"{value}\n" for value in values))
+
+    for i, (predicted, confidence) in enumerate(predictions.values()):
+        model = f"Model{i + 1}"
+        write_column(
+            model, "ImageName", [f"{example_id}.jpg" for example_id in example_ids]
+        )
+        write_column(model, "Confidence", confidence)
+        write_column(model, "PredictedLabel", predicted)
+        write_column(model, "TrueLabel", labels)
+
+
+def _write_json(path: str, records: List[Dict]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(records, f)
@@ -0,0 +1,284 @@
+import os
+import time
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from . import instrument
+from .structured import intern
+
+# the keys of a prediction that get their own column, any other keys are kept as
+# object columns in `PredictionTable.extra`
+PREDICTION_KEYS = ["confidence", "predicted_label", "example_id"]
+
+
+@dataclass(frozen=True)
+class PredictionTable:
+    """The predictions of one prediction file, stored as compact NumPy columns
+    instead of a list of dictionaries.
+
+    Example ids and labels are interned into vocabularies, which are shared by all
+    the tables returned by one call to :func:`hapi.get_predictions`, so a row costs
+    about 12 bytes (plus 8 bytes for multi-label predictions) instead of several
+    hundred. Slicing a table (e.g. ``table[1000:2000]``) returns a view that shares
+    all of its arrays. Indexing it with a boolean mask or an array of positions
+    (e.g. ``table[table.confidence > 0.9]``) copies the per-row columns but not the
+    vocabularies. Use :meth:`to_pandas` or :meth:`to_dicts` to convert a table.
+
+    Attributes:
+        example (np.ndarray): The example of each row (int32), as positions in
+            `example_ids`.
+        confidence (np.ndarray): The confidence of each row (float32). Missing
+            confidences are NaN.
+        predicted_label (np.ndarray): If `label_offsets` is None, the predicted label
+            of each row (int32) as positions in `classes`, where missing labels are
+            -1. Otherwise, the flattened predicted labels of all rows.
+        label_offsets (Optional[np.ndarray]): For multi-label predictions (i.e. the
+            structured tasks), the labels of row ``i`` are
+            ``predicted_label[label_offsets[i]:label_offsets[i + 1]]`` (int64).
+            None for single-label predictions.
+        example_ids (np.ndarray): The example id at each position.
+        classes (np.ndarray): The label at each position.
+        extra (Dict[str, np.ndarray]): Any other keys of the predictions, as object
+            arrays.
+    """
+
+    example: np.ndarray
+    confidence: np.ndarray
+    predicted_label: np.ndarray
+    label_offsets: Optional[np.ndarray]
+    example_ids: np.ndarray
+    classes: np.ndarray
+    extra: Dict[str, np.ndarray] = field(default_factory=dict)
+
+    @classmethod
+    def from_records(cls, records: List[Dict]) -> "PredictionTable":
+        """Build a table from prediction dictionaries, with vocabularies of its own.
+        If any predicted label is a list, all of them are stored as lists, and
+        missing ones become empty lists.
+        """
+        example, example_ids = pd.factorize(
+            pd.Series([record.get("example_id") for record in records], dtype=object)
+        )
+        confidence = np.array(
+            [record.get("confidence") for record in records], dtype=np.float32
+        )
+
+        labels = [record.get("predicted_label") for record in records]
+        label_offsets = None
+        if any(isinstance(label, list) for label in labels):
+            lengths, predicted_label, classes = intern(labels)
+            label_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=label_offsets[1:])
+        else:
+            predicted_label, classes = pd.factorize(pd.Series(labels, dtype=object))
+
+        extra = {}
+        for record in records:
+            for key in record.keys() - extra.keys():
+                if key not in PREDICTION_KEYS:
+                    extra[key] = np.empty(len(records), dtype=object)
+        for key, column in extra.items():
+            column[:] = [record.get(key) for record in records]
+
+        return cls(
+            example=example.astype(np.int32),
+            confidence=confidence,
+            predicted_label=predicted_label.astype(np.int32),
+            label_offsets=label_offsets,
+            example_ids=np.asarray(example_ids, dtype=object),
+            classes=np.asarray(classes, dtype=object),
+            extra=extra,
+        )
+
+    def __len__(self) -> int:
+        return len(self.example)
+
+    def __getitem__(
+        self, index: Union[int, slice, np.ndarray, List]
+    ) -> Union[Dict, "PredictionTable"]:
+        if isinstance(index, (int, np.integer)):
+            return self[[index]].to_dicts()[0]
+        if isinstance(index, slice) and index.step in (None, 1):
+            start, stop, _ = index.indices(len(self))
+            stop = max(start, stop)
+            return replace(
+                self,
+                example=self.example[start:stop],
+                confidence=self.confidence[start:stop],
+                predicted_label=(
+                    self.predicted_label[start:stop]
+                    if self.label_offsets is None
+                    else self.predicted_label
+                ),
+                label_offsets=(
+                    None
+                    if self.label_offsets is None
+                    else self.label_offsets[start : stop + 1]
+                ),
+                extra={key: column[start:stop] for key, column in self.extra.items()},
+            )
+        return self.take(np.arange(len(self))[index])
+
+    def take(self, positions: np.ndarray) -> "PredictionTable":
+        """Select (and possibly repeat) rows of the table."""
+        positions = np.asarray(positions, dtype=np.int64)
+        predicted_label, label_offsets = self.predicted_label[positions], None
+        if self.label_offsets is not None:
+            starts = self.label_offsets[positions]
+            lengths = self.label_offsets[positions + 1] - starts
+            label_offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=label_offsets[1:])
+            # position of every output label in `predicted_label`
+            flat = np.repeat(starts - label_offsets[:-1], lengths) + np.arange(
+                label_offsets[-1]
+            )
+            predicted_label = self.predicted_label[flat]
+        return replace(
+            self,
+            example=self.example[positions],
+            confidence=self.confidence[positions],
+            predicted_label=predicted_label,
+            label_offsets=label_offsets,
+            extra={key: column[positions] for key, column in self.extra.items()},
+        )
+
+    def select(self, example_id: Union[str, List[str]]) -> "PredictionTable":
+        """Select the rows on the example(s) `example_id`."""
+        wanted = np.isin(
+            self.example_ids,
+            np.array([example_id] if isinstance(example_id, str) else list(example_id)),
+        )
+        # missing examples (-1) index the appended False
+        return self[np.append(wanted, False)[self.example]]
+
+    @property
+    def nbytes(self) -> int:
+        """The size of the per-row columns in bytes, excluding the vocabularies."""
+        arrays = [self.example, self.confidence, self.predicted_label]
+        if self.label_offsets is not None:
+            arrays.append(self.label_offsets)
+        return sum(array.nbytes for array in arrays + list(self.extra.values()))
+
+    def to_pandas(self) -> pd.DataFrame:
+        """Convert the table to a dataframe with the columns "example_id",
+        "predicted_label", "confidence" and the extra keys of the predictions.
+        Example ids and single labels are categorical, multiple labels are lists.
+        """
+        columns = {
+            "example_id": pd.Categorical.from_codes(
+                self.example, categories=pd.Index(self.example_ids, dtype=object)
+            )
+        }
+        if self.label_offsets is None:
+            columns["predicted_label"] = pd.Categorical.from_codes(
+                self.predicted_label, categories=pd.Index(self.classes, dtype=object)
+            )
+        else:
+            columns["predicted_label"] = self._label_lists()
+        columns["confidence"] = self.confidence
+        columns.update(self.extra)
+        return pd.DataFrame(columns)
+
+    def to_dicts(self) -> List[Dict]:
+        """Convert the table to prediction dictionaries like the ones returned by
+        :func:`hapi.get_predictions`. Confidences are float32 values, so they may
+        differ from the original ones in the last digits.
+        """
+        example_ids = np.append(self.example_ids, None)[self.example].tolist()
+        if self.label_offsets is None:
+            labels = np.append(self.classes, None)[self.predicted_label].tolist()
+        else:
+            labels = self._label_lists()
+        confidence = [
+            None if value != value else value for value in self.confidence.tolist()
+        ]
+        columns = [confidence, labels, example_ids]
+        columns += [column.tolist() for column in self.extra.values()]
+        keys = PREDICTION_KEYS + list(self.extra)
+        return [dict(zip(keys, values)) for values in zip(*columns)]
+
+    def _label_lists(self) -> List[List]:
+        values = self.classes[self.predicted_label[self.label_offsets[0] :]].tolist()
+        starts = (self.label_offsets - self.label_offsets[0]).tolist()
+        return [values[start:stop] for start, stop in zip(starts[:-1], starts[1:])]
+
+
+def read_tables(
+    data_dir: str,
+    rows: List[Dict],
+    example_id: Union[str, List[str]] = None,
+    workers: int = None,
+) -> Dict[str, PredictionTable]:
+    """Read the prediction files listed in `rows` (rows of ``meta.csv``) as tables
+    with shared vocabularies, from the index, the store or the JSON files.
+    """
+    from . import _load_files, index, store
+
+    keys = [os.path.splitext(row["path"])[0] for row in rows]
+    if example_id is not None and index.should_read(data_dir, rows, example_id):
+        with instrument.phase("parse"):
+            path_to_preds = index.read_predictions(data_dir, rows, example_id)
+            tables = [PredictionTable.from_records(path_to_preds[k]) for k in keys]
+        example_id = None
+    elif store.has_store(data_dir):
+        tables = []
+        for _, records in store.iter_predictions(data_dir, rows):
+            with instrument.phase("parse"):
+                tables.append(PredictionTable.from_records(records))
+    else:
+        tables = _load_files(
+            [os.path.join(data_dir, "tasks", row["path"]) for row in rows],
+            workers=workers,
+            loader=load_table,
+        )
+
+    with instrument.phase("merge"):
+        tables = share_vocabularies(tables)
+        if example_id is not None:
+            tables = [table.select(example_id) for table in tables]
+    return dict(zip(keys, tables))
+
+
+def load_table(path: str) -> Tuple[PredictionTable, Dict[str, float], int]:
+    """Load a prediction file as a table, like `hapi._load_json`. Only the table is
+    sent back from a worker process, and the dictionaries are dropped right away.
+    """
+    from . import _load_json
+
+    records, phases, n_bytes = _load_json(path)
+    start = time.perf_counter()
+    table = PredictionTable.from_records(records)
+    phases["parse"] += time.perf_counter() - start
+    return table, phases, n_bytes
+
+
+def share_vocabularies(tables: List[PredictionTable]) -> List[PredictionTable]:
+    """Re-intern the example ids and the labels of several tables into one pair of
+    vocabularies, which all of the returned tables share.
+    """
+    if not tables:
+        return []
+    columns = {}
+    for vocabulary, codes in [
+        ("example_ids", "example"),
+        ("classes", "predicted_label"),
+    ]:
+        merged, shared = pd.factorize(
+            pd.Series(
+                np.concatenate([getattr(table, vocabulary) for table in tables]),
+                dtype=object,
+            )
+        )
+        shared = np.asarray(shared, dtype=object)
+        bounds = np.cumsum([0] + [len(getattr(table, vocabulary)) for table in tables])
+        for i, table in enumerate(tables):
+            # missing values (-1) index the appended -1
+            mapping = np.append(merged[bounds[i] : bounds[i + 1]], -1)
+            columns.setdefault(i, {})[codes] = mapping[getattr(table, codes)].astype(
+                np.int32
+            )
+            columns[i][vocabulary] = shared
+    return [replace(table, **columns[i]) for i, table in enumerate(tables)]
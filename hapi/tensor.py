@@ -0,0 +1,225 @@
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .metrics import CLASSIFICATION_TASKS
+
+TENSOR_DIR = "tensors"
+
+
+@dataclass
+class PredictionTensor:
+    """A dense cube of the predictions of every API on every date for one dataset.
+
+    The arrays are indexed by ``[example, api, date]`` and are read-only,
+    memory-mapped views of the files written by :func:`build_prediction_tensor`, so
+    any number of processes can share one copy of them in the page cache.
+
+    Attributes:
+        predicted_label (np.ndarray): The predicted label ids (int32), as positions
+            in `classes`. Missing predictions are -1.
+        confidence (np.ndarray): The confidences (float32). Missing predictions and
+            confidences are NaN.
+        true_label (np.ndarray): The true label id (int32) of each example, as
+            positions in `classes`. Examples without a label are -1.
+        example_ids (np.ndarray): The example id at each position of the first axis.
+        apis (List[str]): The API at each position of the second axis.
+        dates (List[str]): The date at each position of the third axis.
+        classes (List): The label at each label id.
+    """
+
+    predicted_label: np.ndarray
+    confidence: np.ndarray
+    true_label: np.ndarray
+    example_ids: np.ndarray
+    apis: List[str]
+    dates: List[str]
+    classes: List
+
+
+def build_prediction_tensor(task: str, dataset: str, data_dir: str = None) -> str:
+    """Export the predictions on one dataset as a dense, memory-mappable tensor.
+
+    The tensor is written to ``{data_dir}/tensors/{task}/{dataset}`` as ``.npy`` files
+    and can be loaded with :func:`hapi.get_prediction_tensor`. Only single-label
+    classification tasks ("scr", "sa" and "fer") are supported.
+
+    Args:
+        task (str): The task of the dataset.
+        dataset (str): The dataset to export.
+        data_dir (str, optional): Directory holding the downloaded database. Defaults
+            to None, in which case `config.data_dir` is used.
+
+    Raises:
+        ValueError: If `task` is not a single-label classification task, or the
+            database holds no predictions on `dataset`.
+
+    Returns:
+        str: The path to the exported tensor.
+    """
+    if data_dir is None:
+        from . import config
+
+        data_dir = config.data_dir
+
+    if task not in CLASSIFICATION_TASKS:
+        raise ValueError(
+            f"Prediction tensors are only supported for the tasks "
+            f"{CLASSIFICATION_TASKS}, got '{task}'."
+        )
+    path_to_preds, labels = _read_dataset(data_dir, task, dataset)
+    if not path_to_preds:
+        raise ValueError(f"No predictions found for '{task}/{dataset}'.")
+
+    keys = [key.split("/")[2:] for key in path_to_preds]
+    apis = sorted({api for api, _ in keys})
+    dates = sorted({date for _, date in keys})
+
+    # the examples are the labeled examples followed by any unlabeled ones
+    example_ids = pd.Index([label["example_id"] for label in labels])
+    example_ids = example_ids.append(
+        pd.Index(
+            [pred["example_id"] for preds in path_to_preds.values() for pred in preds]
+        )
+        .unique()
+        .difference(example_ids, sort=False)
+    )
+    true_codes, classes = pd.factorize(
+        pd.Series(
+            [label["true_label"] for label in labels]
+            + [
+                pred["predicted_label"]
+                for preds in path_to_preds.values()
+                for pred in preds
+            ],
+            dtype=object,
+        )
+    )
+    true_label = np.full(len(example_ids), -1, dtype=np.int32)
+    true_label[: len(labels)] = true_codes[: len(labels)]
+
+    out_dir = os.path.join(data_dir, TENSOR_DIR, task, dataset)
+    os.makedirs(out_dir, exist_ok=True)
+    # the index is written last and marks the tensor as complete
+    index_path = os.path.join(out_dir, "index.json")
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    shape = (len(example_ids), len(apis), len(dates))
+    predicted_label = np.lib.format.open_memmap(
+        os.path.join(out_dir, "predicted_label.npy"),
+        mode="w+",
+        dtype=np.int32,
+        shape=shape,
+    )
+    predicted_label[:] = -1
+    confidence = np.lib.format.open_memmap(
+        os.path.join(out_dir, "confidence.npy"),
+        mode="w+",
+        dtype=np.float32,
+        shape=shape,
+    )
+    confidence[:] = np.nan
+
+    offset = len(labels)
+    for (api, date), preds in zip(keys, path_to_preds.values()):
+        rows = example_ids.get_indexer([pred["example_id"] for pred in preds])
+        a, d = apis.index(api), dates.index(date)
+        predicted_label[rows, a, d] = true_codes[offset : offset + len(preds)]
+        confidence[rows, a, d] = np.array(
+            [pred.get("confidence") for pred in preds], dtype=np.float32
+        )
+        offset += len(preds)
+    predicted_label.flush()
+    confidence.flush()
+
+    np.save(os.path.join(out_dir, "true_label.npy"), true_label)
+    np.save(
+        os.path.join(out_dir, "example_ids.npy"),
+        np.array(example_ids.astype(str).tolist(), dtype=str),
+    )
+    with open(index_path, "w") as f:
+        json.dump({"apis": apis, "dates": dates, "classes": classes.tolist()}, f)
+    return out_dir
+
+
+def _read_dataset(
+    data_dir: str, task: str, dataset: str
+) -> Tuple[Dict[str, List[Dict]], List[Dict]]:
+    """Read the predictions and the labels of a dataset from the database in
+    `data_dir`, from the compiled store if it is up to date.
+    """
+    from . import _load_files, meta, store
+
+    rows = meta.get_index(data_dir).select(task=task, dataset=dataset)
+    if not rows:
+        return {}, []
+    if store.has_store(data_dir):
+        path_to_preds = store.read_predictions(data_dir, rows)
+        labels = store.read_labels(data_dir, rows[:1])[f"{task}/{dataset}"]
+        return path_to_preds, labels
+
+    tasks_dir = os.path.join(data_dir, "tasks")
+    preds = _load_files([os.path.join(tasks_dir, row["path"]) for row in rows])
+    (labels,) = _load_files([os.path.join(tasks_dir, task, dataset, "labels.json")])
+    return {
+        os.path.splitext(row["path"])[0]: pred for row, pred in zip(rows, preds)
+    }, labels
+
+
+def get_prediction_tensor(
+    task: str, dataset: str, data_dir: str = None
+) -> PredictionTensor:
+    """Load the dense prediction tensor of a dataset as zero-copy, memory-mapped
+    NumPy arrays.
+
+    The tensor has to be exported first with :func:`hapi.build_prediction_tensor`.
+    For example, to get the accuracy of every API on every date:
+
+    .. code-block:: python
+
+        t = hapi.get_prediction_tensor("scr", "command")
+        correct = t.predicted_label == t.true_label[:, None, None]
+        accuracy = correct.sum(axis=0) / (t.predicted_label >= 0).sum(axis=0)
+
+    Args:
+        task (str): The task of the dataset.
+        dataset (str): The dataset to load.
+        data_dir (str, optional): Directory holding the downloaded database. Defaults
+            to None, in which case `config.data_dir` is used.
+
+    Raises:
+        ValueError: If the tensor has not been exported yet.
+
+    Returns:
+        PredictionTensor: The prediction tensor.
+    """
+    if data_dir is None:
+        from . import config
+
+        data_dir = config.data_dir
+
+    tensor_dir = os.path.join(data_dir, TENSOR_DIR, task, dataset)
+    if not os.path.exists(os.path.join(tensor_dir, "index.json")):
+        raise ValueError(
+            f"No prediction tensor found for '{task}/{dataset}'. Export it first with "
+            f"`hapi.build_prediction_tensor('{task}', '{dataset}')`."
+        )
+    with open(os.path.join(tensor_dir, "index.json")) as f:
+        index = json.load(f)
+
+    def load(name: str) -> np.ndarray:
+        return np.load(os.path.join(tensor_dir, f"{name}.npy"), mmap_mode="r")
+
+    return PredictionTensor(
+        predicted_label=load("predicted_label"),
+        confidence=load("confidence"),
+        true_label=load("true_label"),
+        example_ids=load("example_ids"),
+        apis=index["apis"],
+        dates=index["dates"],
+        classes=index["classes"],
+    )
@@ -132,9 +132,9 @@ setup(
     packages=find_packages(exclude=["tests", "*.tests", "*.tests.*", "tests.*"]),
     # If your package is a single module, use this instead of 'packages':
     # py_modules=['mypackage'],
-    # entry_points={
-    #     'console_scripts': ['mycli=mymodule:cli'],
-    # },
+    entry_points={
+        "console_scripts": ["hapi=hapi.__main__:main"],
+    },
     install_requires=REQUIRED,
     extras_require=EXTRAS,
     include_package_data=True,
@@ -0,0 +1,108 @@
+import os
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import hapi
+import hapi.synthetic
+
+
+@pytest.fixture(autouse=True)
+def config():
+    """Restore the global config and empty the cache after every test."""
+    state = dict(vars(hapi.config), cache_size=hapi.config.cache_size)
+    hapi.config.progress = False
+    yield hapi.config
+    for name, value in state.items():
+        setattr(hapi.config, name, value)
+    hapi.cache_clear()
+
+
+@pytest.fixture
+def data_dir(tmp_path) -> str:
+    """A small synthetic database, which `config.data_dir` points to."""
+    data_dir = str(tmp_path / "data")
+    hapi.synthetic.generate(data_dir, tasks=("sa", "mic"), n_examples=50)
+    hapi.config.data_dir = data_dir
+    return data_dir
+
+
+@pytest.fixture
+def read_tree():
+    """Read the files of a directory (except hidden ones) into a dictionary mapping
+    their relative paths to their contents.
+    """
+
+    def read_tree(directory: str) -> dict:
+        files = {}
+        for root, _, names in os.walk(directory):
+            for name in names:
+                if not name.startswith("."):
+                    path = os.path.join(root, name)
+                    with open(path, "rb") as f:
+                        files[os.path.relpath(path, directory)] = f.read()
+        return files
+
+    return read_tree
+
+
+class _Handler(SimpleHTTPRequestHandler):
+    """Serves the files of a directory like a bucket: with support for ``Range``
+    requests, and dropping the connection halfway through the response to the
+    first `server.drops[path]` full requests of a path.
+    """
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        range_header = self.headers.get("Range")
+        self.server.requests.append((self.path, range_header))
+
+        start = 0
+        if range_header is not None:
+            start = int(range_header.split("=")[1].split("-")[0])
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}"
+            )
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+
+        body = data[start:]
+        if range_header is None and self.server.drops.get(self.path, 0) > 0:
+            self.server.drops[self.path] -= 1
+            body = body[: len(body) // 2]
+            self.close_connection = True
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    """A local HTTP server standing in for the hapi-data bucket, serving the files
+    of ``{tmp_path}/bucket`` at `server.url`.
+    """
+    directory = tmp_path / "bucket"
+    directory.mkdir()
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), partial(_Handler, directory=str(directory))
+    )
+    server.directory = str(directory)
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    server.requests = []
+    server.drops = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
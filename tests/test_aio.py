@@ -0,0 +1,93 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import hapi
+from hapi import aio
+
+
+def test_matches_local(data_dir):
+    async def load():
+        return await asyncio.gather(
+            aio.get_predictions(task="sa"), aio.get_labels(task="sa"), aio.summary()
+        )
+
+    path_to_preds, path_to_labels, summary = asyncio.run(load())
+    assert path_to_preds == hapi.get_predictions(task="sa")
+    assert path_to_labels == hapi.get_labels(task="sa")
+    assert summary.equals(hapi.summary())
+
+    tables = asyncio.run(aio.get_predictions(format="table", concurrency=1))
+    assert {key: table.to_dicts() for key, table in tables.items()} == {
+        key: table.to_dicts()
+        for key, table in hapi.get_predictions(format="table").items()
+    }
+
+    hapi.compile_store()
+    assert asyncio.run(aio.get_predictions(api="api1_mic")) == hapi.get_predictions(
+        api="api1_mic"
+    )
+    assert asyncio.run(aio.get_labels()) == hapi.get_labels()
+
+    with pytest.raises(ValueError, match="Unknown format"):
+        asyncio.run(aio.get_predictions(format="arrow"))
+
+
+def test_shared_load(data_dir):
+    path = os.path.join(data_dir, "tasks", "sa", "imdb", "labels.json")
+    calls = []
+
+    def loader(path):
+        calls.append(path)
+        return [path], {}, 0
+
+    async def load():
+        with ThreadPoolExecutor(2) as executor:
+            return await asyncio.gather(
+                *(aio._load(path, loader, executor) for _ in range(3))
+            )
+
+    assert asyncio.run(load()) == [[path]] * 3
+    assert calls == [path]
+
+
+def test_cancel(data_dir):
+    path = os.path.join(data_dir, "tasks", "sa", "imdb", "labels.json")
+    release = threading.Event()
+    calls = []
+
+    def loader(path):
+        calls.append(path)
+        return [path], {}, 0
+
+    async def load():
+        with ThreadPoolExecutor(1) as executor:
+            # keep the only thread busy, so the load is still pending
+            blocker = asyncio.get_running_loop().run_in_executor(executor, release.wait)
+            task = asyncio.ensure_future(aio._load(path, loader, executor))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            release.set()
+            await blocker
+
+    asyncio.run(load())
+    assert calls == []
+
+
+def test_instrumented(data_dir):
+    async def load():
+        return await asyncio.gather(aio.get_predictions(task="sa"), aio.get_labels())
+
+    hapi.stats_reset()
+    path_to_preds, _ = asyncio.run(load())
+    stats = hapi.stats()
+    assert stats["aio.get_predictions"]["calls"] == 1
+    assert stats["aio.get_predictions"]["records"] == sum(
+        len(preds) for preds in path_to_preds.values()
+    )
+    assert stats["aio.get_labels"]["calls"] == 1
@@ -0,0 +1,104 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+import hapi
+from hapi.cache import MISSING, FileCache, sizeof
+
+
+def _write(path, text: str) -> str:
+    with open(path, "w") as f:
+        f.write(text)
+    return str(path)
+
+
+def test_eviction(tmp_path):
+    cache = FileCache(max_size=10)
+    a, b, c = (_write(tmp_path / name, name * 4) for name in "abc")
+
+    cache.put(a, "A", size=4)
+    cache.put(b, "B", size=4)
+    assert cache.get(a) == "A"
+    # `b` is now the least recently used entry, and 4 + 4 + 4 > 10
+    cache.put(c, "C", size=4)
+    assert cache.get(b) is MISSING
+    assert cache.get(a) == "A" and cache.get(c) == "C"
+
+    info = cache.info()
+    assert (info.hits, info.misses, info.evictions) == (3, 1, 1)
+    assert (info.entries, info.size, info.max_size) == (2, 8, 10)
+
+    # entries larger than the budget are not cached
+    cache.put(b, "B", size=11)
+    assert cache.get(b) is MISSING
+
+    cache.max_size = 5
+    assert cache.info().entries == 1 and cache.get(c) == "C"
+
+    cache.clear()
+    assert cache.info() == FileCache(max_size=5).info()
+
+
+def test_invalidation(tmp_path):
+    cache = FileCache(max_size=100)
+    path = _write(tmp_path / "a.json", "[1]")
+    archive = _write(tmp_path / "a.npz", "...")
+
+    cache.put(path, [1])
+    cache.put((archive, "group"), [2], source=archive, size=1)
+    assert cache.get(path) == [1]
+    assert cache.get((archive, "group"), source=archive) == [2]
+
+    _write(tmp_path / "a.json", "[10]")
+    stat = os.stat(archive)
+    os.utime(archive, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert cache.get(path) is MISSING
+    assert cache.get((archive, "group"), source=archive) is MISSING
+
+
+def test_sizeof(data_dir):
+    path = os.path.join(data_dir, "tasks", "mic", "coco", "api0_mic", "20-01-01.json")
+    with open(path) as f:
+        records = json.load(f)
+
+    def exact(value) -> int:
+        size = sys.getsizeof(value)
+        if isinstance(value, dict):
+            return size + sum(exact(item) for item in value.values())
+        if isinstance(value, list):
+            return size + sum(exact(item) for item in value)
+        return size
+
+    # 50 records are estimated from a sample of 32
+    assert sizeof(records) == pytest.approx(exact(records), rel=0.2)
+    assert sizeof(records[:10]) == exact(records[:10])
+    assert sizeof(records) > 2 * os.path.getsize(path)
+    assert sizeof(np.zeros(100)) == 800
+
+    # entries are sized by their decoded value by default
+    cache = FileCache(max_size=1 << 20)
+    cache.put(path, records)
+    assert cache.info().size == sizeof(records)
+
+
+def test_disabled(tmp_path):
+    cache = FileCache()
+    path = _write(tmp_path / "a.json", "[1]")
+    cache.put(path, [1])
+    assert cache.get(path) is MISSING
+    assert cache.info().misses == 0
+
+
+def test_loaders_use_cache(data_dir):
+    hapi.config.cache_size = 1 << 30
+    for compiled in [False, True]:
+        if compiled:
+            hapi.compile_store()
+        hapi.cache_clear()
+        path_to_preds = hapi.get_predictions(task="sa")
+        assert hapi.cache_info().hits == 0
+        assert hapi.get_predictions(task="sa") == path_to_preds
+        assert hapi.cache_info().hits == len(path_to_preds)
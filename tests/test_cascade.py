@@ -0,0 +1,87 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import hapi
+import hapi.synthetic
+from hapi.cascade import _pareto
+
+GRID = [0.0, 0.3, 0.6, 0.9]
+
+
+@pytest.fixture
+def cascade_dir(tmp_path) -> str:
+    data_dir = str(tmp_path / "data")
+    hapi.synthetic.generate(
+        data_dir, tasks=("sa",), n_apis=3, n_dates=1, n_examples=200, accuracy=0.6
+    )
+    hapi.config.data_dir = data_dir
+    return data_dir
+
+
+def _simulate(apis, thresholds, labels, preds, costs):
+    """Run a cascade example by example."""
+    n_correct, cost = 0, 0.0
+    for example_id, label in labels.items():
+        for position, api in enumerate(apis):
+            pred = preds[api][example_id]
+            cost += costs[api]
+            last = position == len(apis) - 1
+            if last or pred["confidence"] >= thresholds[position]:
+                n_correct += pred["predicted_label"] == label
+                break
+    return n_correct / len(labels), cost / len(labels)
+
+
+def test_simulate_cascades_matches_brute_force(cascade_dir):
+    df = hapi.simulate_cascades("sa", "imdb", "20-01-01", thresholds=GRID, pareto=False)
+
+    labels = {
+        label["example_id"]: label["true_label"]
+        for label in hapi.get_labels()["sa/imdb"]
+    }
+    preds = {
+        key.split("/")[2]: {pred["example_id"]: pred for pred in records}
+        for key, records in hapi.get_predictions().items()
+    }
+    costs = dict(zip(hapi.summary()["api"], hapi.summary()["cost_per_10k"]))
+
+    expected = {}
+    for length in [1, 2, 3]:
+        for apis in itertools.permutations(sorted(preds), length):
+            for thresholds in itertools.product(GRID, repeat=length - 1):
+                expected[(apis, thresholds)] = _simulate(
+                    apis, thresholds, labels, preds, costs
+                )
+    assert len(df) == len(expected)
+    for row in df.itertuples():
+        accuracy, cost = expected[(row.apis, row.thresholds)]
+        assert row.accuracy == pytest.approx(accuracy)
+        assert row.cost_per_10k == pytest.approx(cost)
+    assert df["cost_per_10k"].is_monotonic_increasing
+
+    frontier = hapi.simulate_cascades("sa", "imdb", "20-01-01", thresholds=GRID)
+    assert frontier["cost_per_10k"].is_monotonic_increasing
+    assert frontier["accuracy"].is_monotonic_increasing
+    # no cascade is both cheaper (or as cheap) and more accurate than the frontier
+    for row in frontier.itertuples():
+        dominated = (df["cost_per_10k"] <= row.cost_per_10k) & (
+            df["accuracy"] > row.accuracy
+        )
+        assert not dominated.any()
+
+
+def test_pareto():
+    accuracy = np.array([0.5, 0.7, 0.6, 0.7, 0.9, 0.4])
+    cost = np.array([1.0, 2.0, 2.0, 3.0, 4.0, 0.5])
+    assert _pareto(accuracy, cost).tolist() == [5, 0, 1, 4]
+
+
+def test_simulate_cascades_errors(cascade_dir):
+    with pytest.raises(ValueError, match="only supports the tasks"):
+        hapi.simulate_cascades("mic", "coco", "20-01-01")
+    with pytest.raises(ValueError, match="max_length"):
+        hapi.simulate_cascades("sa", "imdb", "20-01-01", max_length=4)
+    with pytest.raises(ValueError, match="No predictions found"):
+        hapi.simulate_cascades("sa", "imdb", "19-01-01")
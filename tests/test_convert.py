@@ -0,0 +1,143 @@
+import json
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+import hapi.synthetic
+from hapi.convert import LocalSink, _write_json, build, get_units, publish
+
+
+@pytest.fixture
+def legacy_dir(tmp_path) -> str:
+    """A small synthetic database in the legacy format."""
+    return hapi.synthetic.generate(
+        str(tmp_path), tasks=("sa", "mic"), n_dates=3, n_examples=50, legacy=True
+    )
+
+
+def _touch_unit(unit: dict):
+    path = os.path.join(unit["predictions_dir"], f"{unit['model']}_Confidence.txt")
+    with open(path) as f:
+        _, rest = f.read().split("\n", 1)
+    with open(path, "w") as f:
+        f.write(f"0.9999\n{rest}")
+
+
+def test_parallel_build_matches_serial(legacy_dir, tmp_path, read_tree):
+    serial_dir, parallel_dir = str(tmp_path / "1"), str(tmp_path / "4")
+    rows = build(legacy_dir, serial_dir, workers=1)
+    assert build(legacy_dir, parallel_dir, workers=4) == rows
+    assert len(rows) == len(get_units(legacy_dir))
+    assert read_tree(parallel_dir) == read_tree(serial_dir)
+
+
+def test_incremental_build(legacy_dir, tmp_path, read_tree):
+    dst_dir = str(tmp_path / "tasks")
+    build(legacy_dir, dst_dir, workers=4)
+    assert build(legacy_dir, dst_dir, workers=4) == []
+
+    unit = get_units(legacy_dir)[0]
+    _touch_unit(unit)
+    rows = build(legacy_dir, dst_dir, workers=4)
+    assert [(row["api"], row["date"]) for row in rows] == [(unit["api"], unit["date"])]
+    full_dir = str(tmp_path / "full")
+    build(legacy_dir, full_dir, incremental=False)
+    assert read_tree(dst_dir) == read_tree(full_dir)
+
+
+def test_converted_records(legacy_dir, tmp_path):
+    dst_dir = str(tmp_path / "tasks")
+    build(legacy_dir, dst_dir)
+
+    run_dir = os.path.join(legacy_dir, "Run_COCO20200101")
+    with open(os.path.join(run_dir, "Model2_PredictedLabel.txt")) as f:
+        predicted = json.load(f)
+    with open(os.path.join(run_dir, "Model2_Confidence.txt")) as f:
+        confidence = [float(line) for line in f]
+    with open(os.path.join(dst_dir, "mic/coco/api1_mic/20-01-01.json")) as f:
+        records = json.load(f)
+    assert records == [
+        {
+            "confidence": conf,
+            "predicted_label": [tag["transcription"] for tag in predicted[example_id]],
+            "example_id": example_id,
+        }
+        for example_id, conf in zip(predicted, confidence)
+    ]
+
+    with open(os.path.join(dst_dir, "sa/imdb/labels.json")) as f:
+        labels = json.load(f)
+    with open(
+        os.path.join(legacy_dir, "Run_IMDB20200101", "Model1_TrueLabel.txt")
+    ) as f:
+        assert [label["true_label"] for label in labels] == [int(line) for line in f]
+    assert labels[0]["example_id"] == "imdb_0"
+
+
+def test_removed_units_are_pruned(legacy_dir, tmp_path, read_tree):
+    dst_dir = str(tmp_path / "tasks")
+    build(legacy_dir, dst_dir)
+    removed = sorted(os.listdir(legacy_dir))[-1]
+    shutil.rmtree(os.path.join(legacy_dir, removed))
+    build(legacy_dir, dst_dir)
+
+    meta = pd.read_csv(os.path.join(dst_dir, "meta.csv"))
+    assert len(meta) == len(get_units(legacy_dir))
+    paths = {path for path in read_tree(dst_dir) if path.endswith(".json")}
+    assert paths == set(meta.path) | {
+        os.path.join(task, dataset, "labels.json")
+        for task, dataset in zip(meta.task, meta.dataset)
+    }
+
+
+def test_publish_uploads_changed_files(legacy_dir, tmp_path, read_tree):
+    dst_dir = str(tmp_path / "data" / "tasks")
+    sink = LocalSink(str(tmp_path / "bucket"))
+    build(legacy_dir, dst_dir)
+    uploaded = publish(dst_dir, sink)
+    assert uploaded[-1] == "tasks/meta.csv"
+    assert set(os.listdir(sink.directory)) == {
+        "hapi.tar.gz",
+        "hapi.tar.gz.sha256",
+        "manifest.json",
+        "tasks",
+    }
+    assert read_tree(os.path.join(sink.directory, "tasks")) == read_tree(dst_dir)
+
+    build(legacy_dir, dst_dir)
+    assert publish(dst_dir, sink) == []
+
+    unit = get_units(legacy_dir)[0]
+    _touch_unit(unit)
+    build(legacy_dir, dst_dir)
+    path = f"tasks/{unit['task']}/{unit['dataset']}/{unit['api']}/{unit['date']}.json"
+    assert publish(dst_dir, sink) == [path]
+    assert read_tree(os.path.join(sink.directory, "tasks")) == read_tree(dst_dir)
+
+
+def test_publish_requires_tasks_dir(legacy_dir, tmp_path):
+    with pytest.raises(ValueError):
+        publish(legacy_dir, LocalSink(str(tmp_path / "bucket")))
+
+
+def test_json_format(tmp_path):
+    # the format of `DataFrame.to_json`, which the published files were written in
+    path = str(tmp_path / "preds.json")
+    _write_json(
+        [
+            {
+                "confidence": 0.123456789012345,
+                "predicted_label": 1,
+                "example_id": "a/b",
+            },
+            {"confidence": float("nan"), "predicted_label": 2, "example_id": "é"},
+        ],
+        path,
+    )
+    with open(path) as f:
+        assert f.read() == (
+            '[{"confidence":0.123456789,"predicted_label":1,"example_id":"a\\/b"},'
+            '{"confidence":null,"predicted_label":2,"example_id":"\\u00e9"}]'
+        )
@@ -0,0 +1,121 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import hapi
+import hapi.synthetic
+
+KEY_A = "sa/imdb/api0_sa/20-01-01"
+KEY_B = "sa/imdb/api0_sa/20-02-01"
+
+
+def _rewrite(data_dir: str, key: str, edit):
+    path = os.path.join(data_dir, "tasks", f"{key}.json")
+    with open(path) as f:
+        preds = json.load(f)
+    preds = edit(preds)
+    with open(path, "w") as f:
+        json.dump(preds, f)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_diff(data_dir):
+    # drop the first example on the later date and predict a new one instead
+    _rewrite(
+        data_dir,
+        KEY_B,
+        lambda preds: preds[1:] + [dict(preds[0], example_id="imdb_new")],
+    )
+    d = hapi.diff("sa", "imdb", "api0_sa", "20-01-01", "20-02-01")
+
+    path_to_preds = hapi.get_predictions(task="sa", api="api0_sa")
+    preds_a = {pred["example_id"]: pred for pred in path_to_preds[KEY_A]}
+    preds_b = {pred["example_id"]: pred for pred in path_to_preds[KEY_B]}
+    common = [example_id for example_id in preds_a if example_id in preds_b]
+
+    assert d.example_ids.tolist() == common
+    assert d.added.tolist() == ["imdb_new"]
+    assert d.removed.tolist() == ["imdb_0"]
+    changed = [
+        preds_a[i]["predicted_label"] != preds_b[i]["predicted_label"] for i in common
+    ]
+    assert d.changed.tolist() == changed
+    assert d.change_rate == pytest.approx(np.mean(changed))
+    assert d.confidence_delta == pytest.approx(
+        [preds_b[i]["confidence"] - preds_a[i]["confidence"] for i in common]
+    )
+    for (label_a, label_b), count in d.transitions.stack().items():
+        assert count == sum(
+            preds_a[i]["predicted_label"] == label_a
+            and preds_b[i]["predicted_label"] == label_b
+            for i in common
+        )
+    assert d.transitions.values.sum() == len(common)
+
+
+def test_diff_structured(data_dir):
+    # the same tags in another order and with duplicates are not a change
+    path = os.path.join(data_dir, "tasks", "mic/coco/api0_mic/20-01-01.json")
+    with open(path) as f:
+        earlier = json.load(f)
+    _rewrite(
+        data_dir,
+        "mic/coco/api0_mic/20-02-01",
+        lambda preds: [
+            dict(pred, predicted_label=pred["predicted_label"][::-1] * 2)
+            for pred in earlier
+        ],
+    )
+
+    d = hapi.diff("mic", "coco", "api0_mic", "20-01-01", "20-02-01")
+    assert d.transitions is None
+    assert not d.changed.any()
+
+
+def test_diff_missing_date(data_dir):
+    with pytest.raises(ValueError, match="No predictions found"):
+        hapi.diff("sa", "imdb", "api0_sa", "20-01-01", "19-01-01")
+
+
+def test_diff_consecutive(data_dir):
+    hapi.config.cache_size = 1 << 30
+    df = hapi.diff_consecutive(task="sa")
+    assert df[["api", "date_a", "date_b"]].values.tolist() == [
+        ["api0_sa", "20-01-01", "20-02-01"],
+        ["api1_sa", "20-01-01", "20-02-01"],
+    ]
+    d = hapi.diff("sa", "imdb", "api0_sa", "20-01-01", "20-02-01")
+    assert df["diff"][0] is d
+    assert df["n_changed"][0] == d.changed.sum()
+    assert df["count"][0] == 50
+
+    # the cached result is invalidated when one of the files changes
+    _rewrite(data_dir, KEY_B, lambda preds: preds[:10])
+    df = hapi.diff_consecutive(task="sa", api="api0_sa")
+    assert df["count"].tolist() == [10]
+
+
+def test_diff_consecutive_loads_each_file_once(tmp_path):
+    hapi.config.data_dir = str(tmp_path)
+    hapi.synthetic.generate(str(tmp_path), tasks=("sa",), n_dates=4, n_examples=20)
+    hapi.stats_reset()
+    df = hapi.diff_consecutive(api="api0_sa")
+    assert df["date_b"].tolist()[:-1] == df["date_a"].tolist()[1:]
+    assert len(df) == 3
+    # every date is loaded once, even the ones that end a pair and start the next
+    stats = hapi.stats()["get_predictions"]
+    assert stats["calls"] == 4
+    assert stats["bytes_read"] == sum(
+        os.path.getsize(os.path.join(str(tmp_path), "tasks", path))
+        for path in hapi.summary()["path"]
+        if "/api0_sa/" in path
+    )
+    assert (
+        df["diff"][1].change_rate
+        == hapi.diff(
+            "sa", "imdb", "api0_sa", df["date_a"][1], df["date_b"][1]
+        ).change_rate
+    )
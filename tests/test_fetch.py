@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+
+import pytest
+
+import hapi
+
+
+@pytest.fixture
+def published(bucket, data_dir) -> str:
+    """The ``tasks`` directory of a small database, archived into the bucket along
+    with its checksum.
+    """
+    archive_path = os.path.join(bucket.directory, "hapi.tar.gz")
+    with tarfile.open(archive_path, "w:gz") as tar:
+        tar.add(os.path.join(data_dir, "tasks"), arcname="tasks")
+    with open(archive_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    with open(archive_path + ".sha256", "w") as f:
+        f.write(f"{digest}  hapi.tar.gz\n")
+    return os.path.join(data_dir, "tasks")
+
+
+def _mirror(bucket, data_dir: str):
+    """Publish the ``tasks`` tree of `data_dir` to the bucket, with its manifest."""
+    shutil.rmtree(os.path.join(bucket.directory, "tasks"), ignore_errors=True)
+    shutil.copytree(
+        os.path.join(data_dir, "tasks"), os.path.join(bucket.directory, "tasks")
+    )
+    shutil.copy(
+        hapi.fetch.write_manifest(data_dir),
+        os.path.join(bucket.directory, "manifest.json"),
+    )
+
+
+def test_download_resumes(bucket, published, tmp_path, read_tree):
+    data_dir = str(tmp_path / "dst")
+    bucket.drops["/hapi.tar.gz"] = 1
+    hapi.download(data_dir, url=f"{bucket.url}/hapi.tar.gz")
+
+    assert read_tree(os.path.join(data_dir, "tasks")) == read_tree(published)
+    ranges = [range_ for path, range_ in bucket.requests if path == "/hapi.tar.gz"]
+    assert ranges[0] is None and ranges[1].startswith("bytes=")
+
+
+def test_download_subset(bucket, published, tmp_path):
+    data_dir = str(tmp_path / "dst")
+    with pytest.warns(UserWarning, match="Pruned meta.csv to the 4 downloaded"):
+        hapi.download(data_dir, task="sa", url=f"{bucket.url}/hapi.tar.gz")
+
+    hapi.config.data_dir = data_dir
+    assert set(hapi.summary().task) == {"sa"}
+    assert all(key.startswith("sa/") for key in hapi.get_predictions())
+
+    # another subset is added to the first one
+    with pytest.warns(UserWarning, match="2 prediction files .* are not listed"):
+        hapi.download(
+            data_dir, task="mic", api="api1_mic", url=f"{bucket.url}/hapi.tar.gz"
+        )
+    assert set(zip(hapi.summary().task, hapi.summary().api)) == {
+        ("sa", "api0_sa"),
+        ("sa", "api1_sa"),
+        ("mic", "api1_mic"),
+    }
+    assert set(hapi.get_labels()) == {"sa/imdb", "mic/coco"}
+
+
+def test_download_checksum_mismatch(bucket, published, tmp_path):
+    with open(os.path.join(bucket.directory, "hapi.tar.gz.sha256"), "w") as f:
+        f.write(f"{'0' * 64}  hapi.tar.gz\n")
+
+    data_dir = str(tmp_path / "dst")
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        hapi.download(data_dir, url=f"{bucket.url}/hapi.tar.gz")
+    assert not os.path.exists(os.path.join(data_dir, "tasks"))
+
+
+def test_download_without_checksum(bucket, published, tmp_path, read_tree):
+    os.remove(os.path.join(bucket.directory, "hapi.tar.gz.sha256"))
+
+    data_dir = str(tmp_path / "dst")
+    with pytest.warns(UserWarning, match="No checksum is published"):
+        hapi.download(data_dir, url=f"{bucket.url}/hapi.tar.gz")
+    assert read_tree(os.path.join(data_dir, "tasks")) == read_tree(published)
+
+
+def test_update(bucket, published, data_dir, tmp_path, read_tree):
+    _mirror(bucket, data_dir)
+    dst_dir = str(tmp_path / "dst")
+    hapi.download(dst_dir, url=f"{bucket.url}/hapi.tar.gz")
+    manifest_url = f"{bucket.url}/manifest.json"
+    assert hapi.update(dst_dir, url=manifest_url) == []
+
+    # publish a change to one file
+    path = "tasks/sa/imdb/api0_sa/20-01-01.json"
+    with open(os.path.join(data_dir, path)) as f:
+        preds = json.load(f)
+    preds[0]["confidence"] = 0.999
+    with open(os.path.join(data_dir, path), "w") as f:
+        json.dump(preds, f)
+    _mirror(bucket, data_dir)
+
+    hapi.build_prediction_tensor("sa", "imdb", data_dir=dst_dir)
+
+    # meta.csv is replaced along with any fetched file
+    bucket.requests.clear()
+    assert hapi.update(dst_dir, url=manifest_url) == [path, "tasks/meta.csv"]
+    assert [path for path, _ in bucket.requests] == [
+        "/manifest.json",
+        f"/{path}",
+        "/tasks/meta.csv",
+    ]
+    assert read_tree(os.path.join(dst_dir, "tasks")) == read_tree(published)
+    # the tensors of the updated dataset are out of date
+    assert not os.path.exists(os.path.join(dst_dir, "tensors", "sa", "imdb"))
+
+    hapi.config.data_dir = dst_dir
+    assert hapi.get_predictions(task="sa")[path[6:-5]][0]["confidence"] == 0.999
+
+    # a file that was modified locally is fetched again
+    with open(os.path.join(dst_dir, path), "a") as f:
+        f.write(" ")
+    assert hapi.update(dst_dir, url=manifest_url) == [path, "tasks/meta.csv"]
+    assert hapi.update(dst_dir, url=manifest_url) == []
+
+
+def test_update_subset(bucket, data_dir, tmp_path):
+    _mirror(bucket, data_dir)
+    dst_dir = str(tmp_path / "dst")
+    with pytest.warns(UserWarning, match="Pruned meta.csv"):
+        fetched = hapi.update(
+            dst_dir, api="api1_mic", url=f"{bucket.url}/manifest.json"
+        )
+    # labels are selected by task and dataset only, like in `hapi.download`
+    assert sorted(fetched) == [
+        "tasks/meta.csv",
+        "tasks/mic/coco/api1_mic/20-01-01.json",
+        "tasks/mic/coco/api1_mic/20-02-01.json",
+        "tasks/mic/coco/labels.json",
+        "tasks/sa/imdb/labels.json",
+    ]
+    hapi.config.data_dir = dst_dir
+    assert set(hapi.summary().api) == {"api1_mic"}
+
+    # the pruned meta.csv is up to date as long as the published one is
+    bucket.requests.clear()
+    assert hapi.update(dst_dir, api="api1_mic", url=f"{bucket.url}/manifest.json") == []
+    assert [path for path, _ in bucket.requests] == ["/manifest.json"]
+
+
+def test_update_checksum_mismatch(bucket, data_dir, tmp_path):
+    _mirror(bucket, data_dir)
+    path = os.path.join(bucket.directory, "tasks", "mic", "coco", "labels.json")
+    with open(path, "a") as f:
+        f.write(" ")
+
+    dst_dir = str(tmp_path / "dst")
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        hapi.update(dst_dir, task="mic", url=f"{bucket.url}/manifest.json", workers=1)
+    assert not os.path.exists(os.path.join(dst_dir, "tasks", "meta.csv"))
@@ -0,0 +1,49 @@
+"""``import hapi`` must not import pandas, NumPy, tqdm or urllib (they are loaded on
+first use) and must take at most `IMPORT_BUDGET` seconds more than starting a bare
+interpreter.
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+IMPORT_BUDGET = 0.15
+
+# modules that must not be imported by `import hapi`
+HEAVY_MODULES = ["pandas", "numpy", "tqdm", "urllib.request", "meerkat"]
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run(code: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        env=dict(os.environ, PYTHONPATH=ROOT_DIR),
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+
+def _time_import(code: str, repeat: int = 5) -> float:
+    # the fastest of `repeat` runs, each in a fresh interpreter
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _run(code)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def test_import_is_lazy():
+    imported = _run(
+        "import sys, hapi; "
+        f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    ).stdout.split()
+    assert imported == []
+
+
+def test_import_time():
+    elapsed = _time_import("import hapi") - _time_import("pass")
+    assert elapsed <= IMPORT_BUDGET
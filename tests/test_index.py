@@ -0,0 +1,106 @@
+import json
+import os
+
+import pytest
+
+import hapi
+from hapi import index
+
+EXAMPLE_IDS = ["imdb_3", "imdb_7", "coco_1"]
+
+
+def test_query(data_dir):
+    with pytest.raises(ValueError, match="build_index"):
+        hapi.query(example_id="imdb_3")
+
+    hapi.build_index()
+    assert index.has_index(data_dir)
+
+    path_to_preds = hapi.get_predictions()
+    path_to_labels = hapi.get_labels()
+    labels = {
+        label["example_id"]: label["true_label"]
+        for labels in path_to_labels.values()
+        for label in labels
+    }
+    expected = [
+        (*key.split("/"), pred["example_id"], pred["predicted_label"])
+        for key, preds in path_to_preds.items()
+        for pred in preds
+        if pred["example_id"] in EXAMPLE_IDS and "/api1_" in key
+    ]
+    df = hapi.query(example_id=EXAMPLE_IDS, api=["api1_sa", "api1_mic"])
+    assert len(df) == len(expected) == 2 * len(EXAMPLE_IDS)
+    assert sorted(
+        map(tuple, df[["task", "dataset", "api", "date", "example_id"]].values)
+    ) == sorted(key[:5] for key in expected)
+    for row in df.itertuples():
+        assert row.true_label == labels[row.example_id]
+
+    df = hapi.query(example_id="imdb_3", date="20-02-01")
+    assert df["api"].tolist() == ["api0_sa", "api1_sa"]
+
+
+def test_get_predictions_from_index(data_dir):
+    scanned = hapi.get_predictions(example_id=EXAMPLE_IDS)
+    assert sum(len(preds) for preds in scanned.values()) == 4 * len(EXAMPLE_IDS)
+
+    hapi.build_index()
+    assert hapi.get_predictions(example_id=EXAMPLE_IDS) == scanned
+    assert hapi.get_predictions(task="mic", example_id="coco_1") == {
+        key: preds for key, preds in scanned.items() if key.startswith("mic/")
+    }
+
+
+def test_stale_index(data_dir):
+    hapi.build_index()
+    path = os.path.join(data_dir, "tasks", "meta.csv")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert not index.has_index(data_dir)
+    with pytest.raises(ValueError, match="No up-to-date index"):
+        hapi.query()
+
+
+def test_changed_file(data_dir):
+    hapi.build_index()
+    key = "sa/imdb/api0_sa/20-01-01"
+    path = os.path.join(data_dir, "tasks", f"{key}.json")
+    with open(path) as f:
+        preds = json.load(f)
+    preds[3]["confidence"] = 0.999
+    with open(path, "w") as f:
+        json.dump(preds, f)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    # the changed file is filtered from JSON, the others are read from the index
+    assert hapi.get_predictions(example_id="imdb_3")[key][0]["confidence"] == 0.999
+    assert len(hapi.query(example_id="imdb_3", api="api1_sa")) == 2
+    with pytest.raises(ValueError, match="No up-to-date index"):
+        hapi.query(example_id="imdb_3", api="api0_sa")
+
+
+def test_many_example_ids(data_dir):
+    hapi.build_index()
+    # more ids than SQLite accepts as parameters, most of which don't exist
+    example_ids = [f"imdb_{i}" for i in range(2000)]
+    df = hapi.query(example_id=example_ids, api="api0_sa")
+    assert len(df) == 2 * 50
+    assert hapi.get_predictions(example_id=example_ids, api="api0_sa") == (
+        hapi.get_predictions(api="api0_sa")
+    )
+
+
+def test_large_lookups_scan_files(data_dir, monkeypatch):
+    hapi.build_index()
+    monkeypatch.setattr(index, "MAX_LOOKUP_EXAMPLES", 2)
+
+    def read_predictions(*args):
+        pytest.fail("3 examples were looked up in the index")
+
+    monkeypatch.setattr(index, "read_predictions", read_predictions)
+    scanned = hapi.get_predictions(example_id=EXAMPLE_IDS)
+    assert sum(len(preds) for preds in scanned.values()) == 4 * len(EXAMPLE_IDS)
+    tables = hapi.get_predictions(example_id=EXAMPLE_IDS, format="table")
+    assert sum(len(table) for table in tables.values()) == 4 * len(EXAMPLE_IDS)
@@ -0,0 +1,57 @@
+import pytest
+
+import hapi
+
+
+@pytest.fixture
+def calls():
+    """The `CallStats` of every loader call made during the test."""
+    calls = []
+    hapi.stats_reset()
+    hapi.add_hook(calls.append)
+    yield calls
+    hapi.remove_hook(calls.append)
+    hapi.stats_reset()
+
+
+def test_get_predictions_stats(data_dir, calls):
+    path_to_preds = hapi.get_predictions(task="sa")
+
+    call = calls[-1]
+    assert isinstance(call, hapi.CallStats)
+    assert call.function == "get_predictions"
+    assert call.records == sum(len(preds) for preds in path_to_preds.values())
+    assert call.bytes_read > 0
+    assert call.cache_misses == len(path_to_preds) and call.cache_hits == 0
+    assert call.wall >= call.phases["meta"] > 0
+    assert call.profile is None
+    # `summary` is not called through the public loader, so it is not reported
+    assert [call.function for call in calls] == ["get_predictions"]
+
+
+def test_stats_totals(data_dir, calls):
+    hapi.config.cache_size = 1 << 30
+    hapi.get_labels()
+    hapi.get_labels()
+    for _ in hapi.iter_predictions(task="mic", batch_size=10):
+        pass
+
+    stats = hapi.stats()
+    assert stats["get_labels"]["calls"] == 2
+    assert stats["get_labels"]["records"] == 2 * 2 * 50
+    assert stats["get_labels"]["cache_hits"] == 2
+    assert stats["iter_predictions"]["calls"] == 1
+    assert stats["iter_predictions"]["records"] == 4 * 50
+    assert stats["get_labels"]["wall"] == pytest.approx(
+        sum(call.wall for call in calls if call.function == "get_labels")
+    )
+
+    hapi.stats_reset()
+    assert hapi.stats() == {}
+
+
+def test_profile(data_dir, calls):
+    hapi.config.profile = True
+    hapi.get_labels()
+    assert calls[-1].profile is not None
+    assert calls[-1].profile.total_calls > 0
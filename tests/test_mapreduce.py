@@ -0,0 +1,76 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import hapi
+from hapi.mapreduce import _shards
+
+
+def n_confident(table, true_label):
+    return int((table.confidence > 0.5).sum())
+
+
+def test_shards():
+    shards = _shards([5, 1, 9, 3, 4, 2], 2)
+    # 5 + 4 + 2 + 1 and 9 + 3, with the files of a shard in their original order
+    assert shards == [[2, 3], [0, 1, 4, 5]]
+    assert _shards([1, 1], 4) == [[0], [1]]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_aggregate(data_dir, workers):
+    df = hapi.aggregate(
+        ["count", "accuracy", "mean_confidence", "label_histogram", n_confident],
+        by=["task", "api"],
+        workers=workers,
+    )
+    assert df[["task", "api"]].values.tolist() == [
+        ["sa", "api0_sa"],
+        ["sa", "api1_sa"],
+        ["mic", "api0_mic"],
+        ["mic", "api1_mic"],
+    ]
+
+    labels = {
+        label["example_id"]: label["true_label"]
+        for labels in hapi.get_labels().values()
+        for label in labels
+    }
+    for row in df.itertuples():
+        preds = [
+            pred
+            for key, preds in hapi.get_predictions(task=row.task, api=row.api).items()
+            for pred in preds
+        ]
+        assert row.count == len(preds)
+        assert row.mean_confidence == pytest.approx(
+            np.mean([pred["confidence"] for pred in preds]), rel=1e-6
+        )
+        assert row.n_confident == sum(np.float32(p["confidence"]) > 0.5 for p in preds)
+        if row.task == "sa":
+            assert row.accuracy == pytest.approx(
+                np.mean(
+                    [p["predicted_label"] == labels[p["example_id"]] for p in preds]
+                )
+            )
+            histogram = Counter(pred["predicted_label"] for pred in preds)
+        else:
+            assert np.isnan(row.accuracy)
+            histogram = Counter(
+                label for pred in preds for label in pred["predicted_label"]
+            )
+        assert row.label_histogram == dict(histogram)
+
+
+def test_aggregate_by_file(data_dir):
+    df = hapi.aggregate("count", task="sa", date="20-02-01", workers=1)
+    assert df.columns.tolist() == ["task", "dataset", "api", "date", "count"]
+    assert df["count"].tolist() == [50, 50]
+
+
+def test_aggregate_errors(data_dir):
+    with pytest.raises(ValueError, match="Unknown aggregate"):
+        hapi.aggregate("median", workers=1)
+    with pytest.raises(ValueError, match="Unknown column"):
+        hapi.aggregate("count", by="example_id", workers=1)
@@ -0,0 +1,90 @@
+import os
+
+import pandas as pd
+import pytest
+
+from hapi.meta import MetaIndex, get_index
+
+
+@pytest.fixture
+def df() -> pd.DataFrame:
+    return pd.DataFrame(
+        [
+            {
+                "task": task,
+                "dataset": dataset,
+                "api": api,
+                "date": date,
+                "path": f"{task}/{dataset}/{api}/{date}.json",
+                "cost_per_10k": 1.5,
+            }
+            for task, dataset in [("sa", "imdb"), ("sa", "yelp"), ("mic", "coco")]
+            for api in [f"api0_{task}", f"api1_{task}"]
+            for date in ["20-01-01", "21-01-01"]
+        ]
+    )
+
+
+@pytest.fixture
+def index(df, tmp_path) -> MetaIndex:
+    path = str(tmp_path / "meta.csv")
+    df.to_csv(path, index=False)
+    return MetaIndex(path)
+
+
+def _scan(df: pd.DataFrame, **filters) -> pd.DataFrame:
+    for column, value in filters.items():
+        if value is not None:
+            values = [value] if isinstance(value, str) else value
+            df = df[df[column].isin(values)]
+    return df
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        {},
+        {"task": "sa"},
+        {"task": ["sa", "mic"], "date": "21-01-01"},
+        {"dataset": ["imdb", "coco"], "api": ["api1_sa", "api0_mic"]},
+        {"task": "sa", "dataset": "imdb", "api": "api0_sa", "date": "20-01-01"},
+        {"task": "sa", "dataset": "coco"},
+        {"task": "scr"},
+        {"task": "sa", "api": None},
+    ],
+)
+def test_select_matches_scan(df, index, filters):
+    assert index.select(**filters) == _scan(df, **filters).to_dict("records")
+
+
+def test_lookup(df, index):
+    assert len(index) == len(df)
+    assert index.lookup("mic", "coco", "api1_mic", "20-01-01") == df.iloc[10].to_dict()
+    with pytest.raises(KeyError):
+        index.lookup("mic", "coco", "api1_mic", "19-01-01")
+
+
+def test_missing_cost(df, tmp_path):
+    df.loc[3, "cost_per_10k"] = None
+    path = str(tmp_path / "meta.csv")
+    df.to_csv(path, index=False)
+    index = MetaIndex(path)
+    assert [row["cost_per_10k"] for row in index.rows[2:5]] == [1.5, None, 1.5]
+    assert (
+        index.df["cost_per_10k"].isna().tolist() == df["cost_per_10k"].isna().tolist()
+    )
+
+
+def test_df(df, index):
+    assert index.df["task"].dtype == "category"
+    assert index.df.astype(str).equals(df.astype(str))
+
+
+def test_get_index_is_cached(data_dir):
+    index = get_index(data_dir)
+    assert get_index(data_dir) is index
+
+    meta_path = os.path.join(data_dir, "tasks", "meta.csv")
+    with open(meta_path, "a") as f:
+        f.write("\n")
+    assert get_index(data_dir) is not index
@@ -0,0 +1,95 @@
+import math
+
+import numpy as np
+import pytest
+
+import hapi
+from hapi.metrics import _score_dataset
+
+LABELS = [
+    {"example_id": "a", "true_label": 0},
+    {"example_id": "b", "true_label": 1},
+    {"example_id": "c", "true_label": 1},
+    {"example_id": "d", "true_label": 0},
+]
+
+
+def _pred(example_id, label, confidence):
+    return {
+        "example_id": example_id,
+        "predicted_label": label,
+        "confidence": confidence,
+    }
+
+
+def test_score_dataset():
+    files = [
+        [
+            _pred("a", 0, 0.95),
+            _pred("b", 0, 0.85),
+            _pred("c", 1, 0.15),
+            _pred("d", 0, 0.91),
+            # unlabeled, so ignored
+            _pred("e", 0, 0.5),
+        ],
+        [
+            _pred("a", 1, 1.0),
+            # unknown class and no confidence, so counted but not binned
+            _pred("b", 7, float("nan")),
+        ],
+    ]
+    first, second = _score_dataset(LABELS, files, n_bins=10)
+
+    assert first["count"] == 4
+    assert first["accuracy"] == 0.75
+    assert first["per_class_accuracy"] == {0: 1.0, 1: 0.5}
+    calibration = first["calibration"]
+    assert calibration["count"] == [0, 1, 0, 0, 0, 0, 0, 0, 1, 2]
+    assert calibration["confidence"][9] == pytest.approx(0.93)
+    assert calibration["confidence"][8] == pytest.approx(0.85)
+    assert calibration["accuracy"][1] == 1.0
+    assert calibration["accuracy"][8] == 0.0
+    assert calibration["accuracy"][9] == 1.0
+    assert math.isnan(calibration["accuracy"][0])
+    # (2 * |1 - 0.93| + |0 - 0.85| + |1 - 0.15|) / 4
+    assert first["ece"] == pytest.approx(0.46)
+
+    assert second["count"] == 2
+    assert second["accuracy"] == 0.0
+    assert second["per_class_accuracy"] == {0: 0.0, 1: 0.0}
+    assert second["calibration"]["count"] == [0] * 9 + [1]
+    assert second["ece"] == pytest.approx(1.0)
+
+
+def test_score_dataset_rejects_structured_labels():
+    with pytest.raises(ValueError, match="single-label"):
+        _score_dataset([{"example_id": "a", "true_label": ["tag"]}], [[]], n_bins=10)
+
+
+def test_evaluate(data_dir):
+    df = hapi.evaluate(metric=["accuracy", "per_class_accuracy", "calibration"])
+    # structured tasks are skipped when no task is passed
+    assert set(df["task"]) == {"sa"}
+    assert len(df) == len(hapi.summary().query("task == 'sa'"))
+
+    labels = {
+        label["example_id"]: label["true_label"]
+        for label in hapi.get_labels(task="sa")["sa/imdb"]
+    }
+    for row in df.itertuples():
+        preds = hapi.get_predictions(task="sa", api=row.api, date=row.date)
+        (preds,) = preds.values()
+        correct = [
+            pred["predicted_label"] == labels[pred["example_id"]] for pred in preds
+        ]
+        assert row.count == len(preds)
+        assert row.accuracy == pytest.approx(np.mean(correct))
+        assert sum(row.calibration["count"]) == len(preds)
+        assert 0 <= row.ece <= 1
+
+
+def test_evaluate_rejects_structured_tasks(data_dir):
+    with pytest.raises(ValueError, match="only supports the tasks"):
+        hapi.evaluate(task="mic")
+    with pytest.raises(ValueError, match="Unknown metric"):
+        hapi.evaluate(metric="f1")
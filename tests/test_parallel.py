@@ -0,0 +1,37 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import hapi
+from hapi.parallel import map_ordered
+
+
+def _slow_square(x: int) -> int:
+    # later items finish first, so the results only come back in order if
+    # `map_ordered` reorders them
+    time.sleep(0.01 * (5 - x))
+    return x * x
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_map_ordered(executor):
+    results = map_ordered(_slow_square, range(5), workers=4, executor=executor)
+    assert results == [0, 1, 4, 9, 16]
+
+
+def test_map_ordered_with_executor():
+    with ThreadPoolExecutor(2) as executor:
+        assert map_ordered(_slow_square, [3, 1], executor=executor) == [9, 1]
+        # the executor is not shut down
+        assert executor.submit(_slow_square, 2).result() == 4
+
+
+def test_map_ordered_unknown_executor():
+    with pytest.raises(ValueError, match="Unknown executor"):
+        map_ordered(_slow_square, [1], workers=2, executor="gpu")
+
+
+def test_parallel_loading_matches_serial(data_dir):
+    assert hapi.get_predictions(workers=4) == hapi.get_predictions(workers=1)
+    assert hapi.get_labels(workers=4) == hapi.get_labels(workers=1)
@@ -0,0 +1,92 @@
+import json
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+from urllib.request import urlopen
+
+import pytest
+
+import hapi
+from hapi import client
+from hapi.server import DEFAULT_CACHE_SIZE, HAPIServer, make_server
+
+
+@contextmanager
+def _serve(server: HAPIServer) -> Iterator[str]:
+    """Run `server` in a background thread, yielding its URL."""
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def server_url(data_dir) -> str:
+    """The URL of a server over the synthetic database, in a background thread."""
+    with _serve(make_server(data_dir, host="127.0.0.1", port=0, quiet=True)) as url:
+        yield url
+
+
+def test_client_matches_local(server_url):
+    # the client is called directly, with `config.server_url` unset, so that the
+    # server (in the same process) reads the database
+    assert client.get_predictions(server_url) == hapi.get_predictions()
+    assert client.get_predictions(
+        server_url, task="mic", date="20-02-01", example_id=["coco_0", "coco_7"]
+    ) == hapi.get_predictions(
+        task="mic", date="20-02-01", example_id=["coco_0", "coco_7"]
+    )
+    assert client.get_labels(server_url, task="sa") == hapi.get_labels(task="sa")
+    assert client.summary(server_url).equals(hapi.summary())
+
+    tables = client.get_predictions(server_url, task="sa", format="table")
+    assert {key: table.to_dicts() for key, table in tables.items()} == {
+        key: table.to_dicts()
+        for key, table in hapi.get_predictions(task="sa", format="table").items()
+    }
+
+
+def test_pages(server_url):
+    with urlopen(f"{server_url}/predictions?task=sa&limit=3&offset=2") as response:
+        assert response.headers["X-HAPI-Next-Offset"] is None
+        page = json.load(response)
+    assert (page["offset"], page["next"], page["total"]) == (2, None, 4)
+    assert list(page["predictions"]) == list(hapi.get_predictions(task="sa"))[2:]
+
+    with urlopen(f"{server_url}/labels?format=ndjson") as response:
+        lines = [json.loads(line) for line in response]
+    assert {line["key"]: line["labels"] for line in lines} == hapi.get_labels()
+
+
+def test_metrics(server_url):
+    client.get_labels(server_url)
+    with pytest.raises(ValueError, match="Unknown format"):
+        client._request(server_url, "predictions", {}, format="xml")
+    with pytest.raises(ValueError, match="offset"):
+        client._request(server_url, "labels", {}, offset=-1)
+
+    metrics = client.metrics(server_url)
+    assert metrics["endpoints"]["/labels"]["requests"] == 2
+    assert metrics["endpoints"]["/labels"]["errors"] == 1
+    assert metrics["endpoints"]["/predictions"]["errors"] == 1
+    assert metrics["cache"]["max_size"] == DEFAULT_CACHE_SIZE
+
+
+def test_config_unchanged(data_dir, tmp_path):
+    # the server answers from its own settings, even if the process is configured
+    # to read another directory or to query a server itself
+    expected = hapi.get_labels(task="sa")
+    hapi.config.data_dir = str(tmp_path / "other")
+    hapi.config.server_url = "http://127.0.0.1:1"
+    hapi.config.cache_size = 2**20
+    state = dict(vars(hapi.config), cache_size=hapi.config.cache_size)
+
+    server = make_server(data_dir, port=0, preload=True, quiet=True)
+    with _serve(server) as url:
+        assert client.get_labels(url, task="sa") == expected
+    assert dict(vars(hapi.config), cache_size=hapi.config.cache_size) == state
+    assert server.cache.info().entries > 0
+    assert hapi.cache_info().entries == 0
@@ -0,0 +1,95 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+
+import hapi
+
+
+def _count_confident(name, queue):
+    with hapi.attach(name) as shared:
+        queue.put(
+            {
+                key: int((table.confidence > 0.5).sum())
+                for key, table in shared.predictions.items()
+            }
+        )
+
+
+@pytest.fixture
+def shared(data_dir):
+    shared = hapi.publish(task=["sa", "mic"])
+    yield shared
+    shared.unlink()
+
+
+def test_round_trip(shared):
+    tables = hapi.get_predictions(format="table")
+    assert shared.predictions.keys() == tables.keys()
+    for key, table in tables.items():
+        assert shared.predictions[key].to_dicts() == table.to_dicts()
+    assert shared.labels == hapi.get_labels()
+
+    with hapi.attach(shared.name) as attached:
+        table = attached.predictions["mic/coco/api0_mic/20-01-01"]
+        assert not table.confidence.flags.writeable
+        assert table.label_offsets is not None
+        # the vocabularies shared by the tables are decoded once
+        sa = [t for key, t in attached.predictions.items() if key.startswith("sa/")]
+        assert sa[0].example_ids is sa[1].example_ids
+        with pytest.raises(ValueError):
+            table.confidence[0] = 1.0
+
+
+def test_workers(shared):
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    processes = [
+        context.Process(target=_count_confident, args=(shared.name, queue))
+        for _ in range(2)
+    ]
+    for process in processes:
+        process.start()
+    results = [queue.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join()
+
+    expected = {
+        key: int((table.confidence > 0.5).sum())
+        for key, table in shared.predictions.items()
+    }
+    assert results == [expected, expected]
+    # the segment outlives the workers that attached to it
+    with hapi.attach(shared.name) as attached:
+        assert np.array_equal(
+            attached.predictions["sa/imdb/api0_sa/20-01-01"].confidence,
+            shared.predictions["sa/imdb/api0_sa/20-01-01"].confidence,
+        )
+
+
+def test_unlink(data_dir):
+    shared = hapi.publish("hapi_test_unlink", task="sa")
+    shared.unlink()
+    assert shared.predictions == {}
+    with pytest.raises(FileNotFoundError):
+        hapi.attach("hapi_test_unlink")
+
+
+def test_publisher_owns_segment(data_dir):
+    # a publisher that exits without unlinking leaves its segment to the resource
+    # tracker, which destroys it, while attaching does not take ownership
+    code = "import hapi; hapi.attach(hapi.publish('hapi_test_owner').name).close()"
+    env = dict(os.environ, HAPI_DATA_DIR=data_dir, HAPI_NO_PROGRESS="1")
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            hapi.attach("hapi_test_owner").close()
+        except FileNotFoundError:
+            break
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
@@ -0,0 +1,101 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import hapi
+from hapi.mapreduce import QUANTILES, _quantiles
+
+KEY = "sa/imdb/api0_sa/20-01-01"
+
+
+def _edit_predictions(data_dir: str, key: str, confidence: float):
+    path = os.path.join(data_dir, "tasks", f"{key}.json")
+    with open(path) as f:
+        preds = json.load(f)
+    for pred in preds:
+        pred["confidence"] = confidence
+    with open(path, "w") as f:
+        json.dump(preds, f)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_quantiles():
+    histogram = np.zeros(1000, dtype=np.int64)
+    histogram[[100, 500, 900]] = [1, 2, 1]
+    assert _quantiles(histogram) == {
+        0.05: 0.1005,
+        0.25: 0.1005,
+        0.5: 0.5005,
+        0.75: 0.5005,
+        0.95: 0.9005,
+    }
+    assert all(np.isnan(value) for value in _quantiles(histogram * 0).values())
+
+
+def test_summary_extended(data_dir):
+    with pytest.raises(ValueError, match="build_stats"):
+        hapi.summary(extended=True)
+
+    hapi.build_stats(workers=1)
+    df = hapi.summary(extended=True)
+    assert len(df) == len(hapi.summary())
+    expected = hapi.aggregate(
+        ["count", "accuracy", "mean_confidence", "confidence_quantiles"], workers=1
+    )
+    assert df["count"].tolist() == expected["count"].tolist()
+    assert df["accuracy"].tolist() == pytest.approx(
+        expected["accuracy"].tolist(), nan_ok=True
+    )
+    assert df["mean_confidence"].tolist() == pytest.approx(
+        expected["mean_confidence"].tolist()
+    )
+    for row, quantiles in zip(
+        df.itertuples(), expected["confidence_quantiles"].tolist()
+    ):
+        assert [row.confidence_q05, row.confidence_q50] == [
+            quantiles[0.05],
+            quantiles[0.5],
+        ]
+    assert df["size"].tolist() == [
+        os.path.getsize(os.path.join(data_dir, "tasks", path)) for path in df["path"]
+    ]
+
+    preds = hapi.get_predictions(task="sa")[KEY]
+    row = df[df["path"] == f"{KEY}.json"].iloc[0]
+    assert row["label_histogram"] == {
+        label: sum(pred["predicted_label"] == label for pred in preds)
+        for label in {pred["predicted_label"] for pred in preds}
+    }
+    # the confidences of every prediction are within their quantile bins
+    confidences = np.sort([pred["confidence"] for pred in preds])
+    for q in QUANTILES:
+        value = confidences[int(np.ceil(q * len(confidences))) - 1]
+        assert row[f"confidence_q{round(q * 100):02d}"] == pytest.approx(
+            value, abs=0.001
+        )
+
+
+def test_stale_stats(data_dir):
+    hapi.build_stats(workers=1)
+    _edit_predictions(data_dir, KEY, 0.25)
+
+    with pytest.warns(UserWarning, match="out of date"):
+        df = hapi.summary(extended=True).set_index("path")
+    assert df["count"].isna().tolist() == [path == f"{KEY}.json" for path in df.index]
+
+    # only the changed file is aggregated again
+    stats_path = os.path.join(data_dir, "tasks", "meta_stats.json")
+    with open(stats_path) as f:
+        stats = json.load(f)
+    stats["files"]["sa/imdb/api1_sa/20-01-01.json"]["count"] = -1
+    with open(stats_path, "w") as f:
+        json.dump(stats, f)
+
+    hapi.build_stats(workers=1)
+    df = hapi.summary(extended=True).set_index("path")
+    assert df.at[f"{KEY}.json", "mean_confidence"] == pytest.approx(0.25)
+    assert df.at[f"{KEY}.json", "confidence_q50"] == pytest.approx(0.2505)
+    assert df.at["sa/imdb/api1_sa/20-01-01.json", "count"] == -1
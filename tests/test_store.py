@@ -0,0 +1,58 @@
+import json
+import os
+import warnings
+
+import pytest
+
+import hapi
+from hapi import store
+
+
+def _edit_predictions(data_dir: str, key: str, confidence: float):
+    """Overwrite the confidence of the first prediction of a file, and move its
+    modification time so the change is detected even if the size is the same.
+    """
+    path = os.path.join(data_dir, "tasks", f"{key}.json")
+    with open(path) as f:
+        preds = json.load(f)
+    preds[0]["confidence"] = confidence
+    with open(path, "w") as f:
+        json.dump(preds, f)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_round_trip(data_dir):
+    path_to_preds = hapi.get_predictions()
+    path_to_labels = hapi.get_labels()
+
+    hapi.compile_store()
+    assert store.has_store(data_dir)
+    assert hapi.get_predictions() == path_to_preds
+    assert hapi.get_labels() == path_to_labels
+    assert hapi.get_predictions(task="sa", api="api0_sa") == {
+        key: preds for key, preds in path_to_preds.items() if "/api0_sa/" in key
+    }
+
+
+def test_changed_file_is_read_from_json(data_dir):
+    hapi.compile_store()
+    key = "sa/imdb/api0_sa/20-01-01"
+    _edit_predictions(data_dir, key, 0.999)
+
+    with pytest.warns(UserWarning, match="changed since the store was compiled"):
+        path_to_preds = hapi.get_predictions(task="sa")
+    assert path_to_preds[key][0]["confidence"] == 0.999
+
+    hapi.compile_store()
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert hapi.get_predictions(task="sa")[key][0]["confidence"] == 0.999
+
+
+def test_changed_meta_invalidates_store(data_dir):
+    hapi.compile_store()
+    meta_path = os.path.join(data_dir, "tasks", "meta.csv")
+    with open(meta_path, "a") as f:
+        f.write("\n")
+    assert not store.has_store(data_dir)
@@ -0,0 +1,55 @@
+import io
+import json
+from collections import defaultdict
+
+import pytest
+
+import hapi
+from hapi.stream import iter_json_array
+
+RECORDS = [
+    {"confidence": 0.123456789, "predicted_label": 12345, "example_id": "a"},
+    {"confidence": 1e-07, "predicted_label": ["tag1", "tag2"], "example_id": "b,]"},
+    [],
+    -42,
+    "x",
+    None,
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 1 << 16])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_iter_json_array(chunk_size, indent):
+    # small chunks split the numbers, strings and delimiters at every position
+    text = json.dumps(RECORDS, indent=indent)
+    assert list(iter_json_array(io.StringIO(text), chunk_size=chunk_size)) == RECORDS
+
+
+@pytest.mark.parametrize("text", ["[]", " [ ] ", "[1]", "[10000]"])
+def test_iter_json_array_small(text):
+    assert list(iter_json_array(io.StringIO(text), chunk_size=1)) == json.loads(text)
+
+
+@pytest.mark.parametrize("text", ["", "{}", "[1", "[1 2]", "[1,]", "[,1]"])
+def test_iter_json_array_invalid(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text), chunk_size=2))
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_iter_predictions_matches_get_predictions(data_dir, compiled):
+    if compiled:
+        hapi.compile_store()
+    path_to_preds = hapi.get_predictions(task="sa")
+
+    streamed = defaultdict(list)
+    for key, pred in hapi.iter_predictions(task="sa"):
+        streamed[key].append(pred)
+    assert streamed == path_to_preds
+
+    batches = list(hapi.iter_predictions(task="sa", batch_size=16))
+    assert all(0 < len(batch) <= 16 for _, batch in batches)
+    batched = defaultdict(list)
+    for key, batch in batches:
+        batched[key].extend(batch)
+    assert batched == path_to_preds
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+import hapi
+from hapi.structured import CSRMatrix, _score_dataset, intern
+
+LABELS = [
+    {"example_id": "a", "true_label": ["x", "y"]},
+    {"example_id": "b", "true_label": ["y"]},
+    {"example_id": "c", "true_label": ["z"]},
+]
+
+
+def _pred(example_id, tags):
+    return {"example_id": example_id, "predicted_label": tags, "confidence": None}
+
+
+def test_csr_matrix():
+    m = CSRMatrix.from_codes([3, 0, 2], np.array([2, 0, 2, -1, 1]), n_cols=3)
+    # duplicate and missing ids are dropped, and rows are sorted
+    assert m.indptr.tolist() == [0, 2, 2, 3]
+    assert m.indices.tolist() == [0, 2, 1]
+    assert m.row_ids().tolist() == [0, 0, 2]
+
+    taken = m.take(np.array([2, 0, 2]))
+    assert taken.shape == (3, 3)
+    assert taken.indptr.tolist() == [0, 1, 3, 4]
+    assert taken.indices.tolist() == [1, 0, 2, 1]
+
+
+def test_intern():
+    lengths, codes, vocab = intern([["b", "a"], None, ["a"]])
+    assert lengths == [2, 0, 1]
+    assert vocab[codes].tolist() == ["b", "a", "a"]
+
+
+def test_score_dataset():
+    files = [
+        [
+            # the duplicate tag is counted once, "w" is a false positive
+            _pred("a", ["x", "x", "w"]),
+            _pred("b", ["y"]),
+            # unlabeled, so ignored
+            _pred("e", ["x"]),
+        ],
+        [_pred("c", ["z"]), _pred("a", [])],
+    ]
+    first, second = _score_dataset(LABELS, files, per_tag=True)
+
+    # the tags of "c" count as missed even though the file has no prediction for it
+    assert first["count"] == 2
+    assert first["coverage"] == pytest.approx(2 / 3)
+    assert first["micro_precision"] == pytest.approx(2 / 3)
+    assert first["micro_recall"] == pytest.approx(2 / 4)
+    assert first["micro_f1"] == pytest.approx(4 / 7)
+    assert first["macro_precision"] == pytest.approx((1 + 1 + 0 + 0) / 4)
+    assert first["macro_recall"] == pytest.approx((1 + 0.5 + 0 + 0) / 4)
+    per_tag = first["per_tag"]
+    assert per_tag.loc["y"].tolist() == pytest.approx([1.0, 0.5, 2 / 3, 2])
+    assert per_tag.loc["w"].tolist() == [0.0, 0.0, 0.0, 0]
+    assert per_tag["support"].to_dict() == {"x": 1, "y": 2, "z": 1, "w": 0}
+
+    assert second["count"] == 2
+    assert second["coverage"] == pytest.approx(2 / 3)
+    assert second["micro_precision"] == 1.0
+    assert second["micro_recall"] == pytest.approx(1 / 4)
+    # "w" is neither in the labels nor in the predictions of the file
+    assert set(second["per_tag"].index) == {"x", "y", "z"}
+    assert second["macro_recall"] == pytest.approx(1 / 3)
+
+
+def test_evaluate_structured(data_dir):
+    df = hapi.evaluate_structured()
+    assert set(df["task"]) == {"mic"}
+    assert len(df) == 4
+    assert (df["coverage"] == 1.0).all()
+    assert ((df["micro_recall"] >= 0) & (df["micro_recall"] <= 1)).all()
+    with pytest.raises(ValueError):
+        hapi.evaluate_structured(task="sa")
@@ -0,0 +1,66 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import hapi
+import hapi.synthetic
+from hapi.convert import build
+
+
+def test_generate(tmp_path, read_tree):
+    data_dir = str(tmp_path / "a")
+    tasks_dir = hapi.synthetic.generate(
+        data_dir, tasks=("sa", "mic"), n_datasets=2, n_apis=3, n_dates=2, n_examples=20
+    )
+    assert tasks_dir == os.path.join(data_dir, "tasks")
+
+    meta = pd.read_csv(os.path.join(tasks_dir, "meta.csv"))
+    assert len(meta) == 2 * 2 * 3 * 2
+    assert set(meta["dataset"]) == {"imdb", "waimai", "coco", "mir"}
+
+    hapi.config.data_dir = data_dir
+    labels = hapi.get_labels()
+    assert all(len(records) == 20 for records in labels.values())
+    assert isinstance(labels["sa/imdb"][0]["true_label"], int)
+    assert isinstance(labels["mic/coco"][0]["true_label"], list)
+
+    # the same seed gives the same database
+    hapi.synthetic.generate(
+        str(tmp_path / "b"),
+        tasks=("sa", "mic"),
+        n_datasets=2,
+        n_apis=3,
+        n_dates=2,
+        n_examples=20,
+    )
+    assert read_tree(tasks_dir) == read_tree(str(tmp_path / "b" / "tasks"))
+
+
+def test_generate_legacy_converts_to_same_database(tmp_path):
+    tasks_dir = hapi.synthetic.generate(str(tmp_path), n_examples=20)
+    legacy_dir = hapi.synthetic.generate(str(tmp_path), n_examples=20, legacy=True)
+    dst_dir = str(tmp_path / "converted")
+    build(legacy_dir, dst_dir)
+
+    meta = pd.read_csv(os.path.join(tasks_dir, "meta.csv"))
+    converted = pd.read_csv(os.path.join(dst_dir, "meta.csv"))
+    assert sorted(map(tuple, converted.values.tolist())) == sorted(
+        map(tuple, meta.values.tolist())
+    )
+    for path in meta["path"]:
+        with open(os.path.join(tasks_dir, path)) as f:
+            expected = json.load(f)
+        with open(os.path.join(dst_dir, path)) as f:
+            assert json.load(f) == [
+                dict(record, confidence=pytest.approx(record["confidence"]))
+                for record in expected
+            ]
+
+
+def test_generate_errors(tmp_path):
+    with pytest.raises(ValueError, match="Unknown task"):
+        hapi.synthetic.generate(str(tmp_path), tasks=("xyz",))
+    with pytest.raises(ValueError, match="only has 3 datasets"):
+        hapi.synthetic.generate(str(tmp_path), tasks=("mic",), n_datasets=4)
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+import hapi
+from hapi.table import PredictionTable, share_vocabularies
+
+RECORDS = [
+    {"confidence": 0.5, "predicted_label": ["a", "b"], "example_id": "x"},
+    {"confidence": None, "predicted_label": [], "example_id": "y"},
+    {"confidence": 0.25, "predicted_label": ["c"], "example_id": "x", "context": 1},
+    {"confidence": 1.0, "predicted_label": ["b", "a", "a"], "example_id": "z"},
+]
+
+
+def _assert_records_equal(actual, expected):
+    """Compare prediction dictionaries, with float32 precision for confidences."""
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        assert a.keys() >= e.keys()
+        assert {k: v for k, v in a.items() if k != "confidence"} == {
+            k: v for k, v in e.items() if k != "confidence"
+        }
+        assert a["confidence"] == pytest.approx(e["confidence"])
+
+
+def test_round_trip():
+    table = PredictionTable.from_records(RECORDS)
+    assert table.label_offsets.tolist() == [0, 2, 2, 3, 6]
+    assert table.example.tolist() == [0, 1, 0, 2]
+    assert np.isnan(table.confidence[1])
+    expected = [dict(record, context=record.get("context")) for record in RECORDS]
+    assert table.to_dicts() == expected
+
+    records = [{"confidence": 0.5, "predicted_label": 3, "example_id": "x"}]
+    records.append({"confidence": 0.75, "example_id": "y"})
+    table = PredictionTable.from_records(records)
+    assert table.label_offsets is None
+    assert table.predicted_label.tolist() == [0, -1]
+    assert table.to_dicts()[1] == dict(records[1], predicted_label=None)
+    df = table.to_pandas()
+    assert df["example_id"].tolist() == ["x", "y"]
+    assert df["predicted_label"].isna().tolist() == [False, True]
+
+
+def test_indexing():
+    table = PredictionTable.from_records(RECORDS)
+    view = table[1:3]
+    assert np.shares_memory(view.example, table.example)
+    assert view.to_dicts() == table.to_dicts()[1:3]
+    assert table[3] == table.to_dicts()[3]
+
+    taken = table.take([3, 0, 3])
+    assert taken.label_offsets.tolist() == [0, 3, 5, 8]
+    assert [r["predicted_label"] for r in taken.to_dicts()] == [
+        ["b", "a", "a"],
+        ["a", "b"],
+        ["b", "a", "a"],
+    ]
+    assert taken.classes is table.classes
+    assert table[table.confidence > 0.4].to_dicts() == [
+        table.to_dicts()[0],
+        table.to_dicts()[3],
+    ]
+    assert table.select("x").to_dicts() == [table.to_dicts()[0], table.to_dicts()[2]]
+    assert len(table.select("missing")) == 0
+
+
+def test_share_vocabularies():
+    a = PredictionTable.from_records(RECORDS[:2])
+    b = PredictionTable.from_records(RECORDS[2:])
+    shared_a, shared_b = share_vocabularies([a, b])
+    assert shared_a.example_ids is shared_b.example_ids
+    assert shared_a.classes is shared_b.classes
+    assert shared_a.example_ids.tolist() == ["x", "y", "z"]
+    assert shared_b.example.tolist() == [0, 2]
+    assert shared_a.to_dicts() + shared_b.to_dicts() == a.to_dicts() + b.to_dicts()
+
+
+@pytest.mark.parametrize("source", ["json", "store", "index"])
+def test_get_predictions(data_dir, source):
+    path_to_preds = hapi.get_predictions()
+    if source == "store":
+        hapi.compile_store()
+    elif source == "index":
+        hapi.build_index()
+
+    path_to_tables = hapi.get_predictions(format="table")
+    assert path_to_tables.keys() == path_to_preds.keys()
+    for key, table in path_to_tables.items():
+        _assert_records_equal(table.to_dicts(), path_to_preds[key])
+
+    example_ids = ["imdb_3", "coco_1", "imdb_8"]
+    path_to_tables = hapi.get_predictions(format="table", example_id=example_ids)
+    for key, table in path_to_tables.items():
+        expected = [p for p in path_to_preds[key] if p["example_id"] in example_ids]
+        _assert_records_equal(table.to_dicts(), expected)
+
+
+def test_get_predictions_errors(data_dir):
+    with pytest.raises(ValueError, match="include_dataset"):
+        hapi.get_predictions(format="table", include_dataset=True)
+    with pytest.raises(ValueError, match="Unknown format"):
+        hapi.get_predictions(format="arrow")
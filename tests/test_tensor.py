@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+import hapi
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_tensor_matches_predictions(data_dir, compiled):
+    if compiled:
+        hapi.compile_store()
+    hapi.build_prediction_tensor("sa", "imdb")
+    t = hapi.get_prediction_tensor("sa", "imdb")
+
+    assert t.apis == ["api0_sa", "api1_sa"]
+    assert t.dates == ["20-01-01", "20-02-01"]
+    assert t.predicted_label.shape == (len(t.example_ids), 2, 2)
+    assert not t.predicted_label.flags.writeable
+
+    rows = {example_id: i for i, example_id in enumerate(t.example_ids)}
+    for label in hapi.get_labels(task="sa")["sa/imdb"]:
+        assert t.classes[t.true_label[rows[label["example_id"]]]] == label["true_label"]
+    for key, preds in hapi.get_predictions(task="sa").items():
+        api, date = key.split("/")[2:]
+        a, d = t.apis.index(api), t.dates.index(date)
+        for pred in preds:
+            i = rows[pred["example_id"]]
+            assert t.classes[t.predicted_label[i, a, d]] == pred["predicted_label"]
+            assert t.confidence[i, a, d] == np.float32(pred["confidence"])
+
+
+def test_tensor_data_dir(data_dir, tmp_path):
+    # the tensor is built from the passed directory, not from `config.data_dir`
+    hapi.config.data_dir = str(tmp_path / "other")
+    hapi.build_prediction_tensor("sa", "imdb", data_dir=data_dir)
+    t = hapi.get_prediction_tensor("sa", "imdb", data_dir=data_dir)
+    assert len(t.example_ids) == 50
+
+
+def test_tensor_errors(data_dir):
+    with pytest.raises(ValueError, match="only supported for the tasks"):
+        hapi.build_prediction_tensor("mic", "coco")
+    with pytest.raises(ValueError, match="No predictions found"):
+        hapi.build_prediction_tensor("sa", "yelp")
+    with pytest.raises(ValueError, match="Export it first"):
+        hapi.get_prediction_tensor("sa", "imdb")